@@ -0,0 +1,36 @@
+import os
+import threading
+
+# ローカルに書き出すデータ (アーカイブなど) の既定の置き場所。git 管理外 (.gitignore の /data/)
+_DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../data")
+
+# .env の読み込みはプロセスで1回だけ (各モジュールはこれを呼ぶ)
+_loaded = False
+_lock = threading.Lock()
+
+
+def load_env():
+    """
+    .env を環境変数に読み込む (2回目以降は何もしない)。
+    既に設定されている環境変数は上書きしない。python-dotenv がなければ環境変数だけを使う。
+    """
+    global _loaded
+    if _loaded:
+        return
+    with _lock:
+        if _loaded:
+            return
+        try:
+            from dotenv import load_dotenv
+            load_dotenv()
+        except ImportError:
+            pass
+        _loaded = True
+
+
+def data_path(*parts: str) -> str:
+    """
+    環境変数 DATA_DIR (無ければリポジトリ直下の data/) の下のパス。
+    .env を読んだ後の値を使うため、import 時ではなく呼んだときに読む。ディレクトリは書き込む側が作る。
+    """
+    return os.path.normpath(os.path.join(os.getenv("DATA_DIR", _DEFAULT_DATA_DIR), *parts))
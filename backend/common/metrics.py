@@ -0,0 +1,327 @@
+import os
+import time
+import inspect
+import threading
+import weakref
+import functools
+import itertools
+import contextvars
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+# ---------------------------------------------------------
+# 設定値 (環境変数で上書き可能)
+# ---------------------------------------------------------
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# パイプライン全体がこの時間 (ミリ秒) を超えたイベントは、段ごとの内訳をアーカイブに残す (0 なら残さない)
+SLOW_EVENT_TRACE_MS = float(os.getenv("SLOW_EVENT_TRACE_MS", "0"))
+
+# ヒストグラムのバケット (秒)。Slack の 3 秒制限と Gemini の生成時間 (数秒〜数十秒) が見える幅にする
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# /metrics に出す指標 (Histogram / Counter は作ると自動で登録される)
+REGISTRY: list = []
+
+
+class _Owner:
+    """スレッドごとの shard の持ち主 (スレッドが終わると回収され、shard を合計に畳み込む合図になる)"""
+    __slots__ = ("shard", "__weakref__")
+
+
+class _ThreadShards:
+    """
+    スレッドごとの書き込み先 (shard)。書き込みではロックを取らない。
+    ロックを取るのは、スレッドが初めて書くときに shard を登録するときと、スレッドが終わって
+    shard を合計 (retired) に畳み込むときだけ (リクエストごとにスレッドを作るサーバーでも shard が増え続けない)。
+    """
+
+    def __init__(self, merge: Callable[[dict, dict], None]):
+        self._merge = merge  # merge(合計, shard): shard の値を合計に足す
+        self._local = threading.local()
+        self._shards: Dict[int, dict] = {}
+        self._retired: dict = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def get(self) -> dict:
+        owner = getattr(self._local, "owner", None)
+        if owner is None:
+            owner = _Owner()
+            owner.shard = {}
+            key = next(self._ids)
+            with self._lock:
+                self._shards[key] = owner.shard
+            weakref.finalize(owner, self._retire, key).atexit = False
+            self._local.owner = owner
+        return owner.shard
+
+    def _retire(self, key: int):
+        with self._lock:
+            shard = self._shards.pop(key, None)
+            if shard:
+                self._merge(self._retired, shard)
+
+    def collect(self) -> dict:
+        """合計 + 生きているスレッドの shard (書き込み中の値が1件ずれることはある)"""
+        merged = {}
+        with self._lock:
+            self._merge(merged, self._retired)
+            shards = list(self._shards.values())
+        for shard in shards:
+            self._merge(merged, shard)
+        return merged
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._shards)
+
+
+def _merge_lists(into: dict, shard: dict):
+    for labels, counts in list(shard.items()):
+        total = into.setdefault(labels, [0] * len(counts))
+        for i, value in enumerate(counts):
+            total[i] += value
+
+
+def _merge_numbers(into: dict, shard: dict):
+    for labels, value in list(shard.items()):
+        into[labels] = into.get(labels, 0) + value
+
+
+class Histogram:
+    """
+    固定バケットのヒストグラム (ラベルつき)
+    スレッドごとに自分専用のカウンタ (shard) に書くので、observe ではロックを取らない。
+    collect は全 shard と、終わったスレッドの分の合計を足し合わせる。
+    """
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...], buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._shards = _ThreadShards(_merge_lists)
+        REGISTRY.append(self)
+
+    def observe(self, value: float, *labels: str):
+        shard = self._shards.get()
+        counts = shard.get(labels)
+        if counts is None:
+            # [バケットごとの件数..., +Inf の件数, 合計]
+            counts = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def collect(self) -> Dict[tuple, list]:
+        return self._shards.collect()
+
+
+class Counter:
+    """ラベルつきのカウンタ (Histogram と同じく、スレッドごとの shard に書く)"""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._shards = _ThreadShards(_merge_numbers)
+        REGISTRY.append(self)
+
+    def inc(self, *labels: str, amount: int = 1):
+        shard = self._shards.get()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def collect(self) -> Dict[tuple, int]:
+        return self._shards.collect()
+
+
+# 段ごとの所要時間 (stage: intent / db.save_log / db.history / generate / db.save_feedback / archive / notify / pipeline)
+STAGE_SECONDS = Histogram(
+    "slacker_stage_duration_seconds", "Time spent in each pipeline stage.", ("stage", "outcome"),
+)
+# 処理したイベントの結果 (answered / skipped / degraded / failed)
+EVENTS_TOTAL = Counter("slacker_events_total", "Pipeline runs by outcome.", ("outcome",))
+
+
+class EventTrace:
+    """1イベント分の段ごとの記録 (遅いイベントのトレースに使う)"""
+
+    def __init__(self, event_id: str):
+        self.event_id = event_id
+        self.started = time.perf_counter()
+        self.outcome = None
+        self.spans: List[dict] = []
+
+
+# 実行中のイベント (asyncio.gather / to_thread にも引き継がれる)
+_current_trace: contextvars.ContextVar[Optional[EventTrace]] = contextvars.ContextVar("current_trace", default=None)
+
+
+@contextmanager
+def span(stage: str, event_id: Optional[str] = None):
+    """
+    段の所要時間を測る。例外が出たら outcome=error として記録し、そのまま投げ直す。
+    実行中のイベント (traced) があれば、その内訳にも event_id つきで残す。
+    """
+    if not METRICS_ENABLED:
+        yield
+        return
+    trace = _current_trace.get()
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage, outcome)
+        if trace is not None:
+            trace.spans.append({
+                "stage": stage,
+                "event_id": event_id or trace.event_id,
+                "offset_ms": round((started - trace.started) * 1e3, 2),
+                "duration_ms": round(elapsed * 1e3, 2),
+                "outcome": outcome,
+            })
+
+
+def set_outcome(outcome: str):
+    """実行中のイベントの結果を決める (返信しなかった・縮退した など。既定は answered)"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.outcome = outcome
+
+
+def _finish(trace: EventTrace, failed: bool):
+    elapsed = time.perf_counter() - trace.started
+    outcome = "failed" if failed else (trace.outcome or "answered")
+    STAGE_SECONDS.observe(elapsed, "pipeline", "error" if failed else "ok")
+    EVENTS_TOTAL.inc(outcome)
+    if SLOW_EVENT_TRACE_MS and elapsed * 1e3 >= SLOW_EVENT_TRACE_MS:
+        _write_slow_trace(trace, elapsed, outcome)
+
+
+def _write_slow_trace(trace: EventTrace, elapsed: float, outcome: str):
+    """
+    遅かったイベントの内訳を F-05 のアーカイブに積む。
+    archived_at を持たないので、学習データ・列指向エクスポートには混ざらない。
+    """
+    from backend.f05_archive.writer import get_archive_writer
+    get_archive_writer().write({
+        "type": "slow_event_trace",
+        "event_id": trace.event_id,
+        "outcome": outcome,
+        "duration_ms": round(elapsed * 1e3, 2),
+        "spans": trace.spans,
+        "traced_at": datetime.now().isoformat(),
+    })
+
+
+def traced(fn):
+    """
+    パイプライン関数 (第1引数が SlackMessage) を1イベントとして計測するデコレーター。
+    同期関数・コルーチン関数のどちらにも使える。
+    """
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(message, *args, **kwargs):
+            if not METRICS_ENABLED:
+                return await fn(message, *args, **kwargs)
+            trace = EventTrace(message.event_id)
+            token = _current_trace.set(trace)
+            try:
+                result = await fn(message, *args, **kwargs)
+            except BaseException:
+                _finish(trace, failed=True)
+                raise
+            finally:
+                _current_trace.reset(token)
+            _finish(trace, failed=False)
+            return result
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(message, *args, **kwargs):
+        if not METRICS_ENABLED:
+            return fn(message, *args, **kwargs)
+        trace = EventTrace(message.event_id)
+        token = _current_trace.set(trace)
+        try:
+            result = fn(message, *args, **kwargs)
+        except BaseException:
+            _finish(trace, failed=True)
+            raise
+        finally:
+            _current_trace.reset(token)
+        _finish(trace, failed=False)
+        return result
+    return wrapper
+
+
+# ---------------------------------------------------------
+# Prometheus テキスト形式
+# ---------------------------------------------------------
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_le(bound: float) -> str:
+    return repr(float(bound))
+
+
+def _render_histogram(histogram: Histogram, lines: list):
+    lines.append(f"# HELP {histogram.name} {histogram.help_text}")
+    lines.append(f"# TYPE {histogram.name} histogram")
+    for labels, counts in sorted(histogram.collect().items()):
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, counts):
+            cumulative += count
+            le = 'le="%s"' % _format_le(bound)
+            lines.append(f"{histogram.name}_bucket{_labels(histogram.labelnames, labels, le)} {cumulative}")
+        cumulative += counts[len(histogram.buckets)]
+        le = 'le="+Inf"'
+        lines.append(f"{histogram.name}_bucket{_labels(histogram.labelnames, labels, le)} {cumulative}")
+        lines.append(f"{histogram.name}_sum{_labels(histogram.labelnames, labels)} {counts[-1]}")
+        lines.append(f"{histogram.name}_count{_labels(histogram.labelnames, labels)} {cumulative}")
+
+
+def _render_counter(counter: Counter, lines: list):
+    lines.append(f"# HELP {counter.name} {counter.help_text}")
+    lines.append(f"# TYPE {counter.name} counter")
+    for labels, value in sorted(counter.collect().items()):
+        lines.append(f"{counter.name}{_labels(counter.labelnames, labels)} {value}")
+
+
+def render_prometheus() -> str:
+    """/metrics 用に、登録済みのヒストグラムとカウンタを Prometheus のテキスト形式にする"""
+    lines = []
+    for metric in list(REGISTRY):
+        if isinstance(metric, Histogram):
+            _render_histogram(metric, lines)
+        else:
+            _render_counter(metric, lines)
+    return "\n".join(lines) + "\n"
+
+
+def render_gauges(prefix: str, values: dict, help_text: str = "") -> str:
+    """/stats の数値 (キューの長さなど) を、そのまま gauge として並べる (数値でない値は飛ばす)"""
+    lines = []
+    for key, value in values.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        name = f"{prefix}_{key}"
+        if help_text:
+            lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n" if lines else ""
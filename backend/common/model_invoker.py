@@ -0,0 +1,308 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait, TimeoutError as FutureTimeoutError
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+from backend.common.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# ---------------------------------------------------------
+# 設定値 (環境変数で上書き可能)
+# ---------------------------------------------------------
+# モデル呼び出しを実行するスレッド数 (締め切りを過ぎた呼び出しは、ここで終わるまで走り続ける)
+MODEL_CALL_WORKERS = int(os.getenv("MODEL_CALL_WORKERS", "16"))
+# true なら、最初の呼び出しが直近の p95 を過ぎても返らないとき、同じ呼び出しをもう1本出して早い方を使う
+MODEL_HEDGE_ENABLED = os.getenv("MODEL_HEDGE_ENABLED", "false").lower() == "true"
+MODEL_HEDGE_PERCENTILE = float(os.getenv("MODEL_HEDGE_PERCENTILE", "0.95"))
+# p95 を信用するのに必要な成功回数 (これより少ないうちはヘッジしない)
+MODEL_HEDGE_MIN_SAMPLES = int(os.getenv("MODEL_HEDGE_MIN_SAMPLES", "20"))
+# サーキットブレーカー: 直近 WINDOW 回のうち ERROR_RATE 以上が失敗したら COOLDOWN 秒間は呼ばずにフォールバックする
+MODEL_BREAKER_WINDOW = int(os.getenv("MODEL_BREAKER_WINDOW", "20"))
+MODEL_BREAKER_MIN_CALLS = int(os.getenv("MODEL_BREAKER_MIN_CALLS", "10"))
+MODEL_BREAKER_ERROR_RATE = float(os.getenv("MODEL_BREAKER_ERROR_RATE", "0.5"))
+MODEL_BREAKER_COOLDOWN_SECONDS = float(os.getenv("MODEL_BREAKER_COOLDOWN_SECONDS", "30"))
+
+# モデルごとの呼び出し時間 (outcome: ok / error / timeout / short_circuit)
+MODEL_SECONDS = Histogram(
+    "slacker_model_call_duration_seconds", "Time spent waiting for each model call.", ("model", "outcome"),
+)
+
+# ブレーカーの状態
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class ModelTimeoutError(TimeoutError):
+    """締め切りまでにモデルが応答しなかった"""
+
+
+class CircuitOpenError(RuntimeError):
+    """ブレーカーが開いているので呼ばなかった (呼び出し元はフォールバックする)"""
+
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(MODEL_CALL_WORKERS, thread_name_prefix="model-call")
+    return _pool
+
+
+class ModelInvoker:
+    """
+    [F-02/F-04] モデル (Gemini) 呼び出しの共通層
+    - deadline: 1回の呼び出しをこの秒数で打ち切る (ModelTimeoutError)。
+      同期 SDK の呼び出しは止められないので、専用スレッドで実行して呼び出し元だけを先に返す。
+    - hedge: 直近の成功の p95 を過ぎても返らなければ、同じ呼び出しをもう1本出して早い方を使う。
+      冪等な呼び出し (生成・判定) にだけ使う。
+    - サーキットブレーカー: 失敗率が高いときは呼ばずに CircuitOpenError を投げ、
+      呼び出し元のフォールバック (キーワード判定・定型の返信) に回す。
+      cooldown 後は1回だけ試し (half open)、成功すれば元に戻す。
+    """
+
+    def __init__(self, name: str, deadline: float, hedge: bool = MODEL_HEDGE_ENABLED,
+                 window: int = MODEL_BREAKER_WINDOW, min_calls: int = MODEL_BREAKER_MIN_CALLS,
+                 error_rate: float = MODEL_BREAKER_ERROR_RATE, cooldown: float = MODEL_BREAKER_COOLDOWN_SECONDS):
+        self.name = name
+        self.deadline = deadline
+        self.hedge = hedge
+        self.min_calls = max(1, min_calls)
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=max(1, window))  # 直近の成否 (True なら成功)
+        self._latencies = deque(maxlen=200)           # 直近の成功の所要時間 (秒)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._counters = {"calls": 0, "ok": 0, "errors": 0, "timeouts": 0, "short_circuited": 0,
+                          "hedged": 0, "hedge_wins": 0, "opened": 0}
+
+    # ---------------------------------------------------------
+    # サーキットブレーカー
+    # ---------------------------------------------------------
+    def _allow(self) -> bool:
+        with self._lock:
+            self._counters["calls"] += 1
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                self._state = HALF_OPEN
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self._counters["short_circuited"] += 1
+        MODEL_SECONDS.observe(0.0, self.name, "short_circuit")
+        return False
+
+    def _record(self, ok: bool, elapsed: float, outcome: str, trial: bool = True):
+        """trial=False は _allow を通っていない呼び出し (ストリームの続き) なので、half open の試行としては扱わない"""
+        MODEL_SECONDS.observe(elapsed, self.name, outcome)
+        with self._lock:
+            self._counters["ok" if ok else ("timeouts" if outcome == "timeout" else "errors")] += 1
+            if ok:
+                self._latencies.append(elapsed)
+            if self._state == HALF_OPEN:
+                if not trial:
+                    return
+                self._trial_in_flight = False
+                if ok:
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                    logger.info(f"✅ Model '{self.name}' recovered. Circuit closed.")
+                else:
+                    self._open()
+                return
+            self._outcomes.append(ok)
+            failures = self._outcomes.count(False)
+            if (self._state == CLOSED and len(self._outcomes) >= self.min_calls
+                    and failures / len(self._outcomes) >= self.error_rate):
+                self._open()
+
+    def _open(self):
+        # _lock を持った状態で呼ぶ
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._counters["opened"] += 1
+        logger.warning(f"⚠️ Model '{self.name}' is failing. Circuit open for {self.cooldown:g}s.")
+
+    # ---------------------------------------------------------
+    # ヘッジ
+    # ---------------------------------------------------------
+    def hedge_delay(self) -> Optional[float]:
+        """もう1本出すまでの待ち時間 (直近の成功の p95)。サンプルが足りなければ None"""
+        with self._lock:
+            if len(self._latencies) < MODEL_HEDGE_MIN_SAMPLES:
+                return None
+            samples = sorted(self._latencies)
+        return samples[min(len(samples) - 1, int(len(samples) * MODEL_HEDGE_PERCENTILE))]
+
+    def _plan(self, hedge: Optional[bool]):
+        started = time.monotonic()
+        delay = self.hedge_delay() if (self.hedge if hedge is None else hedge) else None
+        hedge_at = started + delay if delay is not None and delay < self.deadline else None
+        return started, started + self.deadline, hedge_at
+
+    # ---------------------------------------------------------
+    # 呼び出し
+    # ---------------------------------------------------------
+    def call(self, fn: Callable[[], T], hedge: Optional[bool] = None) -> T:
+        """
+        fn() を締め切り・ヘッジ・ブレーカーつきで呼ぶ (同期版)
+        Raises: CircuitOpenError / ModelTimeoutError / fn が投げた例外
+        """
+        if not self._allow():
+            raise CircuitOpenError(f"circuit open for model '{self.name}'")
+        pool = _get_pool()
+        started, deadline, hedge_at = self._plan(hedge)
+        # 結果は finally で必ず1回記録する (途中で割り込まれても half open の試行が残らないように)
+        outcome = "error"
+        try:
+            first = pool.submit(fn)
+            pending = {first}
+            error = None
+            while pending:
+                now = time.monotonic()
+                wake = deadline if hedge_at is None else min(deadline, hedge_at)
+                done, pending = wait(pending, timeout=max(0.0, wake - now), return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        error = e
+                        continue
+                    self._finish_hedge(pending, future is not first)
+                    outcome = "ok"
+                    return result
+                if not pending:
+                    break
+                now = time.monotonic()
+                if now >= deadline:
+                    for future in pending:
+                        future.cancel()  # まだ始まっていなければ取り消す (始まっていれば終わるまで走る)
+                    outcome = "timeout"
+                    raise ModelTimeoutError(f"model '{self.name}' did not respond within {self.deadline:.1f}s")
+                if hedge_at is not None and now >= hedge_at:
+                    hedge_at = None
+                    with self._lock:
+                        self._counters["hedged"] += 1
+                    pending.add(pool.submit(fn))
+            raise error
+        finally:
+            self._record(outcome == "ok", time.monotonic() - started, outcome)
+
+    async def call_async(self, make_call: Callable[[], Awaitable[T]], hedge: Optional[bool] = None) -> T:
+        """
+        call の非同期版 (make_call はコルーチンを返す関数。打ち切った呼び出しはキャンセルする)
+        呼び出し元にキャンセルされた場合 (asyncio.wait_for など) も失敗として記録する。
+        """
+        if not self._allow():
+            raise CircuitOpenError(f"circuit open for model '{self.name}'")
+        started, deadline, hedge_at = self._plan(hedge)
+        outcome = "error"
+        pending = set()
+        try:
+            first = asyncio.ensure_future(make_call())
+            pending = {first}
+            error = None
+            while pending:
+                now = time.monotonic()
+                wake = deadline if hedge_at is None else min(deadline, hedge_at)
+                done, pending = await asyncio.wait(pending, timeout=max(0.0, wake - now),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    self._finish_hedge(pending, task is not first)
+                    outcome = "ok"
+                    return task.result()
+                if not pending:
+                    break
+                now = time.monotonic()
+                if now >= deadline:
+                    outcome = "timeout"
+                    raise ModelTimeoutError(f"model '{self.name}' did not respond within {self.deadline:.1f}s")
+                if hedge_at is not None and now >= hedge_at:
+                    hedge_at = None
+                    with self._lock:
+                        self._counters["hedged"] += 1
+                    pending.add(asyncio.ensure_future(make_call()))
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+            self._record(outcome == "ok", time.monotonic() - started, outcome)
+
+    def call_until(self, fn: Callable[[], T], deadline_at: float) -> T:
+        """
+        fn() を deadline_at (time.monotonic() の時刻) までに返させる。
+        ストリームの2つ目以降の断片の読み出し用: ブレーカー・ヘッジは通さず、打ち切ったときだけ失敗として数える。
+        """
+        started = time.monotonic()
+        future = _get_pool().submit(fn)
+        try:
+            return future.result(timeout=max(0.0, deadline_at - started))
+        except FutureTimeoutError:
+            future.cancel()
+            self._record(False, time.monotonic() - started, "timeout", trial=False)
+            raise ModelTimeoutError(f"model '{self.name}' stalled past its {self.deadline:.1f}s deadline")
+
+    def _finish_hedge(self, pending: set, hedge_won: bool):
+        for future in pending:
+            future.cancel()
+        if hedge_won:
+            with self._lock:
+                self._counters["hedge_wins"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            samples = sorted(self._latencies)
+            state = self._state
+        percentile = lambda q: samples[min(len(samples) - 1, int(len(samples) * q))] * 1000 if samples else 0.0
+        return {
+            "state": state,
+            "deadline_seconds": self.deadline,
+            "hedge": self.hedge,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            **counters,
+        }
+
+
+# モデルごとの呼び出し層 (プロセスで1つずつ)
+_invokers: Dict[str, ModelInvoker] = {}
+_invokers_lock = threading.Lock()
+
+
+def get_invoker(name: str, deadline: float, **kwargs) -> ModelInvoker:
+    """name ごとの ModelInvoker を返す (初回の引数で作る)"""
+    invoker = _invokers.get(name)
+    if invoker is None:
+        with _invokers_lock:
+            invoker = _invokers.get(name)
+            if invoker is None:
+                invoker = _invokers[name] = ModelInvoker(name, deadline, **kwargs)
+    return invoker
+
+
+def get_model_invoker_stats() -> Optional[dict]:
+    """/stats 用 (まだ使われていなければ None)"""
+    if not _invokers:
+        return None
+    return {name: invoker.stats() for name, invoker in list(_invokers.items())}
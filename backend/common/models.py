@@ -1,7 +1,46 @@
-from dataclasses import dataclass, asdict
-from typing import Optional
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional, Union
 
-@dataclass
+# JSON の高速なエンコーダーは任意 (orjson → msgspec → 標準の json の順に使う)
+try:
+    import orjson
+
+    def _dumps(data: dict) -> bytes:
+        return orjson.dumps(data)
+
+    _loads = orjson.loads
+    JSON_BACKEND = "orjson"
+except ImportError:
+    try:
+        import msgspec
+
+        _dumps = msgspec.json.encode
+        _loads = msgspec.json.decode
+        JSON_BACKEND = "msgspec"
+    except ImportError:
+        def _dumps(data: dict) -> bytes:
+            return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+        _loads = json.loads
+        JSON_BACKEND = "json"
+
+# レコードの形式のバージョン (JSON / DynamoDB の項目に schema_version として残す)
+#   1: 初版 (schema_version なし)
+#   2: SlackMessage.text (text_content の別名) / FeedbackResponse.timestamp を追加
+#   3: SlackMessage.intent_source (意図タグをどこで判定したか) を追加
+SCHEMA_VERSION = 3
+
+
+def _require(cls_name: str, data: dict, names: tuple):
+    """必須の項目が揃っているか確認する (足りなければ ValueError)"""
+    missing = [name for name in names if data.get(name) is None]
+    if missing:
+        raise ValueError(f"{cls_name}: missing required field(s): {', '.join(missing)}")
+
+
+@dataclass(slots=True)
 class SlackMessage:
     event_id: str
     user_id: str
@@ -11,28 +50,144 @@ class SlackMessage:
     source: str = "slack"
     intent_tag: Optional[str] = None
     status: str = "pending"
+    # intent_tag を付けたもの: "gemini" | "local" (ローカルモデル) | "keyword" | "cache" (判定キャッシュ)
+    intent_source: Optional[str] = None
+
+    @property
+    def text(self) -> str:
+        """text_content の別名 (DynamoDB の項目・学習データでは "text" と呼んでいる)"""
+        return self.text_content
+
+    @text.setter
+    def text(self, value: str):
+        self.text_content = value
 
     @classmethod
     def from_dict(cls, data: dict):
-        """辞書形式(JSON)からクラスを生成する"""
-        return cls(**data)
+        """
+        辞書形式(JSON)からクラスを生成する
+        本文は "text_content" / "text" のどちらでもよい。知らない項目 (新しい版で増えたもの) は無視する。
+        """
+        text = data.get("text_content")
+        if text is None:
+            text = data.get("text")
+        _require(cls.__name__, {**data, "text_content": text}, ("event_id", "user_id", "text_content", "channel_id", "ts"))
+        return cls(
+            event_id=data["event_id"],
+            user_id=data["user_id"],
+            text_content=text,
+            channel_id=data["channel_id"],
+            ts=data["ts"],
+            source=data.get("source") or "slack",
+            intent_tag=data.get("intent_tag"),
+            status=data.get("status") or "pending",
+            intent_source=data.get("intent_source"),
+        )
 
     def to_dict(self):
-        """クラスを辞書形式(JSON用)に変換する"""
-        return asdict(self)
+        """クラスを辞書形式(JSON用)に変換する (asdict のような再帰的なコピーはしない)"""
+        return {
+            "schema_version": SCHEMA_VERSION,
+            "event_id": self.event_id,
+            "user_id": self.user_id,
+            "text_content": self.text_content,
+            "channel_id": self.channel_id,
+            "ts": self.ts,
+            "source": self.source,
+            "intent_tag": self.intent_tag,
+            "status": self.status,
+            "intent_source": self.intent_source,
+        }
+
+    @classmethod
+    def from_json(cls, data: Union[bytes, str]):
+        return cls.from_dict(_loads(data))
 
+    def to_json(self) -> bytes:
+        """キュー・アーカイブ用の JSON (UTF-8 のバイト列)"""
+        return _dumps(self.to_dict())
 
-@dataclass
+    @classmethod
+    def from_item(cls, item: dict):
+        """
+        DynamoDB の項目から生成する (save_log が書いた形)
+        v1 の項目には event_id が無いので、F-01 と同じ規則 (evt_<ts>) で補う。
+        """
+        return cls.from_dict({**item, "event_id": item.get("event_id") or f"evt_{item.get('ts')}"})
+
+    def to_item(self) -> dict:
+        """DynamoDB の項目 (save_log で put する形。本文は "text" に入れる)"""
+        return {
+            "ts": self.ts,
+            "user_id": self.user_id,
+            "channel_id": self.channel_id,
+            "text": self.text_content,
+            "status": self.status,
+            "intent_tag": self.intent_tag,
+            "intent_source": self.intent_source,
+            "event_id": self.event_id,
+            "schema_version": SCHEMA_VERSION,
+        }
+
+
+def _now() -> str:
+    return datetime.now().isoformat()
+
+
+@dataclass(slots=True)
 class FeedbackResponse:
     event_id: str
     target_user_id: str
     ts: str  # 返信先のスレッドIDとして使用
     feedback_summary: str
     status: str = "complete"
+    timestamp: Optional[str] = field(default_factory=_now)  # 回答を作った時刻 (ISO 8601)
 
     @classmethod
     def from_dict(cls, data: dict):
-        return cls(**data)
+        """知らない項目は無視する。v1 のレコードには timestamp が無いので None になる"""
+        _require(cls.__name__, data, ("event_id", "target_user_id", "ts"))
+        return cls(
+            event_id=data["event_id"],
+            target_user_id=data["target_user_id"],
+            ts=data["ts"],
+            feedback_summary=data.get("feedback_summary") or "",
+            status=data.get("status") or "complete",
+            timestamp=data.get("timestamp"),
+        )
 
     def to_dict(self):
-        return asdict(self)
\ No newline at end of file
+        return {
+            "schema_version": SCHEMA_VERSION,
+            "event_id": self.event_id,
+            "target_user_id": self.target_user_id,
+            "ts": self.ts,
+            "feedback_summary": self.feedback_summary,
+            "status": self.status,
+            "timestamp": self.timestamp,
+        }
+
+    @classmethod
+    def from_json(cls, data: Union[bytes, str]):
+        return cls.from_dict(_loads(data))
+
+    def to_json(self) -> bytes:
+        return _dumps(self.to_dict())
+
+    @classmethod
+    def from_item(cls, item: dict):
+        """DynamoDB の項目 (save_feedback が書いた形) から生成する"""
+        return cls.from_dict({
+            **item,
+            "event_id": item.get("event_id") or f"evt_{item.get('ts')}",
+            "target_user_id": item.get("target_user_id") or item.get("user_id"),
+            "timestamp": item.get("response_timestamp"),
+        })
+
+    def to_item(self) -> dict:
+        """save_feedback で書き込む項目 (レコードのうちフィードバックの部分)"""
+        return {
+            "feedback_summary": self.feedback_summary,
+            "status": self.status,
+            "response_timestamp": self.timestamp,
+        }
@@ -0,0 +1,199 @@
+import os
+import re
+import sys
+import json
+import asyncio
+
+# プロジェクトルートへのパス設定
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../../")
+
+# 環境変数の読み込み
+from backend.common.config import load_env
+load_env()
+
+# Contract準拠 (server.py と同じく、受信時に重い import はしない)
+from backend.f01_listener.signature import SignatureVerifier
+from backend.f01_listener.executor import ACCEPTED, REJECTED
+from backend.f01_listener import dispatch
+
+# ---------------------------------------------------------
+# 設定値 (環境変数で上書き可能)
+# ---------------------------------------------------------
+# これより大きいリクエストは読まずに 413 を返す (Slack のイベントは数KB)
+ASGI_MAX_BODY_BYTES = int(os.getenv("ASGI_MAX_BODY_BYTES", str(1024 * 1024)))
+
+SLACK_SIGNING_SECRET = os.getenv("SLACK_SIGNING_SECRET")
+TARGET_CHANNEL_ID = dispatch.TARGET_CHANNEL_ID
+
+if not SLACK_SIGNING_SECRET:
+    print("❌ Error: SLACK_SIGNING_SECRET が見つかりません。")
+    sys.exit(1)
+
+if not TARGET_CHANNEL_ID:
+    print("❌ Error: TARGET_CHANNEL_ID が見つかりません。.envに設定してください。")
+
+verifier = SignatureVerifier(SLACK_SIGNING_SECRET)
+executor = dispatch.executor
+
+# 生のバイト列のまま判定するための目印
+# 文字列の中の " は \" にエスケープされるので、本文に同じ文字列が書かれていてもキーとしては一致しない
+_EVENT_KEY = re.compile(rb'"event"\s*:\s*\{')
+_TARGET_CHANNEL = b'"' + TARGET_CHANNEL_ID.encode("utf-8") + b'"' if TARGET_CHANNEL_ID else None
+
+_JSON_HEADERS = [(b"content-type", b"application/json")]
+
+
+def _header(scope: dict, name: bytes):
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+async def _read_body(receive, limit: int):
+    """リクエスト本文を1回だけ読む (limit を超えたら None)"""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > limit:
+            return None
+        chunks.append(chunk)
+        if not message.get("more_body", False):
+            return b"".join(chunks)
+
+
+def _parse(body: bytes):
+    """JSON を読む (壊れていれば None。Flask の request.json と同じく 400 を返す)"""
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+async def _respond(send, status: int, payload: dict, headers=_JSON_HEADERS):
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": json.dumps(payload).encode("utf-8")})
+
+
+async def handle_slack_event(scope, receive, send):
+    """
+    [F-01] Slack Event Listener (ASGI 版)
+    server.py の /slack/events と同じ判定を、次の順で安いものから行う:
+      1. 本文を1回だけ読み、そのバイト列で署名を検証する
+      2. 対象チャンネルの ID が本文に無ければ、JSON を読まずに ignored_other_channel
+      3. 残ったものだけ JSON を読み、Bot・テキストなし・重複を判定 (dispatch.screen_event)
+      4. 重複チェックとパイプラインへの受け渡しはブロックしない (I/O を伴う場合はスレッドで行う)
+    """
+    body = await _read_body(receive, ASGI_MAX_BODY_BYTES)
+    if body is None:
+        return await _respond(send, 413, {"status": "request_too_large"})
+
+    # 1. 署名検証 (Security First)
+    if not verifier.is_valid(body, _header(scope, b"x-slack-request-timestamp"), _header(scope, b"x-slack-signature")):
+        return await _respond(send, 403, {"status": "invalid_request"})
+
+    # 2. URL検証 (Slack API仕様)
+    if b"url_verification" in body:
+        data = _parse(body)
+        if data is None:
+            return await _respond(send, 400, {"status": "invalid_json"})
+        if data.get("type") == "url_verification":
+            return await _respond(send, 200, {"challenge": data["challenge"]})
+
+    # 再送対策 (ヘッダーチェック)
+    # reject ポリシーでは 503 を返して Slack に再送させるので、再送は受け付ける
+    if _header(scope, b"x-slack-retry-num") and executor.overflow_policy != "reject":
+        return await _respond(send, 200, {"status": "ignored_retry"})
+
+    if not _EVENT_KEY.search(body):
+        return await _respond(send, 200, {"status": "ok"})
+
+    # A. チャンネルチェック (JSON を読まずに判定)
+    # 対象チャンネルの ID が文字列として1度も現れなければ、event.channel が対象チャンネルであることはない
+    if _TARGET_CHANNEL is not None and _TARGET_CHANNEL not in body:
+        return await _respond(send, 200, {"status": "ignored_other_channel"})
+
+    # 3. イベント処理本体
+    # bot_id などは添付ファイル・スレッドの親メッセージの中にも現れるので、ここからは JSON を読んで判定する
+    data = _parse(body)
+    if data is None:
+        return await _respond(send, 400, {"status": "invalid_json"})
+    event = data.get("event") or {}
+    ignored = dispatch.screen_event(event)
+    if ignored:
+        return await _respond(send, 200, {"status": ignored})
+
+    # D. 重複チェック → 4. Contract A: SlackMessage生成 → 5. パイプライン起動 (server.py と同じ dispatch.submit_event)
+    # DynamoDB の条件付き書き込み・永続キューへの書き込みで待つ場合は、スレッドで行う
+    if dispatch.DISPATCH_MAY_BLOCK:
+        result = await asyncio.to_thread(dispatch.submit_event, event, data.get("event_id"))
+    else:
+        result = dispatch.submit_event(event, data.get("event_id"))
+    if result == dispatch.DUPLICATE:
+        return await _respond(send, 200, {"status": "ignored_duplicate"})
+    if result == REJECTED:
+        return await _respond(send, 503, {"status": "rejected_overloaded"})
+    if result != ACCEPTED:
+        return await _respond(send, 200, {"status": result})
+    return await _respond(send, 200, {"status": "ok"})
+
+
+async def handle_metrics(scope, receive, send):
+    """server.py の /metrics と同じ内容"""
+    from backend.common.metrics import render_prometheus, render_gauges
+
+    body = render_prometheus() + render_gauges("slacker_executor", executor.stats())
+    await send({"type": "http.response.start", "status": 200,
+                "headers": [(b"content-type", b"text/plain; version=0.0.4; charset=utf-8")]})
+    await send({"type": "http.response.body", "body": body.encode("utf-8")})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            # キューに残っている分を処理してから止める (待つ間もループは止めない)
+            await asyncio.to_thread(executor.shutdown)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+ROUTES = {
+    ("POST", "/slack/events"): handle_slack_event,
+    ("GET", "/metrics"): handle_metrics,
+}
+
+
+async def app(scope, receive, send):
+    """
+    ASGI アプリケーション (フレームワークなし)
+      uvicorn backend.f01_listener.asgi:app --port 3000
+    Flask 版 (server.py) と実行器・重複排除・判定ロジックを共有する。
+    """
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+    handler = ROUTES.get((scope["method"], scope["path"]))
+    if handler is None:
+        return await _respond(send, 404, {"status": "not_found"})
+    await handler(scope, receive, send)
+
+
+if __name__ == "__main__":
+    try:
+        import uvicorn
+    except ImportError:
+        print("❌ uvicorn が必要です: pip install uvicorn")
+        sys.exit(1)
+    print(f"🚀 Slacker Listener (ASGI) running on port 3000")
+    print(f"👀 Watching Channel ID: {TARGET_CHANNEL_ID}")
+    uvicorn.run(app, port=3000)
@@ -0,0 +1,197 @@
+import os
+import asyncio
+import threading
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Optional
+
+from backend.f01_listener.executor import (
+    PIPELINE_QUEUE_SIZE, PIPELINE_OVERFLOW_POLICY, PIPELINE_DRAIN_TIMEOUT, OVERFLOW_POLICIES,
+    ACCEPTED, SHED, DEGRADED, REJECTED,
+)
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------
+# 設定値 (環境変数で上書き可能)
+# ---------------------------------------------------------
+# 同時に処理するイベント数 (スレッド数ではない)
+ASYNC_PIPELINE_MAX_IN_FLIGHT = int(os.getenv("ASYNC_PIPELINE_MAX_IN_FLIGHT", "64"))
+# DB など同期APIを to_thread で呼ぶためのスレッド数
+ASYNC_PIPELINE_IO_THREADS = int(os.getenv("ASYNC_PIPELINE_IO_THREADS", "8"))
+
+
+class AsyncPipelineRunner:
+    """
+    [F-01] asyncio 版のパイプライン実行器 (PipelineExecutor と同じインターフェース)
+    専用スレッドでイベントループを1つ回し、イベントごとにコルーチンを投入する。
+    同時実行数は max_in_flight のセマフォで、待ち行列は queue_size で制限し、
+    溢れたときは PipelineExecutor と同じ overflow_policy で捌く。
+    """
+
+    def __init__(
+        self,
+        handler: Callable[..., Awaitable],
+        max_in_flight: int = ASYNC_PIPELINE_MAX_IN_FLIGHT,
+        queue_size: int = PIPELINE_QUEUE_SIZE,
+        overflow_policy: str = PIPELINE_OVERFLOW_POLICY,
+        degrade_handler: Optional[Callable] = None,
+        io_threads: int = ASYNC_PIPELINE_IO_THREADS,
+    ):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy} (choose from {OVERFLOW_POLICIES})")
+        if overflow_policy == "degrade" and degrade_handler is None:
+            raise ValueError("overflow_policy='degrade' requires degrade_handler")
+
+        self.handler = handler
+        self.max_in_flight = max(1, max_in_flight)
+        self.queue_size = max(1, queue_size)
+        self.overflow_policy = overflow_policy
+        self.degrade_handler = degrade_handler
+        self.io_threads = max(1, io_threads)
+
+        self._loop = None
+        self._thread = None
+        self._semaphore = None
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._closed = False
+        self._pending = 0   # 受け付けて、まだ終わっていない件数
+        self._running = 0   # そのうち実行中の件数
+
+        # 統計情報
+        self._counters = {ACCEPTED: 0, SHED: 0, DEGRADED: 0, REJECTED: 0, "completed": 0, "failed": 0}
+
+    # ---------------------------------------------------------
+    # イベントループ管理
+    # ---------------------------------------------------------
+    def _ensure_started(self):
+        # ループは最初の submit で起動する
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._run_loop, args=(ready,), name="pipeline-loop", daemon=True)
+            self._thread.start()
+            ready.wait()
+            logger.info(f"AsyncPipelineRunner started: max_in_flight={self.max_in_flight}, "
+                        f"queue_size={self.queue_size}, policy={self.overflow_policy}")
+
+    def _run_loop(self, ready: threading.Event):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._loop.set_default_executor(ThreadPoolExecutor(self.io_threads, thread_name_prefix="pipeline-io"))
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        ready.set()
+        self._loop.run_forever()
+        self._loop.run_until_complete(self._loop.shutdown_default_executor())
+        self._loop.close()
+
+    async def _run(self, item):
+        async with self._semaphore:
+            with self._lock:
+                self._running += 1
+            try:
+                await self.handler(item)
+                self._count("completed")
+            except Exception as e:
+                self._count("failed")
+                logger.error(f"❌ Async pipeline failed: {e}", exc_info=True)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._pending -= 1
+                    if self._pending == 0:
+                        self._idle.notify_all()
+
+    def _count(self, key: str):
+        with self._lock:
+            self._counters[key] += 1
+
+    # ---------------------------------------------------------
+    # 公開API
+    # ---------------------------------------------------------
+    def submit(self, item) -> str:
+        """
+        コルーチンをループに投入する。ブロックはしない。
+        Returns: "accepted" | "shed" | "degraded" | "rejected"
+        """
+        if self._closed:
+            self._count(REJECTED)
+            return REJECTED
+
+        self._ensure_started()
+
+        with self._lock:
+            accepted = self._pending < self.max_in_flight + self.queue_size
+            if accepted:
+                self._pending += 1
+                self._counters[ACCEPTED] += 1
+        if accepted:
+            asyncio.run_coroutine_threadsafe(self._run(item), self._loop)
+            return ACCEPTED
+
+        # --- 🚦 溢れたときの扱い (Backpressure) ---
+        if self.overflow_policy == "degrade":
+            self._count(DEGRADED)
+            logger.warning(f"⚠️ Async pipeline full ({self.max_in_flight}+{self.queue_size}). Degrading to keyword-only reply.")
+            try:
+                self.degrade_handler(item)
+            except Exception as e:
+                logger.error(f"❌ Degrade handler failed: {e}")
+            return DEGRADED
+
+        if self.overflow_policy == "reject":
+            self._count(REJECTED)
+            logger.warning(f"⚠️ Async pipeline full ({self.max_in_flight}+{self.queue_size}). Rejecting event.")
+            return REJECTED
+
+        self._count(SHED)
+        logger.warning(f"⚠️ Async pipeline full ({self.max_in_flight}+{self.queue_size}). Shedding event.")
+        return SHED
+
+    def queue_depth(self) -> int:
+        """受け付けたが、同時実行数の上限で待っている件数"""
+        with self._lock:
+            return self._pending - self._running
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            pending, running = self._pending, self._running
+        return {
+            "mode": "async",
+            "max_in_flight": self.max_in_flight,
+            "queue_size": self.queue_size,
+            "queue_depth": pending - running,
+            "in_flight": running,
+            "overflow_policy": self.overflow_policy,
+            **counters,
+        }
+
+    def shutdown(self, drain: bool = True, timeout: Optional[float] = PIPELINE_DRAIN_TIMEOUT):
+        """
+        新規受付を止め、ループを停止する。
+        drain=True なら受け付け済みの分が終わるまで (timeout まで) 待つ。
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if self._thread is None:
+                return
+            if drain:
+                deadline = None if timeout is None else time.monotonic() + timeout
+                while self._pending:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        logger.warning(f"⚠️ {self._pending} async pipeline events still running after drain timeout.")
+                        break
+                    self._idle.wait(remaining)
+
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        logger.info("AsyncPipelineRunner stopped.")
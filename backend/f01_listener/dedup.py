@@ -0,0 +1,107 @@
+import os
+import threading
+import logging
+from typing import Optional
+
+from backend.common.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------
+# 設定値 (環境変数で上書き可能)
+# ---------------------------------------------------------
+EVENT_DEDUP_MAX_ENTRIES = int(os.getenv("EVENT_DEDUP_MAX_ENTRIES", "10000"))
+# Slack の再送は最大で数分後まで来るので、余裕を持って1時間覚えておく
+EVENT_DEDUP_TTL_SECONDS = int(os.getenv("EVENT_DEDUP_TTL_SECONDS", "3600"))
+# "memory" (プロセス内のみ) | "dynamodb" (条件付き書き込みでインスタンス間でも排除)
+EVENT_DEDUP_BACKEND = os.getenv("EVENT_DEDUP_BACKEND", "memory")
+
+
+class EventDeduplicator:
+    """
+    [F-01] 重複イベントの排除
+    (channel_id, ts, event_id) をキーに「既に見たイベント」を LRU+TTL で覚えておき、
+    LLM や DB に触る前に重複配信を捨てる。
+    db_handler を渡すと、ローカルで未見のイベントは DynamoDB の条件付き書き込みでも確認する。
+    """
+
+    def __init__(
+        self,
+        max_entries: int = EVENT_DEDUP_MAX_ENTRIES,
+        ttl_seconds: int = EVENT_DEDUP_TTL_SECONDS,
+        db_handler=None,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.db_handler = db_handler
+        self._seen = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "remote_hits": 0, "remote_errors": 0,
+                          "released": 0}
+
+    @staticmethod
+    def make_key(channel_id: Optional[str], ts: Optional[str], event_id: Optional[str]) -> str:
+        return f"{channel_id or '-'}:{ts or '-'}:{event_id or '-'}"
+
+    def _count(self, key: str):
+        with self._lock:
+            self._counters[key] += 1
+
+    def is_duplicate(self, channel_id: Optional[str], ts: Optional[str], event_id: Optional[str]) -> bool:
+        """
+        初めて見たイベントなら False を返して記録する。既に見ていれば True。
+        """
+        key = self.make_key(channel_id, ts, event_id)
+
+        if not self._seen.add(key):
+            self._count("hits")
+            return True
+
+        if self.db_handler is not None:
+            try:
+                if not self.db_handler.claim_event(key, ttl_seconds=self.ttl_seconds):
+                    self._count("remote_hits")
+                    self._count("hits")
+                    return True
+            except Exception as e:
+                # DB が不調でも取りこぼしよりは二重処理を選ぶ
+                self._count("remote_errors")
+                logger.error(f"❌ Dedup claim failed, processing anyway: {e}")
+
+        self._count("misses")
+        return False
+
+    def release(self, channel_id: Optional[str], ts: Optional[str], event_id: Optional[str]):
+        """
+        is_duplicate で記録したイベントを取り消す。
+        パイプラインが受け付けなかった (503 を返して Slack に再送させる) イベントの再送を、重複として捨てないようにする。
+        """
+        key = self.make_key(channel_id, ts, event_id)
+        self._seen.pop(key)
+        if self.db_handler is not None:
+            try:
+                self.db_handler.release_event(key)
+            except Exception as e:
+                # 消せなくても TTL が切れれば再送は通る
+                self._count("remote_errors")
+                logger.error(f"❌ Dedup release failed: {e}")
+        self._count("released")
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            "backend": "dynamodb" if self.db_handler is not None else "memory",
+            "entries": len(self._seen),
+            "hit_rate": counters["hits"] / lookups if lookups else 0.0,
+            **counters,
+        }
+
+
+def create_deduplicator() -> EventDeduplicator:
+    """環境変数 EVENT_DEDUP_BACKEND に応じた重複排除器を作る"""
+    db_handler = None
+    if EVENT_DEDUP_BACKEND == "dynamodb":
+        from backend.f03_db.database import get_db_handler
+        db_handler = get_db_handler()
+    return EventDeduplicator(db_handler=db_handler)
@@ -0,0 +1,151 @@
+import os
+import atexit
+import threading
+from typing import Optional
+
+# Contract準拠
+# Flask (server.py) と ASGI (asgi.py) の受信口で共有する部分:
+#   パイプライン実行器・重複排除・対象外イベントの判定 (Gatekeeper)・SlackMessage の生成
+# ここも軽いモジュールだけを import する (パイプラインはワーカー側で読み込む)
+from backend.common.models import SlackMessage
+from backend.f01_listener.executor import PipelineExecutor, PIPELINE_MODE, PIPELINE_OVERFLOW_POLICY, REJECTED
+from backend.f01_listener.dedup import create_deduplicator, EVENT_DEDUP_BACKEND
+
+TARGET_CHANNEL_ID = os.getenv("TARGET_CHANNEL_ID")
+
+
+# ---------------------------------------------------------
+# パイプラインの遅延読み込み
+# ---------------------------------------------------------
+# backend.main の import は実行器のワーカー側で行う (受信スレッドは Slack への応答を優先する)
+def _import_main():
+    import backend.main
+    return backend.main
+
+
+def _run_pipeline(message: SlackMessage):
+    from backend.main import run_pipeline
+    run_pipeline(message)
+
+
+_main = None
+
+
+async def _run_pipeline_async(message: SlackMessage):
+    global _main
+    if _main is None:
+        # 初回の import でイベントループを止めないよう、別スレッドで読み込む
+        import asyncio
+        _main = await asyncio.to_thread(_import_main)
+    await _main.run_pipeline_async(message)
+
+
+def _run_degraded_pipeline(message: SlackMessage):
+    from backend.main import run_degraded_pipeline
+    run_degraded_pipeline(message)
+
+
+# パイプライン実行器 (固定数ワーカー + 有界キュー / asyncio のイベントループ / 永続キュー)
+# どれもスレッド・接続は最初の submit で用意するので、ここで作っても軽い
+if PIPELINE_MODE == "queue":
+    # 受信側はキューに書き込むだけ。処理は別プロセスのワーカー (backend/worker.py) が行う
+    from backend.f01_listener.work_queue import WorkQueueSubmitter
+    executor = WorkQueueSubmitter()
+elif PIPELINE_MODE == "async":
+    # asyncio の import も thread モードでは不要なので、ここで読み込む
+    from backend.f01_listener.async_runner import AsyncPipelineRunner
+    executor = AsyncPipelineRunner(
+        handler=_run_pipeline_async,
+        overflow_policy=PIPELINE_OVERFLOW_POLICY,
+        degrade_handler=_run_degraded_pipeline,
+    )
+else:
+    executor = PipelineExecutor(
+        handler=_run_pipeline,
+        overflow_policy=PIPELINE_OVERFLOW_POLICY,
+        degrade_handler=_run_degraded_pipeline,
+    )
+# プロセス終了時はキューに残っている分を処理してから止める
+atexit.register(executor.shutdown)
+
+# submit / 重複チェックが I/O で待つことがあるか (ASGI ではその場合だけスレッドに逃がす)
+# queue モードはキューへの書き込み、degrade は縮退パイプラインをその場で実行、DynamoDB の重複排除は条件付き書き込み
+SUBMIT_MAY_BLOCK = PIPELINE_MODE == "queue" or PIPELINE_OVERFLOW_POLICY == "degrade"
+DEDUP_MAY_BLOCK = EVENT_DEDUP_BACKEND != "memory"
+# submit_event 全体 (重複チェック + 受け渡し) が待つことがあるか
+DISPATCH_MAY_BLOCK = SUBMIT_MAY_BLOCK or DEDUP_MAY_BLOCK
+
+# 重複として捨てたときの submit_event の戻り値
+DUPLICATE = "ignored_duplicate"
+
+# 重複イベント排除 (再送ヘッダーのない重複配信対策)
+# DynamoDB バックエンドは boto3 を使うので、最初の重複チェックで作る
+_deduplicator = None
+_deduplicator_lock = threading.Lock()
+
+
+def get_deduplicator():
+    global _deduplicator
+    if _deduplicator is None:
+        with _deduplicator_lock:
+            if _deduplicator is None:
+                _deduplicator = create_deduplicator()
+    return _deduplicator
+
+
+# ---------------------------------------------------------
+# 🛡️ フィルタリング・ロジック (Gatekeeper)
+# ---------------------------------------------------------
+def screen_event(event: dict) -> Optional[str]:
+    """
+    パイプラインに渡さないイベントなら、その理由 (ignored_*) を返す。渡すなら None。
+    重複チェックは状態を持つので、ここではなく呼び出し側で最後に行う。
+    """
+    # A. チャンネルチェック: 指定されたチャンネル以外は無視
+    # (これをしないと、Botがいる全チャンネルで反応してしまいます)
+    if event.get("channel") != TARGET_CHANNEL_ID:
+        return "ignored_other_channel"
+
+    # B. Botチェック: 自分自身や他のBotのメッセージは無視
+    # subtypeが 'bot_message' の場合や、bot_idが存在する場合はスキップ
+    if "bot_id" in event or event.get("subtype") == "bot_message":
+        return "ignored_bot_message"
+
+    # C. コンテンツチェック: テキストがないイベント（画像のアップロードのみ等）は一旦無視
+    if not event.get("text", ""):
+        return "ignored_no_text"
+    return None
+
+
+def to_message(event: dict) -> SlackMessage:
+    """Contract A: イベントから SlackMessage を作る"""
+    ts = event.get("ts")
+    return SlackMessage(
+        event_id=f"evt_{ts}",
+        user_id=event.get("user"),
+        channel_id=event.get("channel"),
+        text_content=event.get("text", ""),
+        ts=ts,  # Slack から受け取った ts をセット
+        intent_tag="pending",  # F-02で判定されるため保留
+        status="received"
+    )
+
+
+def submit_event(event: dict, event_id: Optional[str]) -> str:
+    """
+    D. 重複チェック → 4. SlackMessage 生成 → 5. パイプライン起動
+    重複チェックはイベントを「処理済み」として記録するので、パイプラインが受け付けなかった (REJECTED) ときは
+    記録を取り消す。取り消さないと、503 を受けた Slack の再送が重複として捨てられてしまう。
+    Returns: DUPLICATE か executor.submit の結果 (ACCEPTED / REJECTED / dropped など)
+    """
+    deduplicator = get_deduplicator()
+    key = (event.get("channel"), event.get("ts"), event_id)
+    if deduplicator.is_duplicate(*key):
+        return DUPLICATE
+
+    print(f"👂 [F-01] Valid Message detected: {event['text'][:30]}...")
+
+    result = executor.submit(to_message(event))
+    if result == REJECTED:
+        deduplicator.release(*key)
+    return result
@@ -0,0 +1,214 @@
+import os
+import queue
+import threading
+import logging
+import time
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------
+# 設定値 (環境変数で上書き可能)
+# ---------------------------------------------------------
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "4"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "100"))
+# "shed" (黙って捨てる) | "degrade" (キーワード判定のみで簡易返信) | "reject" (503を返してSlackに再送させる)
+PIPELINE_OVERFLOW_POLICY = os.getenv("PIPELINE_OVERFLOW_POLICY", "shed")
+PIPELINE_DRAIN_TIMEOUT = float(os.getenv("PIPELINE_DRAIN_TIMEOUT", "20"))
+# "thread" (PipelineExecutor) | "async" (AsyncPipelineRunner) | "queue" (作業キューに積み、backend/worker.py が処理する)
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "thread")
+
+OVERFLOW_POLICIES = ("shed", "degrade", "reject")
+
+# submit() の戻り値
+ACCEPTED = "accepted"
+SHED = "shed"
+DEGRADED = "degraded"
+REJECTED = "rejected"
+
+# ワーカー停止用の番兵
+_STOP = object()
+
+
+class PipelineExecutor:
+    """
+    [F-01] パイプライン実行器 (固定数ワーカー + 有界キュー)
+    イベントごとにスレッドを立てる代わりに、決まった数のワーカーが
+    キューからメッセージを取り出して handler を実行する。
+    キューが満杯のときは overflow_policy に従って捌く。
+    """
+
+    def __init__(
+        self,
+        handler: Callable,
+        workers: int = PIPELINE_WORKERS,
+        queue_size: int = PIPELINE_QUEUE_SIZE,
+        overflow_policy: str = PIPELINE_OVERFLOW_POLICY,
+        degrade_handler: Optional[Callable] = None,
+    ):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy} (choose from {OVERFLOW_POLICIES})")
+        if overflow_policy == "degrade" and degrade_handler is None:
+            raise ValueError("overflow_policy='degrade' requires degrade_handler")
+
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self.overflow_policy = overflow_policy
+        self.degrade_handler = degrade_handler
+
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+        # 統計情報
+        self._counters = {ACCEPTED: 0, SHED: 0, DEGRADED: 0, REJECTED: 0, "completed": 0, "failed": 0}
+        self._busy = 0
+
+    # ---------------------------------------------------------
+    # ワーカー管理
+    # ---------------------------------------------------------
+    def _ensure_started(self):
+        # ワーカーは最初の submit で起動する (起動直後のリクエストを軽くするため)
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker_loop, name=f"pipeline-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+            logger.info(f"PipelineExecutor started: workers={self.workers}, queue_size={self.queue_size}, "
+                        f"policy={self.overflow_policy}")
+
+    def _worker_loop(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                with self._lock:
+                    self._busy += 1
+                try:
+                    self.handler(item)
+                    self._count("completed")
+                except Exception as e:
+                    self._count("failed")
+                    logger.error(f"❌ Pipeline failed in worker: {e}", exc_info=True)
+                finally:
+                    with self._lock:
+                        self._busy -= 1
+            finally:
+                self._queue.task_done()
+
+    def _count(self, key: str):
+        with self._lock:
+            self._counters[key] += 1
+
+    # ---------------------------------------------------------
+    # 公開API
+    # ---------------------------------------------------------
+    def submit(self, item) -> str:
+        """
+        メッセージをキューに積む。ブロックはしない。
+        Returns: "accepted" | "shed" | "degraded" | "rejected"
+        """
+        if self._closed:
+            self._count(REJECTED)
+            return REJECTED
+
+        self._ensure_started()
+
+        try:
+            self._queue.put_nowait(item)
+            self._count(ACCEPTED)
+            return ACCEPTED
+        except queue.Full:
+            pass
+
+        # --- 🚦 溢れたときの扱い (Backpressure) ---
+        if self.overflow_policy == "degrade":
+            self._count(DEGRADED)
+            logger.warning(f"⚠️ Pipeline queue full ({self.queue_size}). Degrading to keyword-only reply.")
+            try:
+                self.degrade_handler(item)
+            except Exception as e:
+                logger.error(f"❌ Degrade handler failed: {e}")
+            return DEGRADED
+
+        if self.overflow_policy == "reject":
+            self._count(REJECTED)
+            logger.warning(f"⚠️ Pipeline queue full ({self.queue_size}). Rejecting event.")
+            return REJECTED
+
+        self._count(SHED)
+        logger.warning(f"⚠️ Pipeline queue full ({self.queue_size}). Shedding event.")
+        return SHED
+
+    def queue_depth(self) -> int:
+        """キューに積まれて実行待ちの件数"""
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            busy = self._busy
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "queue_depth": self.queue_depth(),
+            "busy_workers": busy,
+            "overflow_policy": self.overflow_policy,
+            **counters,
+        }
+
+    def shutdown(self, drain: bool = True, timeout: Optional[float] = PIPELINE_DRAIN_TIMEOUT):
+        """
+        新規受付を止め、ワーカーを停止する。
+        drain=True ならキューに残っている分を処理し終えてから止める。
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            threads = list(self._threads)
+
+        if not threads:
+            return
+
+        if not drain:
+            # 未処理分は破棄
+            dropped = 0
+            while True:
+                try:
+                    self._queue.get_nowait()
+                    self._queue.task_done()
+                    dropped += 1
+                except queue.Empty:
+                    break
+            if dropped:
+                logger.warning(f"⚠️ Dropped {dropped} queued events on shutdown.")
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        def _remaining():
+            return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+        try:
+            for _ in threads:
+                # 番兵は FIFO なので、キューに残っている分の後ろに並ぶ
+                self._queue.put(_STOP, timeout=_remaining())
+        except queue.Full:
+            logger.warning("⚠️ Pipeline drain timed out while stopping workers.")
+            return
+
+        for t in threads:
+            t.join(timeout=_remaining())
+
+        alive = sum(1 for t in threads if t.is_alive())
+        if alive:
+            logger.warning(f"⚠️ {alive} pipeline workers still running after drain timeout.")
+        else:
+            logger.info("PipelineExecutor drained and stopped.")
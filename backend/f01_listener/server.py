@@ -1,21 +1,23 @@
 import os
 import sys
-import threading
 import logging
-from dotenv import load_dotenv
 
 # プロジェクトルートへのパス設定
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../../")
 
 # 環境変数の読み込み
-load_dotenv()
+from backend.common.config import load_env
+load_env()
 
 from flask import Flask, request, jsonify
-from slack_sdk.signature import SignatureVerifier
 
 # Contract準拠
-from backend.common.models import SlackMessage
-from backend.main import run_pipeline
+# ここでは軽いモジュールだけを import する。パイプライン (Gemini / boto3 / slack_sdk) は
+# 最初の有効なメッセージをワーカーが処理するときに読み込むので、URL検証や対象外イベントへの
+# 応答はコールドスタートでも重い import を待たない (tools/check_import_time.py で確認)。
+from backend.f01_listener.signature import SignatureVerifier
+from backend.f01_listener.executor import ACCEPTED, REJECTED
+from backend.f01_listener import dispatch
 
 app = Flask(__name__)
 
@@ -23,7 +25,7 @@ app = Flask(__name__)
 # 設定値のチェック
 # ---------------------------------------------------------
 SLACK_SIGNING_SECRET = os.getenv("SLACK_SIGNING_SECRET")
-TARGET_CHANNEL_ID = os.getenv("TARGET_CHANNEL_ID")
+TARGET_CHANNEL_ID = dispatch.TARGET_CHANNEL_ID
 
 if not SLACK_SIGNING_SECRET:
     print("❌ Error: SLACK_SIGNING_SECRET が見つかりません。")
@@ -36,6 +38,11 @@ if not TARGET_CHANNEL_ID:
 # 署名検証器
 verifier = SignatureVerifier(SLACK_SIGNING_SECRET)
 
+# パイプライン実行器・重複排除は ASGI 版 (asgi.py) と共有する
+executor = dispatch.executor
+get_deduplicator = dispatch.get_deduplicator
+
+
 @app.route("/slack/events", methods=["POST"])
 def slack_events():
     """
@@ -53,7 +60,8 @@ def slack_events():
         return jsonify({"challenge": data["challenge"]})
     
     # 再送対策 (ヘッダーチェック)
-    if request.headers.get("X-Slack-Retry-Num"):
+    # reject ポリシーでは 503 を返して Slack に再送させるので、再送は受け付ける
+    if request.headers.get("X-Slack-Retry-Num") and executor.overflow_policy != "reject":
         # ログがうるさくなるのでprintはコメントアウトまたはdebugレベル推奨
         # print("♻️ Ignoring Retry request from Slack")
         return jsonify({"status": "ignored_retry"})
@@ -61,50 +69,73 @@ def slack_events():
     # 3. イベント処理本体
     if "event" in data:
         event = data["event"]
-        channel_id = event.get("channel")
-        user_id = event.get("user")
-        text = event.get("text", "")
-        ts = event.get("ts")
-        subtype = event.get("subtype")
 
         # --- 🛡️ フィルタリング・ロジック (Gatekeeper) ---
-
-        # A. チャンネルチェック: 指定されたチャンネル以外は無視
-        # (これをしないと、Botがいる全チャンネルで反応してしまいます)
-        if channel_id != TARGET_CHANNEL_ID:
-            return jsonify({"status": "ignored_other_channel"})
-
-        # B. Botチェック: 自分自身や他のBotのメッセージは無視
-        # subtypeが 'bot_message' の場合や、bot_idが存在する場合はスキップ
-        if "bot_id" in event or subtype == "bot_message":
-            return jsonify({"status": "ignored_bot_message"})
-        
-        # C. コンテンツチェック: テキストがないイベント（画像のアップロードのみ等）は一旦無視
-        if not text:
-            return jsonify({"status": "ignored_no_text"})
+        # A. チャンネル B. Bot C. テキストなし (判定は dispatch.screen_event)
+        ignored = dispatch.screen_event(event)
+        if ignored:
+            return jsonify({"status": ignored})
 
         # ------------------------------------------------
 
-        print(f"👂 [F-01] Valid Message detected: {text[:30]}...")
-
-        # 4. Contract A: SlackMessage生成
-        input_message = SlackMessage(
-            event_id=f"evt_{ts}",
-            user_id=user_id,
-            channel_id=channel_id,
-            text_content=text,
-            ts=ts,  # Slack から受け取った ts をセット
-            intent_tag="pending",  # F-02で判定されるため保留
-            status="received"
-        )
-
-        # 5. パイプライン起動 (非同期)
-        # サーバーは即座にSlackへ200 OKを返す必要があるため、処理は別スレッドへ
-        process_thread = threading.Thread(target=run_pipeline, args=(input_message,))
-        process_thread.start()
+        # D. 重複チェック (同じイベントの再配信は LLM / DB に触る前に捨てる)
+        # 4. Contract A: SlackMessage生成 → 5. パイプライン起動 (非同期)
+        # サーバーは即座にSlackへ200 OKを返す必要があるため、処理はワーカーのキューへ
+        result = dispatch.submit_event(event, data.get("event_id"))
+        if result == dispatch.DUPLICATE:
+            return jsonify({"status": "ignored_duplicate"})
+        if result == REJECTED:
+            return jsonify({"status": "rejected_overloaded"}), 503
+        if result != ACCEPTED:
+            return jsonify({"status": result})
     
     return jsonify({"status": "ok"})
 
+
+@app.route("/stats", methods=["GET"])
+def stats():
+    """パイプラインの稼働状況 (キュー深さ、重複排除・意図判定キャッシュのヒット率等) を返す"""
+    from backend.main import channel_summarizer
+    from backend.common.model_invoker import get_model_invoker_stats
+    from backend.f02_filter.intent_cache import get_intent_cache
+    from backend.f02_filter.filter import get_batcher_stats
+    from backend.f02_filter.local_model import get_local_model_stats
+    from backend.f03_db.history_cache import history_cache
+    from backend.f03_db.database import get_db_pool_stats
+    from backend.f04_gen.similarity import get_similarity_stats
+    from backend.f04_gen.retrieval import get_retrieval_stats
+    from backend.f05_archive.writer import get_archive_stats
+    from backend.f06_notify.notifier import get_delivery_stats
+
+    intent_cache = get_intent_cache()
+    return jsonify({
+        "executor": executor.stats(),
+        "dedup": get_deduplicator().stats(),
+        "intent_cache": intent_cache.stats() if intent_cache else None,
+        "intent_batcher": get_batcher_stats(),
+        "local_intent_model": get_local_model_stats(),
+        "history_cache": history_cache.stats(),
+        "db_pool": get_db_pool_stats(),
+        "similarity": get_similarity_stats(),
+        "channel_summary": channel_summarizer.stats(),
+        "retrieval": get_retrieval_stats(),
+        "archive": get_archive_stats(),
+        "slack_delivery": get_delivery_stats(),
+        "models": get_model_invoker_stats(),
+    })
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """
+    段ごとの・モデル呼び出しごとの所要時間ヒストグラム、結果ごとの件数、実行器の状態を Prometheus のテキスト形式で返す。
+    PIPELINE_MODE=queue のときパイプラインは worker.py のプロセスで動くので、ここには受信側の値だけが出る。
+    """
+    from backend.common.metrics import render_prometheus, render_gauges
+
+    body = render_prometheus() + render_gauges("slacker_executor", executor.stats())
+    return body, 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
 if __name__ == "__main__":
     print(f"🚀 Slacker Listener running on port 3000")
     print(f"👀 Watching Channel ID: {TARGET_CHANNEL_ID}")
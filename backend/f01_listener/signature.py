@@ -0,0 +1,42 @@
+import hmac
+import hashlib
+import time
+from typing import Mapping, Optional, Union
+
+# Slack の推奨どおり、5分より古いリクエストはリプレイとみなして拒否する
+SIGNATURE_MAX_AGE_SECONDS = 60 * 5
+
+
+class SignatureVerifier:
+    """
+    [F-01] Slack リクエストの署名検証 (slack_sdk.signature.SignatureVerifier と同じ判定)
+    slack_sdk を import すると WebClient 一式まで読み込まれてコールドスタートが遅くなるため、
+    受信側では標準ライブラリだけで検証する。
+    """
+
+    def __init__(self, signing_secret: str, max_age_seconds: int = SIGNATURE_MAX_AGE_SECONDS):
+        self.signing_secret = signing_secret.encode("utf-8")
+        self.max_age_seconds = max_age_seconds
+
+    def generate_signature(self, timestamp: str, body: Union[str, bytes]) -> str:
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        base = b"v0:" + str(timestamp).encode("utf-8") + b":" + body
+        return "v0=" + hmac.new(self.signing_secret, base, hashlib.sha256).hexdigest()
+
+    def is_valid(self, body: Union[str, bytes], timestamp: Optional[str], signature: Optional[str]) -> bool:
+        if not timestamp or not signature:
+            return False
+        try:
+            if abs(time.time() - int(timestamp)) > self.max_age_seconds:
+                return False
+        except ValueError:
+            return False
+        return hmac.compare_digest(self.generate_signature(timestamp, body), signature)
+
+    def is_valid_request(self, body: Union[str, bytes], headers: Mapping) -> bool:
+        """ヘッダーの大文字小文字は問わない (Flask の Headers / dict のどちらでも可)"""
+        if headers is None:
+            return False
+        lowered = {k.lower(): v for k, v in headers.items()}
+        return self.is_valid(body, lowered.get("x-slack-request-timestamp"), lowered.get("x-slack-signature"))
@@ -0,0 +1,281 @@
+import os
+import time
+import uuid
+import sqlite3
+import threading
+import logging
+from typing import List, Optional
+
+from backend.common.config import data_path
+from backend.f01_listener.executor import ACCEPTED, REJECTED
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------
+# 設定値 (環境変数で上書き可能)
+# ---------------------------------------------------------
+# "sqlite" (同じホストのワーカープロセスと共有するファイル) | "sqs" (Amazon SQS)
+WORK_QUEUE_BACKEND = os.getenv("WORK_QUEUE_BACKEND", "sqlite")
+WORK_QUEUE_PATH = os.getenv("WORK_QUEUE_PATH", data_path("work_queue.sqlite3"))
+WORK_QUEUE_URL = os.getenv("WORK_QUEUE_URL", "")
+# 受信してからこの秒数のうちに削除されなければ、他のワーカーに再配信する
+WORK_QUEUE_VISIBILITY_TIMEOUT = int(os.getenv("WORK_QUEUE_VISIBILITY_TIMEOUT", "120"))
+# この回数受信しても処理できなかったメッセージはデッドレターに移す (SQS の maxReceiveCount 相当)
+WORK_QUEUE_MAX_RECEIVE_COUNT = int(os.getenv("WORK_QUEUE_MAX_RECEIVE_COUNT", "5"))
+# "NORMAL" ならプロセスが落ちても失われない (OS ごと落ちた場合は直近のコミットを失いうる)。"FULL" は毎回 fsync する
+WORK_QUEUE_SYNCHRONOUS = os.getenv("WORK_QUEUE_SYNCHRONOUS", "NORMAL").upper()
+
+# 空のキューを待つ間のポーリング間隔 (秒)
+_POLL_INTERVAL = 0.2
+
+
+class SQLiteWorkQueue:
+    """
+    [F-01] SQLite (WAL) のローカル作業キュー
+    boto3 の SQS クライアントと同じメソッド・引数・戻り値の形にしてあるので、
+    呼び出し側は WORK_QUEUE_BACKEND を切り替えるだけで SQS と入れ替えられる (QueueUrl は無視する)。
+    受信したメッセージは visibility timeout の間だけ他から見えなくなり、
+    delete_message されないまま期限が来ると再配信される。
+    max_receive_count 回受信されたメッセージは dead_letters テーブルに移す。
+    """
+
+    def __init__(
+        self,
+        path: str = WORK_QUEUE_PATH,
+        visibility_timeout: int = WORK_QUEUE_VISIBILITY_TIMEOUT,
+        max_receive_count: int = WORK_QUEUE_MAX_RECEIVE_COUNT,
+        synchronous: str = WORK_QUEUE_SYNCHRONOUS,
+    ):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_receive_count = max(1, max_receive_count)
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # トランザクションは自分で張る (受信は BEGIN IMMEDIATE で他プロセスと排他にする)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(f"PRAGMA synchronous={'FULL' if synchronous == 'FULL' else 'NORMAL'}")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " message_id TEXT NOT NULL UNIQUE,"
+                " body TEXT NOT NULL,"
+                " sent_at REAL NOT NULL,"
+                " visible_at REAL NOT NULL,"
+                " receive_count INTEGER NOT NULL DEFAULT 0,"
+                " receipt_handle TEXT)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_visible_at ON messages(visible_at)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS dead_letters ("
+                " message_id TEXT PRIMARY KEY,"
+                " body TEXT NOT NULL,"
+                " sent_at REAL NOT NULL,"
+                " receive_count INTEGER NOT NULL,"
+                " dead_at REAL NOT NULL)"
+            )
+
+    # ---------------------------------------------------------
+    # SQS 互換API
+    # ---------------------------------------------------------
+    def send_message(self, MessageBody: str, QueueUrl: Optional[str] = None, DelaySeconds: int = 0) -> dict:
+        message_id = str(uuid.uuid4())
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO messages (message_id, body, sent_at, visible_at) VALUES (?, ?, ?, ?)",
+                (message_id, MessageBody, now, now + DelaySeconds),
+            )
+        return {"MessageId": message_id}
+
+    def receive_message(
+        self,
+        QueueUrl: Optional[str] = None,
+        MaxNumberOfMessages: int = 1,
+        VisibilityTimeout: Optional[int] = None,
+        WaitTimeSeconds: int = 0,
+        **_,
+    ) -> dict:
+        """見えているメッセージを最大 MaxNumberOfMessages 件受け取る (なければ WaitTimeSeconds まで待つ)"""
+        visibility = self.visibility_timeout if VisibilityTimeout is None else VisibilityTimeout
+        deadline = time.monotonic() + WaitTimeSeconds
+        while True:
+            messages = self._receive(max(1, min(10, MaxNumberOfMessages)), visibility)
+            if messages or time.monotonic() >= deadline:
+                return {"Messages": messages} if messages else {}
+            time.sleep(_POLL_INTERVAL)
+
+    def delete_message(self, ReceiptHandle: str, QueueUrl: Optional[str] = None) -> dict:
+        # 受信し直されたメッセージの古い受信ハンドルでは消さない
+        with self._lock:
+            self._conn.execute("DELETE FROM messages WHERE receipt_handle = ?", (ReceiptHandle,))
+        return {}
+
+    def change_message_visibility(self, ReceiptHandle: str, VisibilityTimeout: int,
+                                  QueueUrl: Optional[str] = None) -> dict:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE messages SET visible_at = ? WHERE receipt_handle = ?",
+                (time.time() + VisibilityTimeout, ReceiptHandle),
+            )
+        return {}
+
+    def get_queue_attributes(self, QueueUrl: Optional[str] = None, AttributeNames: Optional[list] = None) -> dict:
+        now = time.time()
+        with self._lock:
+            visible, in_flight = self._conn.execute(
+                "SELECT COALESCE(SUM(visible_at <= ?), 0), COALESCE(SUM(visible_at > ?), 0) FROM messages",
+                (now, now),
+            ).fetchone()
+            dead = self._conn.execute("SELECT COUNT(*) FROM dead_letters").fetchone()[0]
+        return {"Attributes": {
+            "ApproximateNumberOfMessages": str(visible),
+            "ApproximateNumberOfMessagesNotVisible": str(in_flight),
+            "ApproximateNumberOfDeadLetters": str(dead),
+        }}
+
+    # ---------------------------------------------------------
+    # デッドレター
+    # ---------------------------------------------------------
+    def list_dead_letters(self, limit: int = 100) -> List[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT message_id, body, sent_at, receive_count, dead_at FROM dead_letters ORDER BY dead_at LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [{"MessageId": r[0], "Body": r[1], "SentAt": r[2], "ReceiveCount": r[3], "DeadAt": r[4]} for r in rows]
+
+    def redrive_dead_letters(self) -> int:
+        """デッドレターを受信回数 0 に戻してキューに入れ直す (原因を直した後に使う)"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self._conn.execute(
+                    "INSERT INTO messages (message_id, body, sent_at, visible_at)"
+                    " SELECT message_id, body, sent_at, ? FROM dead_letters", (now,)
+                )
+                self._conn.execute("DELETE FROM dead_letters")
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # ---------------------------------------------------------
+    # 内部処理
+    # ---------------------------------------------------------
+    def _receive(self, limit: int, visibility: int) -> List[dict]:
+        now = time.time()
+        with self._lock:
+            # 他のワーカープロセスと同じメッセージを取り合わないよう、書き込みロックを取ってから選ぶ
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT seq, message_id, body, sent_at, receive_count FROM messages"
+                    " WHERE visible_at <= ? ORDER BY seq LIMIT ?", (now, limit),
+                ).fetchall()
+                messages = []
+                for seq, message_id, body, sent_at, receive_count in rows:
+                    if receive_count >= self.max_receive_count:
+                        self._conn.execute(
+                            "INSERT OR REPLACE INTO dead_letters (message_id, body, sent_at, receive_count, dead_at)"
+                            " VALUES (?, ?, ?, ?, ?)", (message_id, body, sent_at, receive_count, now),
+                        )
+                        self._conn.execute("DELETE FROM messages WHERE seq = ?", (seq,))
+                        logger.warning(f"⚠️ Work queue message {message_id} moved to dead letters "
+                                       f"after {receive_count} receives.")
+                        continue
+                    receipt = uuid.uuid4().hex
+                    self._conn.execute(
+                        "UPDATE messages SET visible_at = ?, receive_count = receive_count + 1, receipt_handle = ?"
+                        " WHERE seq = ?", (now + visibility, receipt, seq),
+                    )
+                    messages.append({
+                        "MessageId": message_id,
+                        "ReceiptHandle": receipt,
+                        "Body": body,
+                        "Attributes": {
+                            "ApproximateReceiveCount": str(receive_count + 1),
+                            "SentTimestamp": str(int(sent_at * 1000)),
+                        },
+                    })
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return messages
+
+
+def create_work_queue():
+    """WORK_QUEUE_BACKEND に応じたキュー (SQS の場合は boto3 の SQS クライアント) を作る"""
+    if WORK_QUEUE_BACKEND == "sqs":
+        if not WORK_QUEUE_URL:
+            raise ValueError("WORK_QUEUE_BACKEND=sqs requires WORK_QUEUE_URL")
+        import boto3
+        return boto3.client("sqs", region_name=os.getenv("AWS_DEFAULT_REGION", "ap-northeast-1"))
+    return SQLiteWorkQueue()
+
+
+class WorkQueueSubmitter:
+    """
+    [F-01] キューモード (PIPELINE_MODE=queue) の受け口 (PipelineExecutor と同じインターフェース)
+    受信スレッドでは SlackMessage をキューに書き込むだけで、パイプラインは backend/worker.py が実行する。
+    書き込めなかった場合は "rejected" を返し、503 で Slack に再送させる。
+    """
+
+    # 溢れることはなく、書き込めなければ常に Slack の再送に任せる
+    overflow_policy = "reject"
+
+    def __init__(self, work_queue=None, queue_url: str = WORK_QUEUE_URL):
+        self.queue_url = queue_url
+        self._queue = work_queue
+        self._lock = threading.Lock()
+        self._counters = {ACCEPTED: 0, REJECTED: 0}
+
+    def _get_queue(self):
+        # SQLite ファイル / SQS クライアントは最初の submit で用意する
+        if self._queue is None:
+            with self._lock:
+                if self._queue is None:
+                    self._queue = create_work_queue()
+        return self._queue
+
+    def _count(self, key: str):
+        with self._lock:
+            self._counters[key] += 1
+
+    def submit(self, item) -> str:
+        try:
+            self._get_queue().send_message(QueueUrl=self.queue_url, MessageBody=item.to_json().decode("utf-8"))
+        except Exception as e:
+            logger.error(f"❌ Failed to enqueue event {getattr(item, 'event_id', '?')}: {e}")
+            self._count(REJECTED)
+            return REJECTED
+        self._count(ACCEPTED)
+        return ACCEPTED
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+        attributes = None
+        if self._queue is not None:
+            try:
+                attributes = self._queue.get_queue_attributes(
+                    QueueUrl=self.queue_url,
+                    AttributeNames=["ApproximateNumberOfMessages", "ApproximateNumberOfMessagesNotVisible"],
+                )["Attributes"]
+            except Exception as e:
+                logger.error(f"❌ Failed to read work queue attributes: {e}")
+        return {"mode": "queue", "backend": WORK_QUEUE_BACKEND, "queue": attributes, **counters}
+
+    def shutdown(self, drain: bool = True, timeout: Optional[float] = None):
+        # 受け付けた分は既にキュー (ファイル / SQS) にあるので、待つものはない
+        if isinstance(self._queue, SQLiteWorkQueue):
+            self._queue.close()
@@ -0,0 +1,241 @@
+import os
+import re
+import json
+import queue
+import threading
+import logging
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple, Type
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------
+# 設定値 (環境変数で上書き可能)
+# ---------------------------------------------------------
+# 0 ならバッチ化しない (1件ずつ Gemini に問い合わせる)
+INTENT_BATCH_WINDOW_MS = float(os.getenv("INTENT_BATCH_WINDOW_MS", "0"))
+INTENT_BATCH_MAX_SIZE = int(os.getenv("INTENT_BATCH_MAX_SIZE", "20"))
+INTENT_BATCH_TIMEOUT = float(os.getenv("INTENT_BATCH_TIMEOUT", "30"))
+
+VALID_TAGS = ("question", "chat")
+
+_JSON_ARRAY = re.compile(r"\[.*\]", re.DOTALL)
+
+
+def build_batch_prompt(texts: List[str]) -> str:
+    numbered = "\n".join(f"{i + 1}. {json.dumps(t, ensure_ascii=False)}" for i, t in enumerate(texts))
+    return f"""
+    あなたはSlackボットの「意図判定」システムです。
+    以下の {len(texts)} 件のメッセージそれぞれについて、「回答が必要な質問・相談・エラー報告」か「ただの雑談・挨拶」か分類してください。
+
+    メッセージ一覧:
+    {numbered}
+
+    出力ルール:
+    - 質問、作業依頼、エラー報告なら "question"、挨拶、相槌、独り言なら "chat" とする。
+    - メッセージの順番どおりに並べた JSON 配列だけを出力してください。例: ["question", "chat"]
+    - 配列の要素数は必ず {len(texts)} 個にしてください。余計な説明は一切不要です。
+    """
+
+
+def parse_batch_response(raw: str, expected: int) -> List[str]:
+    """
+    モデル出力から JSON 配列を取り出す。件数や値がおかしければ ValueError。
+    (```json ... ``` で囲まれて返ってくることがあるので、配列部分だけを抜き出す)
+    """
+    m = _JSON_ARRAY.search(raw or "")
+    if not m:
+        raise ValueError(f"No JSON array in response: {raw!r}")
+    tags = json.loads(m.group(0))
+    if not isinstance(tags, list) or len(tags) != expected:
+        raise ValueError(f"Expected {expected} tags, got: {tags!r}")
+
+    result = []
+    for tag in tags:
+        tag = str(tag).strip().lower()
+        if tag not in VALID_TAGS:
+            raise ValueError(f"Unknown tag: {tag!r}")
+        result.append(tag)
+    return result
+
+
+class IntentBatcher:
+    """
+    [F-02] 意図判定のマイクロバッチ化
+    短い時間窓 (window_ms) の間に届いたメッセージをまとめ、1回の Gemini 呼び出しで分類する。
+    バッチの応答が解釈できなかったときは、classify_one で1件ずつ判定し直す (並列に行い、次のバッチを待たせない)。
+    fail_fast に挙げた例外 (ブレーカー作動・締め切り超過など) でバッチが失敗したときは、
+    1件ずつ呼び直しても同じなので、すぐに全件を失敗させる (呼び出し元はフォールバックする)。
+    """
+
+    def __init__(
+        self,
+        model,
+        classify_one: Callable[[str], str],
+        window_ms: float = INTENT_BATCH_WINDOW_MS or 50,
+        max_batch: int = INTENT_BATCH_MAX_SIZE,
+        fail_fast: Tuple[Type[BaseException], ...] = (),
+    ):
+        self.model = model
+        self.classify_one = classify_one
+        self.window = window_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self.fail_fast = tuple(fail_fast)
+        self._fallback_pool: Optional[ThreadPoolExecutor] = None
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._counters = {"messages": 0, "batches": 0, "model_calls": 0, "fallbacks": 0, "failed": 0}
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="intent-batcher", daemon=True)
+                self._thread.start()
+
+    def _count(self, key: str, n: int = 1):
+        with self._lock:
+            self._counters[key] += n
+
+    # ---------------------------------------------------------
+    # 公開API
+    # ---------------------------------------------------------
+    def submit(self, text: str) -> Future:
+        self._ensure_started()
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def classify(self, text: str, timeout: Optional[float] = INTENT_BATCH_TIMEOUT) -> str:
+        return self.submit(text).result(timeout=timeout)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+        batches = counters["batches"]
+        return {
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+            "avg_batch_size": counters["messages"] / batches if batches else 0.0,
+            **counters,
+        }
+
+    # ---------------------------------------------------------
+    # バッチ処理本体
+    # ---------------------------------------------------------
+    def _collect(self) -> list:
+        # 最初の1件が来るまでは待ち続け、そこから時間窓の間だけ追加を受け付ける
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            try:
+                self._run_batch(batch)
+            except Exception as e:
+                # ここまで来るのは想定外だが、呼び出し元を待たせ続けないようにする
+                logger.error(f"❌ Intent batch crashed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _run_batch(self, batch: list):
+        texts = [text for text, _ in batch]
+        self._count("batches")
+        self._count("messages", len(texts))
+
+        if len(texts) > 1:
+            try:
+                self._count("model_calls")
+                response = self.model.generate_content(build_batch_prompt(texts))
+                tags = parse_batch_response(response.text, len(texts))
+                logger.info(f"🤖 Batched AI Judgment: {len(texts)} messages in 1 call")
+                for (_, future), tag in zip(batch, tags):
+                    future.set_result(tag)
+                return
+            except self.fail_fast as e:
+                logger.warning(f"⚠️ Batch classification failed fast ({e!r}).")
+                self._count("failed", len(batch))
+                for _, future in batch:
+                    future.set_exception(e)
+                return
+            except Exception as e:
+                logger.warning(f"⚠️ Batch classification failed ({e}). Falling back to per-message calls.")
+                self._count("fallbacks")
+
+        # 1件だけ、またはバッチ失敗時は1件ずつ判定
+        # バッチ用のスレッドで順に呼ぶと N 回分の待ち時間だけ次のバッチが止まるので、別スレッドで並列に呼ぶ
+        pool = self._get_fallback_pool()
+        for text, future in batch:
+            pool.submit(self._classify_one_into, text, future)
+
+    def _get_fallback_pool(self) -> ThreadPoolExecutor:
+        if self._fallback_pool is None:
+            with self._lock:
+                if self._fallback_pool is None:
+                    self._fallback_pool = ThreadPoolExecutor(self.max_batch, thread_name_prefix="intent-fallback")
+        return self._fallback_pool
+
+    def _classify_one_into(self, text: str, future: Future):
+        try:
+            self._count("model_calls")
+            future.set_result(self.classify_one(text))
+        except Exception as e:
+            self._count("failed")
+            future.set_exception(e)
+
+
+# 🧪 単体テスト用 (ローカルのスタブモデルで動作確認)
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+
+    class _Response:
+        def __init__(self, text):
+            self.text = text
+
+    class StubModel:
+        """プロンプト中の番号付きメッセージを数え、"?" を含むものを question とする"""
+
+        def __init__(self, broken: bool = False):
+            self.calls = 0
+            self.broken = broken
+
+        def generate_content(self, prompt):
+            self.calls += 1
+            time.sleep(0.2)  # API の往復を模擬
+            if self.broken:
+                return _Response("すみません、分類できませんでした")
+            items = re.findall(r"^\s*\d+\. (\".*\")$", prompt, re.MULTILINE)
+            tags = ["question" if "?" in json.loads(item) else "chat" for item in items]
+            return _Response("```json\n" + json.dumps(tags) + "\n```")
+
+    def stub_classify_one(text):
+        return "question" if "?" in text else "chat"
+
+    messages = [f"msg {i}?" if i % 3 == 0 else f"msg {i}" for i in range(30)]
+
+    for broken in (False, True):
+        model = StubModel(broken=broken)
+        batcher = IntentBatcher(model, stub_classify_one, window_ms=50, max_batch=20)
+        with ThreadPoolExecutor(max_workers=30) as pool:
+            results = list(pool.map(batcher.classify, messages))
+
+        expected = [stub_classify_one(m) for m in messages]
+        assert results == expected, results
+        print(f"broken={broken}: {len(messages)} messages -> {model.calls} batch model calls, stats={batcher.stats()}")
+
+    print("✅ IntentBatcher test passed")
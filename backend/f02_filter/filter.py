@@ -1,20 +1,124 @@
 import os
+import time
 import logging
-import google.generativeai as genai
-from dotenv import load_dotenv
+import threading
+from typing import Optional
+from backend.common.config import load_env
 from backend.common.models import SlackMessage
+from backend.common.model_invoker import get_invoker, ModelInvoker, CircuitOpenError, ModelTimeoutError
+from backend.f02_filter.keywords import match_keywords
+from backend.f02_filter.intent_cache import get_intent_cache
+from backend.f02_filter.batcher import IntentBatcher, INTENT_BATCH_WINDOW_MS
+from backend.f02_filter.local_model import classify_locally
 
 # ロガー設定
 logger = logging.getLogger(__name__)
 
 # .env 読み込み
-load_dotenv()
+load_env()
+
+# ---------------------------------------------------------
+# 設定値 (環境変数で上書き可能)
+# ---------------------------------------------------------
+# Gemini での判定1回の締め切り (秒)。過ぎたらキーワード判定にフォールバックする
+INTENT_DEADLINE_SECONDS = float(os.getenv("INTENT_DEADLINE_SECONDS", "5"))
+
+# Gemini モデル / バッチ判定器 (初回利用時に生成して使い回す)
+_model = None
+_batcher: Optional[IntentBatcher] = None
+_model_lock = threading.RLock()
+
+
+def classify_by_keywords(text: str) -> str:
+    """
+    [F-02] キーワードによる簡易判定 ("question" / "chat")
+    APIキーがない場合や、混雑時の縮退運転 (Degrade) で使用する。
+    キーワードは keywords.py で一度だけ構築した一括マッチャーで1パス判定し、
+    カテゴリ別の重み付きスコアで質問かどうかを決める。
+    """
+    result = match_keywords(text)
+    logger.debug(f"🔑 Keyword score={result.score:.1f}, categories={result.categories}, "
+                 f"keywords={list(result.keywords)[:10]}")
+    return "question" if result.is_question else "chat"
+
+
+def _get_model(api_key: str):
+    """Gemini モデルをプロセスで1つだけ用意する"""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                # google.generativeai の import は重いので、Gemini を実際に使うときまで遅らせる
+                import google.generativeai as genai
+                genai.configure(api_key=api_key)
+                _model = genai.GenerativeModel("gemini-1.5-flash")
+    return _model
+
+
+def _invoker(name: str = "intent") -> ModelInvoker:
+    """判定用のモデル呼び出し層 (締め切り・ヘッジ・サーキットブレーカー)"""
+    return get_invoker(name, INTENT_DEADLINE_SECONDS)
+
+
+class _GuardedModel:
+    """バッチ判定の呼び出しも締め切り・ブレーカーつきにする (バッチはプロンプトが長いので別に計測する)"""
+
+    def __init__(self, model):
+        self.model = model
+
+    def generate_content(self, prompt):
+        return _invoker("intent_batch").call(lambda: self.model.generate_content(prompt))
+
+
+def _classify_with_gemini(text: str, api_key: str) -> str:
+    """1件のメッセージを Gemini で判定する ("question" / "chat")"""
+    model = _get_model(api_key)
+
+    prompt = f"""
+    あなたはSlackボットの「意図判定」システムです。
+    以下のメッセージを読み、それが「回答が必要な質問・相談・エラー報告」か「ただの雑談・挨拶」か分類してください。
+    
+    メッセージ: "{text}"
+    
+    出力ルール:
+    - 質問、作業依頼、エラー報告なら "question" とだけ出力してください。
+    - 挨拶、相槌、独り言なら "chat" とだけ出力してください。
+    - 余計な説明は一切不要です。単語一つだけを返してください。
+    """
+
+    response = _invoker().call(lambda: model.generate_content(prompt))
+    intent = response.text.strip().lower()
+    
+    if "question" in intent:
+        return "question"
+    return "chat"
+
+
+def _get_batcher(api_key: str) -> IntentBatcher:
+    global _batcher
+    if _batcher is None:
+        with _model_lock:
+            if _batcher is None:
+                _batcher = IntentBatcher(
+                    _GuardedModel(_get_model(api_key)),
+                    classify_one=lambda t: _classify_with_gemini(t, api_key),
+                    window_ms=INTENT_BATCH_WINDOW_MS,
+                    # ブレーカー作動・締め切り超過は1件ずつ呼び直さず、すぐキーワード判定に回す
+                    fail_fast=(CircuitOpenError, ModelTimeoutError),
+                )
+    return _batcher
+
+
+def get_batcher_stats() -> Optional[dict]:
+    return _batcher.stats() if _batcher is not None else None
+
 
 def analyze_intent(input_message: SlackMessage) -> SlackMessage:
     """
     [F-02] 意図判定 (Intent Classification)
     APIキーがない場合は、開発現場のあらゆる単語を網羅した
     「超・広範囲キーワードリスト」でバックアップ判定を行う。
+    Gemini が締め切りまでに答えない・エラー・ブレーカー作動時も、キーワード判定で続ける。
     """
     logger.info(f"--- [F-02] Analyzing Intent for: {input_message.event_id} ---")
 
@@ -27,116 +131,60 @@ def analyze_intent(input_message: SlackMessage) -> SlackMessage:
     if not api_key:
         logger.warning("⚠️ API Key not found. Fallback to massive keyword matching.")
         
-        # 開発現場で飛び交うあらゆる「質問・トラブル・依頼・技術用語」
-        keywords = [
-            # --------------------------
-            # 🆘 SOS・疑問・依頼・感情
-            # --------------------------
-            "?", "？", "ですか", "ますか", "教えて", "教えろ", "願います", "頼む", "お願いします",
-            "どうすれば", "どうやる", "方法", "仕方", "手順", "やり方", 
-            "分からない", "わからん", "不明", "なにこれ", "何これ", "why", "what", "how",
-            "help", "ヘルプ", "助けて", "詰んだ", "詰まってる", "進まない", "終わらない",
-            "緊急", "至急", "早急", "なる早", "asap", "urgent",
-            "相談", "確認", "共有", "提案", "検討", "レビュー", "review",
-            
-            # --------------------------
-            # 💥 エラー・不具合・異常
-            # --------------------------
-            "error", "エラー", "exception", "例外", "fail", "failed", "failure", "失敗",
-            "bug", "バグ", "不具合", "defect", "incident", "インシデント", "障害",
-            "crash", "クラッシュ", "落ちる", "落ちた", "止まる", "止まった", "フリーズ", "hang",
-            "broken", "break", "壊れた", "動かない", "反応しない",
-            "おかしい", "変", "strange", "weird", "odd", "unexpected", "予期せぬ",
-            "timeout", "timed out", "タイムアウト", "重い", "遅い", "latency",
-            
-            # --------------------------
-            # 🐍 Python / コード関連
-            # --------------------------
-            "import", "install", "pip", "conda", "venv", "virtualenv",
-            "syntax", "indentation", "indent", "インデント", "構文",
-            "type", "型", "int", "str", "list", "dict", "none", "null", "undefined",
-            "function", "def", "class", "method", "argument", "param", "引数", "戻り値", "return",
-            "traceback", "stacktrace", "スタックトレース",
-            "keyerror", "valueerror", "typeerror", "indexerror", "nameerror", "attributeerror",
-            
-            # --------------------------
-            # 🐙 Git / バージョン管理
-            # --------------------------
-            "git", "github", "gitlab", "commit", "push", "pull", "fetch", "clone",
-            "merge", "マージ", "rebase", "リベース", "conflict", "コンフリクト", "競合",
-            "branch", "ブランチ", "checkout", "stash", "reset", "revert", "cherry-pick",
-            "diff", "差分", "pr", "pull request", "プルリク",
-            
-            # --------------------------
-            # ☁️ インフラ / ネットワーク / DB
-            # --------------------------
-            "aws", "s3", "ec2", "lambda", "cloud", "gcp", "azure",
-            "docker", "container", "image", "compose", "build", "ビルド",
-            "deploy", "デプロイ", "release", "リリース", "rollback", "ロールバック",
-            "env", "環境変数", "config", "設定", "conf", "yaml", "json", "xml",
-            "connect", "接続", "connection", "refused", "denied", "network", "wifi",
-            "dns", "ip", "port", "ポート", "ssh", "sudo", "permission", "権限", "access",
-            "db", "database", "sql", "mysql", "postgres", "sqlite", "query", "select", "insert",
-            "table", "column", "record", "data", "migration", "マイグレーション",
-            
-            # --------------------------
-            # 🌐 Web / API / HTTP
-            # --------------------------
-            "http", "https", "url", "uri", "link", "リンク",
-            "404", "500", "403", "401", "200", "status", "code",
-            "api", "endpoint", "エンドポイント", "rest", "graphql",
-            "get", "post", "put", "delete", "patch",
-            "header", "body", "payload", "cookie", "session", "cache", "キャッシュ",
-            "cors", "authentication", "auth", "login", "ログイン", "token", "key"
-        ]
-        
-        # 究極の any() 判定
-        # lower() で小文字化してからチェックするので "Python" も "PYTHON" も "python" も拾います
-        text_lower = text.lower()
-        is_question = any(k in text_lower for k in keywords)
-
-        if is_question:
-            input_message.intent_tag = "question"
-        else:
-            input_message.intent_tag = "chat"
-            
+        input_message.intent_tag = classify_by_keywords(text)
+        input_message.intent_source = "keyword"
         logger.info(f"🔑 Massive Keyword Match Result: {input_message.intent_tag}")
         return input_message
 
     # ---------------------------------------------------------
-    # 2. Geminiを使った高度な判定
+    # 2. キャッシュ確認 (同じ・ほぼ同じ文面は判定済みの結果を使う)
     # ---------------------------------------------------------
-    try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel("gemini-1.5-flash")
+    cache = get_intent_cache()
+    if cache is not None:
+        cached_tag = cache.get(text)
+        if cached_tag is not None:
+            logger.info(f"📦 Intent Cache Hit: '{text[:30]}' => {cached_tag}")
+            input_message.intent_tag = cached_tag
+            input_message.intent_source = "cache"
+            return input_message
 
-        prompt = f"""
-        あなたはSlackボットの「意図判定」システムです。
-        以下のメッセージを読み、それが「回答が必要な質問・相談・エラー報告」か「ただの雑談・挨拶」か分類してください。
-        
-        メッセージ: "{text}"
-        
-        出力ルール:
-        - 質問、作業依頼、エラー報告なら "question" とだけ出力してください。
-        - 挨拶、相槌、独り言なら "chat" とだけ出力してください。
-        - 余計な説明は一切不要です。単語一つだけを返してください。
-        """
-
-        response = model.generate_content(prompt)
-        intent = response.text.strip().lower()
-        
-        if "question" in intent:
-            final_tag = "question"
+    # ---------------------------------------------------------
+    # 3. ローカルモデルでの判定 (自信があるときだけ答え、なければ Gemini へ)
+    # ---------------------------------------------------------
+    local_tag = classify_locally(text)
+    if local_tag is not None:
+        logger.info(f"🧮 Local Model Judgment: '{text[:30]}' => {local_tag}")
+        input_message.intent_tag = local_tag
+        input_message.intent_source = "local"
+        return input_message
+
+    # ---------------------------------------------------------
+    # 4. Geminiを使った高度な判定
+    # ---------------------------------------------------------
+    try:
+        started_at = time.perf_counter()
+        if INTENT_BATCH_WINDOW_MS > 0:
+            # 同時に届いたメッセージとまとめて1回で判定する
+            # (待つのは集める時間 + 判定1回の締め切りまで)
+            final_tag = _get_batcher(api_key).classify(
+                text, timeout=INTENT_BATCH_WINDOW_MS / 1000 + INTENT_DEADLINE_SECONDS
+            )
         else:
-            final_tag = "chat"
+            final_tag = _classify_with_gemini(text, api_key)
 
         logger.info(f"🤖 AI Judgment: '{text}' => {final_tag}")
 
+        if cache is not None:
+            cache.put(text, final_tag, latency_seconds=time.perf_counter() - started_at)
+
         input_message.intent_tag = final_tag
+        input_message.intent_source = "gemini"
         return input_message
 
     except Exception as e:
-        logger.error(f"❌ Intent Analysis Error: {e}")
-        # エラー時は念のため質問として扱う
-        input_message.intent_tag = "question"
+        logger.error(f"❌ Intent Analysis Error: {e!r}")
+        # 締め切り超過・エラー時はキーワード判定で続ける (結果はキャッシュしない)
+        input_message.intent_tag = classify_by_keywords(text)
+        input_message.intent_source = "keyword"
+        logger.info(f"🔑 Fallback Keyword Match Result: {input_message.intent_tag}")
         return input_message
\ No newline at end of file
@@ -0,0 +1,232 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+import logging
+import unicodedata
+from typing import Optional
+
+from backend.common.config import data_path
+from backend.common.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------
+# 設定値 (環境変数で上書き可能)
+# ---------------------------------------------------------
+# "memory" | "sqlite" | "none"
+INTENT_CACHE_BACKEND = os.getenv("INTENT_CACHE_BACKEND", "memory")
+INTENT_CACHE_MAX_ENTRIES = int(os.getenv("INTENT_CACHE_MAX_ENTRIES", "5000"))
+INTENT_CACHE_TTL_SECONDS = int(os.getenv("INTENT_CACHE_TTL_SECONDS", "86400"))
+INTENT_CACHE_SQLITE_PATH = os.getenv("INTENT_CACHE_SQLITE_PATH", data_path("intent_cache.sqlite3"))
+
+# ---------------------------------------------------------
+# テキスト正規化
+# ---------------------------------------------------------
+# <@U123>, <!here>, <#C123|general> などの Slack 記法
+_SLACK_MARKUP = re.compile(r"<[@!#][^>]*>")
+# :thumbsup: などの絵文字ショートコード
+_EMOJI_SHORTCODE = re.compile(r":[a-z0-9_+\-]+:")
+# Unicode 絵文字 (記号・絵文字・装飾用の範囲)
+_EMOJI_CHARS = re.compile(
+    "["
+    "\U0001F000-\U0001FAFF"
+    "\U00002600-\U000027BF"
+    "\U0000FE00-\U0000FE0F"
+    "\U0000200D"
+    "]+"
+)
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    キャッシュキー用の正規化
+    - 全角/半角のゆれを NFKC で畳み込む (ｱ -> ア, Ａ -> a, ！ -> !)
+    - 大文字小文字を無視
+    - メンション・絵文字を除去
+    - 空白を1つにまとめる
+    """
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = _SLACK_MARKUP.sub(" ", text)
+    text = _EMOJI_SHORTCODE.sub(" ", text)
+    text = _EMOJI_CHARS.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def make_cache_key(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+# ---------------------------------------------------------
+# バックエンド
+# ---------------------------------------------------------
+class MemoryIntentCacheBackend:
+    """プロセス内 LRU + TTL"""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = INTENT_CACHE_MAX_ENTRIES, ttl_seconds: int = INTENT_CACHE_TTL_SECONDS):
+        self._cache = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+
+    def get(self, key: str) -> Optional[str]:
+        return self._cache.get(key)
+
+    def set(self, key: str, intent: str):
+        self._cache.set(key, intent)
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+
+class SQLiteIntentCacheBackend:
+    """
+    ローカル SQLite ファイル (同じホスト上の複数プロセスで共有できる)
+    last_used で LRU、expires_at で TTL を管理する。
+    """
+
+    name = "sqlite"
+
+    def __init__(
+        self,
+        path: str = INTENT_CACHE_SQLITE_PATH,
+        max_entries: int = INTENT_CACHE_MAX_ENTRIES,
+        ttl_seconds: int = INTENT_CACHE_TTL_SECONDS,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS intent_cache ("
+                " cache_key TEXT PRIMARY KEY,"
+                " intent TEXT NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_intent_cache_last_used ON intent_cache(last_used)")
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT intent FROM intent_cache WHERE cache_key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE intent_cache SET last_used = ? WHERE cache_key = ?", (now, key))
+            return row[0]
+
+    def set(self, key: str, intent: str):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO intent_cache (cache_key, intent, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, intent, now + self.ttl_seconds, now),
+            )
+            # 期限切れを掃除し、上限を超えた分は古く使われた順に捨てる
+            self._conn.execute("DELETE FROM intent_cache WHERE expires_at <= ?", (now,))
+            self._conn.execute(
+                "DELETE FROM intent_cache WHERE cache_key IN ("
+                " SELECT cache_key FROM intent_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM intent_cache").fetchone()[0]
+
+
+# ---------------------------------------------------------
+# キャッシュ本体
+# ---------------------------------------------------------
+class IntentCache:
+    """
+    [F-02] 意図判定結果のキャッシュ
+    正規化したテキストをキーに判定結果を覚えておき、Gemini への問い合わせを省く。
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._errors = 0
+        self._classifier_calls = 0
+        self._classifier_seconds = 0.0
+
+    def get(self, text: str) -> Optional[str]:
+        try:
+            intent = self.backend.get(make_cache_key(text))
+        except Exception as e:
+            # キャッシュが壊れていても判定は続ける
+            logger.error(f"❌ Intent cache read failed: {e}")
+            intent = None
+            with self._lock:
+                self._errors += 1
+
+        with self._lock:
+            if intent is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+        return intent
+
+    def put(self, text: str, intent: str, latency_seconds: Optional[float] = None):
+        """判定結果を保存する。latency_seconds は分類器の所要時間 (節約量の見積もりに使う)"""
+        if latency_seconds is not None:
+            with self._lock:
+                self._classifier_calls += 1
+                self._classifier_seconds += latency_seconds
+        try:
+            self.backend.set(make_cache_key(text), intent)
+        except Exception as e:
+            logger.error(f"❌ Intent cache write failed: {e}")
+            with self._lock:
+                self._errors += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits, misses, errors = self._hits, self._misses, self._errors
+            calls, seconds = self._classifier_calls, self._classifier_seconds
+        lookups = hits + misses
+        avg_latency = seconds / calls if calls else 0.0
+        return {
+            "backend": self.backend.name,
+            "hits": hits,
+            "misses": misses,
+            "errors": errors,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            # ヒットした分だけ分類器の往復を省けた
+            "saved_classifier_calls": hits,
+            "avg_classifier_latency_ms": avg_latency * 1000,
+            "estimated_saved_latency_ms": hits * avg_latency * 1000,
+        }
+
+
+_intent_cache: Optional[IntentCache] = None
+_intent_cache_lock = threading.Lock()
+
+
+def get_intent_cache() -> Optional[IntentCache]:
+    """環境変数 INTENT_CACHE_BACKEND に応じたキャッシュ (プロセスで1つ)。none なら None"""
+    global _intent_cache
+    if INTENT_CACHE_BACKEND == "none":
+        return None
+    if _intent_cache is None:
+        with _intent_cache_lock:
+            if _intent_cache is None:
+                if INTENT_CACHE_BACKEND == "sqlite":
+                    backend = SQLiteIntentCacheBackend()
+                else:
+                    backend = MemoryIntentCacheBackend()
+                _intent_cache = IntentCache(backend)
+                logger.info(f"Intent cache initialized. backend={backend.name}")
+    return _intent_cache
@@ -0,0 +1,153 @@
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+# Aho-Corasick の C 実装 (任意)。無ければ純 Python の走査に切り替える
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# ---------------------------------------------------------
+# 開発現場で飛び交うあらゆる「質問・トラブル・依頼・技術用語」 (カテゴリ別)
+# ---------------------------------------------------------
+KEYWORD_CATEGORIES: Dict[str, List[str]] = {
+    # 🆘 SOS・疑問・依頼・感情
+    "sos": [
+        "?", "？", "ですか", "ますか", "教えて", "教えろ", "願います", "頼む", "お願いします",
+        "どうすれば", "どうやる", "方法", "仕方", "手順", "やり方",
+        "分からない", "わからん", "不明", "なにこれ", "何これ", "why", "what", "how",
+        "help", "ヘルプ", "助けて", "詰んだ", "詰まってる", "進まない", "終わらない",
+        "緊急", "至急", "早急", "なる早", "asap", "urgent",
+        "相談", "確認", "共有", "提案", "検討", "レビュー", "review",
+    ],
+    # 💥 エラー・不具合・異常
+    "error": [
+        "error", "エラー", "exception", "例外", "fail", "failed", "failure", "失敗",
+        "bug", "バグ", "不具合", "defect", "incident", "インシデント", "障害",
+        "crash", "クラッシュ", "落ちる", "落ちた", "止まる", "止まった", "フリーズ", "hang",
+        "broken", "break", "壊れた", "動かない", "反応しない",
+        "おかしい", "変", "strange", "weird", "odd", "unexpected", "予期せぬ",
+        "timeout", "timed out", "タイムアウト", "重い", "遅い", "latency",
+        "traceback", "stacktrace", "スタックトレース",
+        "keyerror", "valueerror", "typeerror", "indexerror", "nameerror", "attributeerror",
+    ],
+    # 🐍 Python / コード関連
+    "code": [
+        "import", "install", "pip", "conda", "venv", "virtualenv",
+        "syntax", "indentation", "indent", "インデント", "構文",
+        "type", "型", "int", "str", "list", "dict", "none", "null", "undefined",
+        "function", "def", "class", "method", "argument", "param", "引数", "戻り値", "return",
+    ],
+    # 🐙 Git / バージョン管理
+    "git": [
+        "git", "github", "gitlab", "commit", "push", "pull", "fetch", "clone",
+        "merge", "マージ", "rebase", "リベース", "conflict", "コンフリクト", "競合",
+        "branch", "ブランチ", "checkout", "stash", "reset", "revert", "cherry-pick",
+        "diff", "差分", "pr", "pull request", "プルリク",
+    ],
+    # ☁️ インフラ / ネットワーク / DB
+    "infra": [
+        "aws", "s3", "ec2", "lambda", "cloud", "gcp", "azure",
+        "docker", "container", "image", "compose", "build", "ビルド",
+        "deploy", "デプロイ", "release", "リリース", "rollback", "ロールバック",
+        "env", "環境変数", "config", "設定", "conf", "yaml", "json", "xml",
+        "connect", "接続", "connection", "refused", "denied", "network", "wifi",
+        "dns", "ip", "port", "ポート", "ssh", "sudo", "permission", "権限", "access",
+        "db", "database", "sql", "mysql", "postgres", "sqlite", "query", "select", "insert",
+        "table", "column", "record", "data", "migration", "マイグレーション",
+    ],
+    # 🌐 Web / API / HTTP
+    "web": [
+        "http", "https", "url", "uri", "link", "リンク",
+        "404", "500", "403", "401", "200", "status", "code",
+        "api", "endpoint", "エンドポイント", "rest", "graphql",
+        "get", "post", "put", "delete", "patch",
+        "header", "body", "payload", "cookie", "session", "cache", "キャッシュ",
+        "cors", "authentication", "auth", "login", "ログイン", "token", "key",
+    ],
+}
+
+# カテゴリごとの重み: 「助けて」「エラー」は単独で質問扱い、技術用語は2つ以上で質問扱い
+CATEGORY_WEIGHTS: Dict[str, float] = {
+    "sos": 1.0,
+    "error": 1.0,
+    "code": 0.5,
+    "git": 0.5,
+    "infra": 0.5,
+    "web": 0.5,
+}
+
+# スコアがこの値以上なら "question"
+KEYWORD_SCORE_THRESHOLD = float(os.getenv("KEYWORD_SCORE_THRESHOLD", "1.0"))
+
+
+@dataclass
+class KeywordMatch:
+    """キーワード判定の結果"""
+    keywords: Dict[str, str] = field(default_factory=dict)  # 一致したキーワード -> カテゴリ
+    score: float = 0.0
+
+    @property
+    def categories(self) -> List[str]:
+        return sorted(set(self.keywords.values()))
+
+    @property
+    def is_question(self) -> bool:
+        return self.score >= KEYWORD_SCORE_THRESHOLD
+
+
+class KeywordMatcher:
+    """
+    [F-02] 多パターン一括マッチャー (モジュール読み込み時に一度だけ構築)
+    pyahocorasick が入っていれば Aho-Corasick オートマトンで1パス走査する。
+    入っていなければ、文字集合による事前絞り込み + 部分文字列検索で同じ結果を返す。
+    どちらも空白区切りのトークンを重複排除してから走査するので、
+    同じ行が何百回も出てくるトレースバックでも走査量が増えにくい。
+    """
+
+    def __init__(self, categories: Dict[str, List[str]], weights: Dict[str, float]):
+        self.weights = weights
+        self.category_of: Dict[str, str] = {}
+        for category, words in categories.items():
+            for word in words:
+                self.category_of.setdefault(word.lower(), category)
+
+        # 空白を含む語 ("timed out" 等) はトークン分割をまたぐので原文で探す
+        self._spaced = [w for w in self.category_of if any(ch.isspace() for ch in w)]
+        words = [w for w in self.category_of if w not in self._spaced]
+
+        self._automaton = None
+        if ahocorasick is not None:
+            automaton = ahocorasick.Automaton()
+            for word in words:
+                automaton.add_word(word, word)
+            automaton.make_automaton()
+            self._automaton = automaton
+        else:
+            # 語を構成する文字がテキストに全て含まれるときだけ検索する
+            self._candidates = [(word, frozenset(word)) for word in words]
+
+    def _scan(self, text: str):
+        if self._automaton is not None:
+            return {word for _, word in self._automaton.iter(text)}
+        chars = set(text)
+        return {word for word, needed in self._candidates if needed <= chars and word in text}
+
+    def match(self, text: str) -> KeywordMatch:
+        text_lower = text.lower()
+        # 改行で連結すれば、空白を含まない語がトークンをまたいで誤一致することはない
+        words = self._scan("\n".join(set(text_lower.split())))
+        words.update(w for w in self._spaced if w in text_lower)
+
+        found = {word: self.category_of[word] for word in words}
+        score = sum(self.weights.get(category, 0.0) for category in found.values())
+        return KeywordMatch(keywords=found, score=score)
+
+
+# モジュール読み込み時に一度だけ構築する
+matcher = KeywordMatcher(KEYWORD_CATEGORIES, CATEGORY_WEIGHTS)
+
+
+def match_keywords(text: str) -> KeywordMatch:
+    return matcher.match(text)
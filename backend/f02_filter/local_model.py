@@ -0,0 +1,200 @@
+import os
+import zlib
+import json
+import threading
+import logging
+from typing import List, Optional, Tuple
+
+from backend.f02_filter.intent_cache import normalize_text
+
+# NumPy は任意。無ければローカル判定は無効 (Gemini に任せる)
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------
+# 設定値 (環境変数で上書き可能)
+# ---------------------------------------------------------
+LOCAL_INTENT_MODEL_PATH = os.getenv(
+    "LOCAL_INTENT_MODEL_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "intent_model.npz"),
+)
+# この確信度以上ならローカルで答え、未満なら Gemini に回す
+LOCAL_INTENT_THRESHOLD = float(os.getenv("LOCAL_INTENT_THRESHOLD", "0.9"))
+
+LABELS = ("chat", "question")
+
+
+def extract_ngrams(text: str, ngram_range: Tuple[int, int] = (1, 3)) -> List[str]:
+    """
+    文字 n-gram (日本語でも形態素解析なしで使える)
+    前後に境界記号を付けて、語頭・語末の n-gram も区別する。
+    """
+    text = f"\x02{normalize_text(text)}\x03"
+    lo, hi = ngram_range
+    return [text[i:i + n] for n in range(lo, hi + 1) for i in range(len(text) - n + 1)]
+
+
+class LocalIntentModel:
+    """
+    [F-02] ローカル意図判定モデル (ハッシュ化した文字 n-gram + ロジスティック回帰)
+    ハッシュには crc32 を使う (Python の hash() はプロセスごとに値が変わるため)。
+    """
+
+    def __init__(self, dim: int = 2 ** 18, ngram_range: Tuple[int, int] = (1, 3), weights=None, bias: float = 0.0):
+        if np is None:
+            raise RuntimeError("numpy is required for LocalIntentModel")
+        self.dim = dim
+        self.ngram_range = tuple(ngram_range)
+        self.weights = np.zeros(dim, dtype=np.float32) if weights is None else weights.astype(np.float32)
+        self.bias = float(bias)
+
+    # ---------------------------------------------------------
+    # 特徴量
+    # ---------------------------------------------------------
+    def _features(self, text: str):
+        """(列番号, 値) の疎ベクトル。出現回数を L2 正規化したもの"""
+        grams = extract_ngrams(text, self.ngram_range)
+        if not grams:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        hashed = np.fromiter((zlib.crc32(g.encode("utf-8")) % self.dim for g in grams), dtype=np.int64, count=len(grams))
+        indices, counts = np.unique(hashed, return_counts=True)
+        values = counts.astype(np.float32)
+        values /= np.linalg.norm(values)
+        return indices, values
+
+    def _featurize_many(self, texts: List[str]):
+        """複数テキストを CSR 形式 (indptr, indices, values) にまとめる"""
+        rows = [self._features(t) for t in texts]
+        lengths = np.array([len(idx) for idx, _ in rows], dtype=np.int64)
+        indptr = np.concatenate([[0], np.cumsum(lengths)])
+        indices = np.concatenate([idx for idx, _ in rows]) if rows else np.zeros(0, dtype=np.int64)
+        values = np.concatenate([val for _, val in rows]) if rows else np.zeros(0, dtype=np.float32)
+        return indptr, indices, values
+
+    # ---------------------------------------------------------
+    # 推論
+    # ---------------------------------------------------------
+    def predict_proba(self, text: str) -> float:
+        """question である確率"""
+        indices, values = self._features(text)
+        z = float(np.dot(self.weights[indices], values)) + self.bias
+        return float(1.0 / (1.0 + np.exp(-z)))
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """(タグ, 確信度) を返す"""
+        p = self.predict_proba(text)
+        return (LABELS[1], p) if p >= 0.5 else (LABELS[0], 1.0 - p)
+
+    # ---------------------------------------------------------
+    # 学習
+    # ---------------------------------------------------------
+    def fit(self, texts: List[str], labels: List[str], epochs: int = 200, lr: float = 1.0, l2: float = 1e-4):
+        """全件勾配降下 (AdaGrad) でロジスティック回帰を学習する"""
+        indptr, indices, values = self._featurize_many(texts)
+        y = np.array([1.0 if label == LABELS[1] else 0.0 for label in labels], dtype=np.float32)
+        n = len(texts)
+        row_of = np.repeat(np.arange(n), np.diff(indptr))
+
+        w = np.zeros(self.dim, dtype=np.float32)
+        b = 0.0
+        g2_w = np.full(self.dim, 1e-8, dtype=np.float32)
+        g2_b = 1e-8
+
+        for _ in range(epochs):
+            z = np.bincount(row_of, weights=w[indices] * values, minlength=n) + b
+            p = 1.0 / (1.0 + np.exp(-z))
+            err = (p - y) / n
+            grad_w = np.bincount(indices, weights=err[row_of] * values, minlength=self.dim).astype(np.float32)
+            grad_w += l2 * w
+            grad_b = float(err.sum())
+
+            g2_w += grad_w ** 2
+            g2_b += grad_b ** 2
+            w -= lr * grad_w / np.sqrt(g2_w)
+            b -= lr * grad_b / np.sqrt(g2_b)
+
+        self.weights = w
+        self.bias = b
+        return self
+
+    # ---------------------------------------------------------
+    # 保存・読み込み
+    # ---------------------------------------------------------
+    def save(self, path: str, metadata: Optional[dict] = None):
+        np.savez_compressed(
+            path,
+            weights=self.weights,
+            bias=np.array([self.bias], dtype=np.float64),
+            dim=np.array([self.dim]),
+            ngram_range=np.array(self.ngram_range),
+            metadata=np.array(json.dumps(metadata or {}, ensure_ascii=False)),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "LocalIntentModel":
+        with np.load(path) as data:
+            return cls(
+                dim=int(data["dim"][0]),
+                ngram_range=tuple(int(x) for x in data["ngram_range"]),
+                weights=data["weights"],
+                bias=float(data["bias"][0]),
+            )
+
+
+# ---------------------------------------------------------
+# 実行時に使うモデル (プロセスで1つ)
+# ---------------------------------------------------------
+_local_model: Optional[LocalIntentModel] = None
+_local_model_loaded = False
+_local_model_lock = threading.Lock()
+_counters = {"local": 0, "escalated": 0}
+
+
+def get_local_model() -> Optional[LocalIntentModel]:
+    """モデルファイルがあれば読み込む。無い・NumPy が無い場合は None"""
+    global _local_model, _local_model_loaded
+    if not _local_model_loaded:
+        with _local_model_lock:
+            if not _local_model_loaded:
+                if np is not None and os.path.exists(LOCAL_INTENT_MODEL_PATH):
+                    try:
+                        _local_model = LocalIntentModel.load(LOCAL_INTENT_MODEL_PATH)
+                        logger.info(f"Local intent model loaded: {LOCAL_INTENT_MODEL_PATH}")
+                    except Exception as e:
+                        logger.error(f"❌ Failed to load local intent model: {e}")
+                _local_model_loaded = True
+    return _local_model
+
+
+def classify_locally(text: str) -> Optional[str]:
+    """
+    確信度が LOCAL_INTENT_THRESHOLD 以上ならタグを返す。
+    自信がない (またはモデルが無い) ときは None を返して Gemini に任せる。
+    """
+    model = get_local_model()
+    if model is None:
+        return None
+
+    tag, confidence = model.predict(text)
+    with _local_model_lock:
+        if confidence >= LOCAL_INTENT_THRESHOLD:
+            _counters["local"] += 1
+        else:
+            _counters["escalated"] += 1
+    return tag if confidence >= LOCAL_INTENT_THRESHOLD else None
+
+
+def get_local_model_stats() -> dict:
+    with _local_model_lock:
+        counters = dict(_counters)
+    total = counters["local"] + counters["escalated"]
+    return {
+        "enabled": _local_model is not None,
+        "threshold": LOCAL_INTENT_THRESHOLD,
+        "local_rate": counters["local"] / total if total else 0.0,
+        **counters,
+    }
@@ -1,30 +1,74 @@
 import os
+import time
 import logging
-import boto3
+import threading
+import itertools
 from botocore.exceptions import ClientError
 from datetime import datetime
 from typing import Optional
+from backend.common.config import load_env
 from backend.common.models import SlackMessage, FeedbackResponse
+from backend.f03_db.history_cache import history_cache
+from backend.f03_db.write_buffer import BufferedLogWriter, DB_WRITE_BUFFER_ENABLED
 
 # ローカル開発時のみ .env を読み込む
-try:
-    from dotenv import load_dotenv
-    load_dotenv()
-except ImportError:
-    pass
+load_env()
 
 logger = logging.getLogger(__name__)
 
+# 過去ログ取得用の GSI (channel_id + ts)。tools/create_table.py で作成する
+HISTORY_INDEX_NAME = os.getenv("DYNAMODB_HISTORY_INDEX", "channel_id-ts-index")
+
+# GSI が無い環境では Scan に切り替え、以降は Query を試さない
+_history_index_available = True
+
+# チャンネルごとの要約レコードの ts (channel_id 属性を持たせないので GSI・履歴には出てこない)
+SUMMARY_KEY_PREFIX = "summary#"
+
+# ---------------------------------------------------------
+# 接続設定 (環境変数で上書き可能)
+# ---------------------------------------------------------
+# 同時に DB を叩くのはパイプラインのワーカー + 受信スレッド (重複排除) なので、その分だけ接続を持つ
+DYNAMODB_MAX_POOL_CONNECTIONS = int(os.getenv(
+    "DYNAMODB_MAX_POOL_CONNECTIONS", str(int(os.getenv("PIPELINE_WORKERS", "4")) + 4)
+))
+DYNAMODB_MAX_ATTEMPTS = int(os.getenv("DYNAMODB_MAX_ATTEMPTS", "5"))
+
+
+def _boto_config():
+    # boto3 / botocore.config の import は重いので、実際に DynamoDB へ接続するときまで遅らせる
+    from botocore.config import Config
+    return Config(
+        max_pool_connections=DYNAMODB_MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True,  # アイドル中も TLS 接続を維持して使い回す
+        retries={'mode': 'adaptive', 'max_attempts': DYNAMODB_MAX_ATTEMPTS},  # スロットリング時はクライアント側で流量を絞る
+        connect_timeout=3,
+        read_timeout=10,
+    )
+
 class DynamoDBHandler:
-    def __init__(self):
+    def __init__(self, table=None, dedup_table=None):
         self.region = os.getenv("AWS_DEFAULT_REGION", "ap-northeast-1")
         self.table_name = os.getenv("DYNAMODB_TABLE", "SlackerFeedback")
+        # 重複イベント判定用テーブル (複数インスタンス運用時のみ使用)
+        self.dedup_table_name = os.getenv("DYNAMODB_DEDUP_TABLE", "SlackerEventDedup")
+
+        # 初回保存のまとめ書き (get_db_handler で有効化する)
+        self.write_buffer = None
+
+        # テーブルを外から渡された場合 (ローカルの代替テーブル等) は boto3 に接続しない
+        if table is not None:
+            self.table = table
+            self.dedup_table = dedup_table
+            return
         
         try:
             # IAM認証: aws_access_key_id 等を指定しないことで、
             # 自動的に実行環境（ローカルなら .aws/credentials、AWSなら IAMロール）の権限を見に行きます。
-            self.dynamodb = boto3.resource('dynamodb', region_name=self.region)
+            import boto3
+            self.dynamodb = boto3.resource('dynamodb', region_name=self.region, config=_boto_config())
             self.table = self.dynamodb.Table(self.table_name)
+            self.dedup_table = self.dynamodb.Table(self.dedup_table_name)
             logger.info(f"DB initialized. Table: {self.table_name}, Region: {self.region}")
         except Exception as e:
             logger.error(f"Failed to connect to DynamoDB: {e}")
@@ -40,27 +84,31 @@ class DynamoDBHandler:
             logger.error("Timestamp (ts) is missing. Cannot save to DB.")
             return
 
-        # 基本情報の構築
-        item = {
-            'ts': message.ts,          # Partition Key (PK)
-            'user_id': message.user_id,
-            'channel_id': message.channel_id,
-            'text': message.text,
-            'status': message.status,  # "pending" -> "done" 等の状態遷移
-            'intent_tag': message.intent_tag,
-            'updated_at': datetime.now().isoformat()
-        }
-
-        # Feedbackがある場合は結合する
+        # Feedbackがある場合 (2回目の保存) は、変わった項目だけを部分更新する
         if feedback:
-            item['feedback_summary'] = feedback.feedback_summary
-            item['response_timestamp'] = feedback.timestamp or datetime.now().isoformat()
+            self.save_feedback(message, feedback)
+            return
+
+        # 基本情報の構築 (ts が Partition Key。status は "pending" -> "done" 等の状態遷移)
+        item = message.to_item()
+        item['updated_at'] = datetime.now().isoformat()
         
         try:
-            # put_item は「上書き保存」です。キー(ts)が同じなら更新、なければ新規作成されます。
-            # update_item よりもロジックが単純で、データの整合性を保ちやすいアプローチです。
-            self.table.put_item(Item=item)
-            logger.info(f"Record saved for ts={message.ts}, status={message.status}")
+            if self.write_buffer is not None:
+                # まとめ書き (BatchWriteItem) に回す
+                self.write_buffer.add(item)
+                logger.info(f"Record buffered for ts={message.ts}, status={message.status}")
+            else:
+                # put_item は「上書き保存」です。キー(ts)が同じなら更新、なければ新規作成されます。
+                self.table.put_item(Item=item)
+                logger.info(f"Record saved for ts={message.ts}, status={message.status}")
+
+            # 直近履歴のリングバッファにも反映 (write-through)
+            history_cache.record(item['channel_id'], {
+                'ts': item['ts'],
+                'user_id': item['user_id'],
+                'text': item['text'],
+            })
             
         except ClientError as e:
             logger.error(f"DynamoDB ClientError: {e.response['Error']['Message']}")
@@ -69,38 +117,319 @@ class DynamoDBHandler:
             logger.error(f"Unexpected error in save_log: {e}")
             raise
 
-        # backend/f03_db/database.py の DynamoDBHandler クラス内に追加
+    def save_feedback(self, message: SlackMessage, feedback: FeedbackResponse):
+        """
+        [F-03] フィードバックの保存
+        レコード全体を put_item で上書きせず、feedback_summary / status / response_timestamp だけを
+        update_item で書き込む。初回レコードがまだまとめ書き待ちなら、それと合わせて1回で書く。
+        """
+        now = datetime.now().isoformat()
+        fields = feedback.to_item()
+        fields['response_timestamp'] = fields['response_timestamp'] or now
+        fields['updated_at'] = now
+
+        pending = self.write_buffer.take(message.ts) if self.write_buffer is not None else None
+
+        try:
+            if pending is not None:
+                pending.update(fields)
+                self.table.put_item(Item=pending)
+                logger.info(f"Record saved with feedback for ts={message.ts} (coalesced)")
+            else:
+                self.table.update_item(
+                    Key={'ts': message.ts},
+                    UpdateExpression="SET feedback_summary = :f, #s = :s, response_timestamp = :r, updated_at = :u",
+                    ExpressionAttributeNames={'#s': 'status'},  # status は予約語
+                    ExpressionAttributeValues={
+                        ':f': fields['feedback_summary'],
+                        ':s': fields['status'],
+                        ':r': fields['response_timestamp'],
+                        ':u': fields['updated_at'],
+                    },
+                )
+                logger.info(f"Feedback updated for ts={message.ts}, status={feedback.status}")
+
+        except ClientError as e:
+            logger.error(f"DynamoDB ClientError: {e.response['Error']['Message']}")
+            raise
+        except Exception as e:
+            logger.error(f"Unexpected error in save_feedback: {e}")
+            raise
+
+    def save_delivery_receipt(self, ts: str, receipt: dict):
+        """
+        [F-06連携] Slack への配信結果 (delivered / failed、投稿した ts、試行回数) をレコードに書き戻す
+        レコードが無い返信 (混雑時の縮退パイプラインの簡易返信など) は書かない (レシートだけの項目を作らない)
+        """
+        try:
+            self.table.update_item(
+                Key={'ts': ts},
+                ConditionExpression="attribute_exists(ts)",
+                UpdateExpression="SET delivery_status = :s, delivery_message_ts = :m, "
+                                 "delivery_attempts = :a, delivered_at = :d, delivery_error = :e",
+                ExpressionAttributeValues={
+                    ':s': receipt['status'],
+                    ':m': receipt['message_ts'],
+                    ':a': receipt['attempts'],
+                    ':d': receipt['delivered_at'],
+                    ':e': receipt.get('error'),
+                },
+            )
+            logger.info(f"Delivery receipt saved for ts={ts}, status={receipt['status']}")
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                logger.info(f"No record for ts={ts}. Delivery receipt not saved (status={receipt['status']}).")
+                return
+            logger.error(f"❌ Error saving delivery receipt: {e.response['Error']['Message']}")
+
+    def get_progress(self, ts: str) -> Optional[dict]:
+        """
+        [F-03拡張] メッセージがパイプラインのどこまで進んだか (回答・配信結果) を読む
+        キューモードで再配信されたメッセージの、終わった段を飛ばすために使う (レコードが無ければ None)
+        """
+        # 直前に別のワーカーが書いた結果を読むので、強い整合性で読む
+        response = self.table.get_item(
+            Key={'ts': ts},
+            ProjectionExpression="ts, event_id, user_id, feedback_summary, #s, response_timestamp, delivery_status",
+            ExpressionAttributeNames={'#s': 'status'},  # status は予約語
+            ConsistentRead=True,
+        )
+        return response.get('Item')
+
+    def claim_event(self, dedup_key: str, ttl_seconds: int = 3600) -> bool:
+        """
+        [F-03拡張] イベントの処理権を条件付き書き込みで確保する (複数インスタンス間の重複排除)
+        Returns: 初めて見たイベントなら True、他のインスタンスが既に処理済みなら False
+        """
+        now = int(time.time())
+        try:
+            # 期限切れ (DynamoDB TTL の削除待ち) のレコードは未処理とみなして上書きする
+            self.dedup_table.put_item(
+                Item={
+                    'dedup_key': dedup_key,
+                    'expires_at': now + ttl_seconds,  # TTL 属性
+                },
+                ConditionExpression="attribute_not_exists(dedup_key) OR expires_at < :now",
+                ExpressionAttributeValues={':now': now},
+            )
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False
+            logger.error(f"DynamoDB ClientError in claim_event: {e.response['Error']['Message']}")
+            raise
+
+    def release_event(self, dedup_key: str):
+        """
+        [F-03拡張] claim_event で確保した処理権を手放す (受け付けられなかったイベントを再送で処理し直すため)
+        """
+        try:
+            self.dedup_table.delete_item(Key={'dedup_key': dedup_key})
+        except ClientError as e:
+            logger.error(f"DynamoDB ClientError in release_event: {e.response['Error']['Message']}")
+            raise
+
+
+    def get_recent_items(self, channel_id: str, limit: int = 10) -> list:
+        """
+        [F-03拡張] 特定のチャンネルの最新メッセージ (ts / user_id / text の辞書) を古い順に取得する
+        """
+        # 温まっているチャンネルはメモリから返す。冷えていれば DB から読んで温める
+        items = history_cache.get(channel_id, limit)
+        if items is None:
+            items = self._fetch_history_items(channel_id, max(limit, history_cache.per_channel))
+            history_cache.warm(channel_id, items)
+            items = items[:limit]
+
+        # タイムスタンプ(ts)でソートして、古い順に並べる
+        items.sort(key=lambda x: x['ts'])
+        logger.info(f"Retrieved {len(items)} history items for channel={channel_id}")
+        return items
 
     def get_recent_history(self, channel_id: str, limit: int = 10) -> str:
         """
         [F-03拡張] 特定のチャンネルから最新のメッセージを文字列形式で取得する (RAG用)
         """
         try:
-            # channel_id が PK ではない場合、Scan + Filter を行います（開発初期用）
-            # 本格的な運用では channel_id を PK にした GSI を貼るのがプロの流儀です
-            response = self.table.scan(
-                FilterExpression=boto3.dynamodb.conditions.Attr('channel_id').eq(channel_id),
-                Limit=limit
-            )
-            
-            items = response.get('Items', [])
-            
-            # タイムスタンプ(ts)でソートして、古い順に並べる
-            items.sort(key=lambda x: x['ts'])
-            
+            items = self.get_recent_items(channel_id, limit)
+
             # AIに渡すためのテキスト形式に整形
-            history_text = "\n".join([
+            return "\n".join([
                 f"User {item.get('user_id', 'unknown')}: {item.get('text', '')}"
                 for item in items
             ])
-            
-            logger.info(f"Retrieved {len(items)} history items for channel={channel_id}")
-            return history_text
 
         except ClientError as e:
             logger.error(f"❌ Error fetching history: {e.response['Error']['Message']}")
             return ""
 
+    def get_items_by_ts(self, ts_list: list) -> list:
+        """
+        [F-03拡張] 指定した ts のメッセージ (ts / user_id / text の辞書) を取得する (ベクトル検索の結果を本文に戻す用)
+        """
+        items = []
+        for ts in ts_list:
+            try:
+                response = self.table.get_item(
+                    Key={'ts': ts},
+                    ProjectionExpression="user_id, #t, ts",
+                    ExpressionAttributeNames={'#t': 'text'},  # text は予約語
+                )
+            except ClientError as e:
+                logger.error(f"❌ Error fetching item ts={ts}: {e.response['Error']['Message']}")
+                continue
+            if 'Item' in response:
+                items.append(response['Item'])
+        return items
+
+    def get_channel_summary(self, channel_id: str) -> Optional[dict]:
+        """
+        [F-03拡張] チャンネルの要約レコード (summary / message_count / updated_at) を取得する。無ければ None
+        """
+        try:
+            response = self.table.get_item(Key={'ts': f"{SUMMARY_KEY_PREFIX}{channel_id}"})
+            return response.get('Item')
+        except ClientError as e:
+            logger.error(f"❌ Error fetching channel summary: {e.response['Error']['Message']}")
+            return None
+
+    def save_channel_summary(self, channel_id: str, summary: str, message_count: int):
+        """
+        [F-03拡張] チャンネルの要約をログと同じテーブルに保存する。
+        channel_id 属性は付けない (付けると GSI に載り、履歴として読まれてしまう)
+        """
+        try:
+            self.table.put_item(Item={
+                'ts': f"{SUMMARY_KEY_PREFIX}{channel_id}",
+                'summary_channel_id': channel_id,
+                'summary': summary,
+                'message_count': message_count,
+                'updated_at': datetime.now().isoformat(),
+            })
+            logger.info(f"Channel summary saved for channel={channel_id}")
+        except ClientError as e:
+            logger.error(f"❌ Error saving channel summary: {e.response['Error']['Message']}")
+
+    def _fetch_history_items(self, channel_id: str, limit: int) -> list:
+        """チャンネルの最新 limit 件 (新しい順)。GSI が無ければ Scan で代用する"""
+        global _history_index_available
+        if _history_index_available:
+            try:
+                return self._query_history_items(channel_id, limit)
+            except ClientError as e:
+                error = e.response['Error']
+                if error['Code'] != 'ValidationException' or 'index' not in error['Message'].lower():
+                    raise
+                logger.warning(f"⚠️ Index {HISTORY_INDEX_NAME} not found. Falling back to Scan.")
+                _history_index_available = False
+        return self._scan_history_items(channel_id, limit)
+
+    def _query_history_items(self, channel_id: str, limit: int) -> list:
+        """
+        GSI (channel_id, ts) を新しい順に Query する。
+        読み込むのは必要な件数分の index エントリだけなので、テーブルが大きくなってもコストは一定。
+        """
+        from boto3.dynamodb.conditions import Key
+        items = []
+        kwargs = {
+            'IndexName': HISTORY_INDEX_NAME,
+            'KeyConditionExpression': Key('channel_id').eq(channel_id),
+            'ScanIndexForward': False,  # ts の降順 (新しい順)
+            'ProjectionExpression': 'user_id, #t, ts',
+            'ExpressionAttributeNames': {'#t': 'text'},  # text は予約語
+        }
+        while len(items) < limit:
+            kwargs['Limit'] = limit - len(items)
+            response = self.table.query(**kwargs)
+            items.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                break
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        return items[:limit]
+
+    def _scan_history_items(self, channel_id: str, limit: int) -> list:
+        """
+        GSI が無い場合のフォールバック (テーブル全体を読む)。
+        Scan の Limit はフィルタ前に効くので、最後までページングしてから新しい順に limit 件取る。
+        """
+        from boto3.dynamodb.conditions import Attr
+        items = []
+        kwargs = {
+            'FilterExpression': Attr('channel_id').eq(channel_id),
+            'ProjectionExpression': 'user_id, #t, ts',
+            'ExpressionAttributeNames': {'#t': 'text'},
+        }
+        while True:
+            response = self.table.scan(**kwargs)
+            items.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                break
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+        items.sort(key=lambda x: x['ts'], reverse=True)
+        return items[:limit]
+
+# ---------------------------------------------------------
+# プロセス共有のハンドラ
+# ---------------------------------------------------------
+_shared_handler: Optional[DynamoDBHandler] = None
+_shared_handler_lock = threading.Lock()
+_shared_stats = {"created_at": None, "init_seconds": 0.0}
+_shared_requests = itertools.count(1)  # next() はスレッドセーフ
+_shared_requests_seen = 0
+
+
+def get_db_handler() -> DynamoDBHandler:
+    """
+    プロセスで1つの DynamoDBHandler を返す (初回呼び出し時に生成)。
+    イベントごとに boto3.resource を作ると、認証情報の解決・サービスモデルの構築・
+    TLS 接続の確立を毎回やり直すことになるため、接続プールごと使い回す。
+    ハンドラが使うのは put_item / query 等のアクションだけで、これらはスレッドセーフな
+    低レベルクライアントに委譲されるので、ワーカー間で共有して問題ない。
+    """
+    global _shared_handler, _shared_requests_seen
+    if _shared_handler is None:
+        with _shared_handler_lock:
+            if _shared_handler is None:
+                started = time.perf_counter()
+                _shared_handler = DynamoDBHandler()
+                if DB_WRITE_BUFFER_ENABLED:
+                    _shared_handler.write_buffer = BufferedLogWriter(_shared_handler.table)
+                _shared_stats["init_seconds"] = time.perf_counter() - started
+                _shared_stats["created_at"] = datetime.now().isoformat()
+    _shared_requests_seen = next(_shared_requests)
+    return _shared_handler
+
+
+def get_db_pool_stats() -> dict:
+    """共有ハンドラと接続プールの状態"""
+    stats = {
+        **_shared_stats,
+        "requests": _shared_requests_seen,
+        "initialized": _shared_handler is not None,
+        "max_pool_connections": DYNAMODB_MAX_POOL_CONNECTIONS,
+        "retry_mode": "adaptive",
+        "max_attempts": DYNAMODB_MAX_ATTEMPTS,
+    }
+    if _shared_handler is not None and _shared_handler.write_buffer is not None:
+        stats["write_buffer"] = _shared_handler.write_buffer.stats()
+
+    dynamodb = getattr(_shared_handler, "dynamodb", None)
+    if dynamodb is None:
+        return stats
+    try:
+        # botocore 内部の urllib3 プール (非公開属性なので取れなければ諦める)
+        manager = dynamodb.meta.client._endpoint.http_session._manager
+        pools = [manager.pools[key] for key in manager.pools.keys()]
+        stats["pools"] = len(pools)
+        stats["connections_opened"] = sum(pool.num_connections for pool in pools)
+        stats["http_requests"] = sum(pool.num_requests for pool in pools)
+        stats["idle_connections"] = sum(pool.pool.qsize() for pool in pools if pool.pool is not None)
+    except Exception:
+        pass
+    return stats
+
+
 if __name__ == "__main__":
     # 動作確認用（ローカルでAWS接続情報がある場合のみ動作）
     print("Testing DynamoDBHandler...")
@@ -0,0 +1,115 @@
+import os
+import time
+import threading
+from collections import OrderedDict, deque
+from typing import List, Optional
+
+# ---------------------------------------------------------
+# 設定値 (環境変数で上書き可能)
+# ---------------------------------------------------------
+HISTORY_CACHE_MAX_CHANNELS = int(os.getenv("HISTORY_CACHE_MAX_CHANNELS", "200"))
+HISTORY_CACHE_PER_CHANNEL = int(os.getenv("HISTORY_CACHE_PER_CHANNEL", "20"))
+# 他のインスタンスの書き込みを取り込むため、一定時間ごとに DB から温め直す (0 なら無期限)
+HISTORY_CACHE_TTL_SECONDS = float(os.getenv("HISTORY_CACHE_TTL_SECONDS", "300"))
+
+
+class _ChannelRing:
+    __slots__ = ("items", "warmed_at")
+
+    def __init__(self, size: int):
+        self.items = deque(maxlen=size)  # ts の昇順
+        self.warmed_at = None            # DB から温めた時刻 (None = まだ冷えている)
+
+    def upsert(self, item: dict):
+        ts = item["ts"]
+        # 同じ ts (1件のイベントの2回目の保存) は上書き
+        for i, existing in enumerate(self.items):
+            if existing["ts"] == ts:
+                self.items[i] = item
+                return
+        if not self.items or self.items[-1]["ts"] <= ts:
+            self.items.append(item)
+        else:
+            # ワーカーの並列実行で順序が前後した場合
+            merged = sorted([*self.items, item], key=lambda x: x["ts"])
+            self.items.clear()
+            self.items.extend(merged)
+
+
+class ChannelHistoryCache:
+    """
+    [F-03] チャンネルごとの直近メッセージのリングバッファ
+    save_log で書き込み時に追記 (write-through) し、get_recent_history はここから返す。
+    冷えているチャンネルだけ DB から読み込んで温める。チャンネル数が上限を超えたら
+    最も長く使われていないチャンネルから捨てる (LRU)。
+    """
+
+    def __init__(
+        self,
+        max_channels: int = HISTORY_CACHE_MAX_CHANNELS,
+        per_channel: int = HISTORY_CACHE_PER_CHANNEL,
+        ttl_seconds: float = HISTORY_CACHE_TTL_SECONDS,
+    ):
+        self.max_channels = max(1, max_channels)
+        self.per_channel = max(1, per_channel)
+        self.ttl_seconds = ttl_seconds
+        self._channels = OrderedDict()  # channel_id -> _ChannelRing
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "cold_misses": 0, "evictions": 0}
+
+    def _ring(self, channel_id: str) -> _ChannelRing:
+        ring = self._channels.get(channel_id)
+        if ring is None:
+            ring = _ChannelRing(self.per_channel)
+            self._channels[channel_id] = ring
+            while len(self._channels) > self.max_channels:
+                self._channels.popitem(last=False)
+                self._counters["evictions"] += 1
+        self._channels.move_to_end(channel_id)
+        return ring
+
+    def _is_warm(self, ring: _ChannelRing) -> bool:
+        if ring.warmed_at is None:
+            return False
+        return not self.ttl_seconds or time.monotonic() - ring.warmed_at < self.ttl_seconds
+
+    def record(self, channel_id: str, item: dict):
+        """書き込み時に呼ぶ (item は ts / user_id / text を含む辞書)"""
+        with self._lock:
+            self._ring(channel_id).upsert(item)
+
+    def get(self, channel_id: str, limit: int) -> Optional[List[dict]]:
+        """温まっていれば新しい順に最大 limit 件。冷えていれば None (DB から読んで warm すること)"""
+        with self._lock:
+            ring = self._channels.get(channel_id)
+            if limit > self.per_channel or ring is None or not self._is_warm(ring):
+                self._counters["cold_misses"] += 1
+                return None
+            self._channels.move_to_end(channel_id)
+            self._counters["hits"] += 1
+            return list(reversed(ring.items))[:limit]
+
+    def warm(self, channel_id: str, items: List[dict]):
+        """DB から読み込んだ履歴で温める (冷えている間に書き込まれた分とマージする)"""
+        with self._lock:
+            ring = self._ring(channel_id)
+            for item in sorted(items, key=lambda x: x["ts"]):
+                ring.upsert(item)
+            ring.warmed_at = time.monotonic()
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            channels = len(self._channels)
+        lookups = counters["hits"] + counters["cold_misses"]
+        return {
+            "channels": channels,
+            "max_channels": self.max_channels,
+            "per_channel": self.per_channel,
+            "hit_rate": counters["hits"] / lookups if lookups else 0.0,
+            **counters,
+        }
+
+
+# プロセスで共有するキャッシュ (DynamoDBHandler はイベントごとに作られるため)
+history_cache = ChannelHistoryCache()
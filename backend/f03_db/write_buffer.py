@@ -0,0 +1,165 @@
+import os
+import time
+import atexit
+import threading
+import logging
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------
+# 設定値 (環境変数で上書き可能)
+# ---------------------------------------------------------
+DB_WRITE_BUFFER_ENABLED = os.getenv("DB_WRITE_BUFFER_ENABLED", "false").lower() == "true"
+# BatchWriteItem の上限は25件
+DB_WRITE_BUFFER_MAX_ITEMS = int(os.getenv("DB_WRITE_BUFFER_MAX_ITEMS", "25"))
+DB_WRITE_BUFFER_INTERVAL_MS = float(os.getenv("DB_WRITE_BUFFER_INTERVAL_MS", "200"))
+# BatchWriteItem が失敗したレコードを積み直す回数 (超えたら1件ずつ put_item する)
+DB_WRITE_BUFFER_MAX_RETRIES = int(os.getenv("DB_WRITE_BUFFER_MAX_RETRIES", "3"))
+# 積み直したときの待ち時間 (失敗回数ごとに倍)
+DB_WRITE_BUFFER_RETRY_BASE_MS = float(os.getenv("DB_WRITE_BUFFER_RETRY_BASE_MS", "200"))
+
+
+class BufferedLogWriter:
+    """
+    [F-03] 初回保存 ("received" / 判定済み) レコードのまとめ書き
+    put_item を1件ずつ投げる代わりにメモリに溜め、件数 (max_items) か
+    経過時間 (interval_ms) のどちらかに達したら BatchWriteItem で書き込む。
+    フィードバック保存時は take() でまだ書いていないレコードを引き取り、1回の書き込みにまとめる。
+    書き込みに失敗したレコードは捨てずにバッファへ戻し、待ち時間を倍にしながら max_retries 回まで
+    まとめ書きをやり直す。それでも駄目なら (停止時はすぐに) 1件ずつ put_item する。
+    """
+
+    def __init__(self, table, max_items: int = DB_WRITE_BUFFER_MAX_ITEMS, interval_ms: float = DB_WRITE_BUFFER_INTERVAL_MS,
+                 key: str = "ts", max_retries: int = DB_WRITE_BUFFER_MAX_RETRIES,
+                 retry_base_ms: float = DB_WRITE_BUFFER_RETRY_BASE_MS):
+        self.table = table
+        self.max_items = max(1, min(max_items, 25))
+        self.interval = interval_ms / 1000.0
+        self.key = key
+        self.max_retries = max(0, max_retries)
+        self.retry_base = retry_base_ms / 1000.0
+
+        self._pending = OrderedDict()  # ts -> item (同じ ts は後勝ち)
+        self._attempts = {}            # ts -> まとめ書きに失敗した回数
+        self._retry_at = 0.0           # この時刻 (monotonic) までは書き込みを控える
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._counters = {"buffered": 0, "coalesced": 0, "flushes": 0, "written": 0, "retried": 0,
+                          "written_individually": 0, "failed": 0}
+
+        self._thread = threading.Thread(target=self._loop, name="db-write-buffer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def add(self, item: dict):
+        with self._lock:
+            self._pending[item[self.key]] = item
+            self._counters["buffered"] += 1
+            full = len(self._pending) >= self.max_items
+        if full:
+            self._wakeup.set()
+
+    def take(self, key: str) -> Optional[dict]:
+        """
+        まだ書き込んでいないレコードを取り出す (無ければ None)。
+        書き込み中のバッチに含まれている場合は、その書き込みが終わるまで待つ
+        (後から来た部分更新が、古い全体書き込みで上書きされないように)。
+        """
+        with self._flush_lock, self._lock:
+            item = self._pending.pop(key, None)
+            if item is not None:
+                self._attempts.pop(key, None)
+                self._counters["coalesced"] += 1
+            return item
+
+    def flush(self, final: bool = False):
+        """溜まっているレコードを書き込む (失敗後の待ち時間中は何もしない。final=True なら待たずに書き切る)"""
+        with self._flush_lock:
+            with self._lock:
+                if not final and time.monotonic() < self._retry_at:
+                    return
+                items = list(self._pending.values())
+                self._pending.clear()
+            for start in range(0, len(items), self.max_items):
+                self._write_batch(items[start:start + self.max_items], final)
+
+    def _write_batch(self, items: list, final: bool = False):
+        if not items:
+            return
+        try:
+            # batch_writer が UnprocessedItems の再送と25件ごとの分割を面倒見てくれる
+            with self.table.batch_writer(overwrite_by_pkeys=[self.key]) as batch:
+                for item in items:
+                    batch.put_item(Item=item)
+            with self._lock:
+                for item in items:
+                    self._attempts.pop(item[self.key], None)
+                self._counters["flushes"] += 1
+                self._counters["written"] += len(items)
+            logger.info(f"Batch written: {len(items)} records")
+        except Exception as e:
+            retry, give_up = self._requeue(items, final)
+            if retry:
+                logger.warning(f"⚠️ BatchWriteItem failed, {len(retry)} records requeued: {e}")
+            if give_up:
+                logger.warning(f"⚠️ BatchWriteItem failed, writing {len(give_up)} records one by one: {e}")
+                self._put_each(give_up)
+
+    def _requeue(self, items: list, final: bool) -> tuple:
+        """失敗したレコードをバッファへ戻す。戻したものと、やり直し回数を使い切ったものを返す"""
+        retry, give_up = [], []
+        with self._lock:
+            for item in items:
+                key = item[self.key]
+                attempts = self._attempts.get(key, 0) + 1
+                if final or attempts > self.max_retries:
+                    self._attempts.pop(key, None)
+                    give_up.append(item)
+                    continue
+                self._attempts[key] = attempts
+                retry.append(item)
+                # 書き込み中に同じ ts の新しいレコードが積まれていれば、そちらを残す
+                self._pending.setdefault(key, item)
+            if retry:
+                worst = max(self._attempts[item[self.key]] for item in retry)
+                self._retry_at = time.monotonic() + self.retry_base * 2 ** (worst - 1)
+                self._counters["retried"] += len(retry)
+        return retry, give_up
+
+    def _put_each(self, items: list):
+        """最後の手段: 1件ずつ put_item する (それも失敗したレコードは諦める)"""
+        for item in items:
+            try:
+                self.table.put_item(Item=item)
+                with self._lock:
+                    self._counters["written"] += 1
+                    self._counters["written_individually"] += 1
+            except Exception as e:
+                with self._lock:
+                    self._counters["failed"] += 1
+                logger.error(f"❌ put_item failed, record {item[self.key]} lost: {e}")
+
+    def _loop(self):
+        while not self._closed:
+            self._wakeup.wait(timeout=self.interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def close(self):
+        """停止時に残りを書き出す"""
+        if self._closed:
+            return
+        self._closed = True
+        self._wakeup.set()
+        self._thread.join(timeout=5)
+        self.flush(final=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            pending = len(self._pending)
+        return {"pending": pending, "max_items": self.max_items, "interval_ms": self.interval * 1000, **counters}
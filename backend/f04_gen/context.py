@@ -0,0 +1,234 @@
+import os
+import re
+import threading
+import logging
+from typing import Callable, List, Optional
+
+from backend.common.ttl_cache import TTLCache
+from backend.f04_gen.retrieval import RAG_MODE, RETRIEVAL_TOP_K, get_retriever
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------
+# 設定値 (環境変数で上書き可能)
+# ---------------------------------------------------------
+# 過去の文脈 (要約 + 直近の履歴) に使うトークン数の上限
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+# 今回のメッセージ本文に使うトークン数の上限
+CONTEXT_MESSAGE_TOKEN_BUDGET = int(os.getenv("CONTEXT_MESSAGE_TOKEN_BUDGET", "2000"))
+CONTEXT_HISTORY_LIMIT = int(os.getenv("CONTEXT_HISTORY_LIMIT", "10"))
+# コードブロック・ログはこの行数を超えたら先頭と末尾だけ残す
+CONTEXT_MAX_BLOCK_LINES = int(os.getenv("CONTEXT_MAX_BLOCK_LINES", "12"))
+# 何メッセージごとにチャンネルの要約を更新するか (0 なら要約しない)
+CONTEXT_SUMMARY_EVERY = int(os.getenv("CONTEXT_SUMMARY_EVERY", "20"))
+
+# 要約レコードは更新頻度が低いので、毎回 DB を読まずに少しの間覚えておく
+_summary_cache = TTLCache(max_entries=500, ttl_seconds=300)
+
+_CODE_FENCE = re.compile(r"```.*?(?:```|$)", re.DOTALL)
+# スタックトレースやログらしい行 (タイムスタンプ、ログレベル、"at ..."、"File ..." 等)
+_LOG_LINE = re.compile(
+    r"^\s*(\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}|\[?(DEBUG|INFO|WARN|WARNING|ERROR|FATAL|TRACE)\]?\b|at \S+\(|File \"|Traceback|\$ |> )"
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    トークン数の概算 (トークナイザーは呼ばない)。
+    英数字は4文字で1トークン、日本語などは1文字1トークン程度として数える。
+    """
+    ascii_chars = sum(1 for c in text if c < "\x80")
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+
+def _elide_lines(lines: List[str], max_lines: int) -> List[str]:
+    if len(lines) <= max_lines:
+        return lines
+    head = max(1, max_lines * 2 // 3)
+    tail = max(1, max_lines - head)
+    return lines[:head] + [f"... ({len(lines) - head - tail} 行省略) ..."] + lines[-tail:]
+
+
+def _dedupe_lines(lines: List[str]) -> List[str]:
+    """同じ行の連続は1行にまとめ、離れた位置の重複行は2回目以降を捨てる"""
+    out, seen = [], set()
+    repeat = 0
+    for line in lines:
+        key = line.strip()
+        if out and key and key == out[-1].strip():
+            repeat += 1
+            continue
+        if repeat:
+            out.append(f"... (同じ行が {repeat} 回続く) ...")
+            repeat = 0
+        if key and len(key) > 8 and key in seen:
+            continue
+        seen.add(key)
+        out.append(line)
+    if repeat:
+        out.append(f"... (同じ行が {repeat} 回続く) ...")
+    return out
+
+
+def compact_text(text: str, max_block_lines: int = CONTEXT_MAX_BLOCK_LINES, budget: Optional[int] = None) -> str:
+    """
+    長いコードブロック・ログを先頭と末尾だけに縮め、重複行を除く。
+    budget (トークン数) を指定した場合は、それでも収まらない分を末尾から切り詰める。
+    """
+    if not text:
+        return ""
+
+    # 1. ``` で囲まれたコードブロック
+    def _shrink_block(match):
+        return "\n".join(_elide_lines(_dedupe_lines(match.group(0).split("\n")), max_block_lines))
+    text = _CODE_FENCE.sub(_shrink_block, text)
+
+    # 2. コードブロック外のログらしい行の連続
+    lines, out, run = text.split("\n"), [], []
+    for line in lines + [None]:
+        if line is not None and _LOG_LINE.match(line):
+            run.append(line)
+            continue
+        if run:
+            out.extend(_elide_lines(_dedupe_lines(run), max_block_lines))
+            run = []
+        if line is not None:
+            out.append(line)
+    text = "\n".join(_dedupe_lines(out))
+
+    # 3. それでも予算を超える場合は切り詰める
+    if budget is not None and estimate_tokens(text) > budget:
+        while text and estimate_tokens(text) > budget:
+            text = text[:int(len(text) * 0.8)]
+        text += "\n... (以下省略) ..."
+    return text
+
+
+def build_context(history_items: List[dict], summary: Optional[str] = None,
+                  budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    """
+    [F-04] トークン予算つきの文脈を組み立てる
+    チャンネルの要約を先頭に置き、残りの予算に入るだけ直近の履歴を新しい順に詰める。
+    チャンネルの流れが速くても、プロンプトの大きさはほぼ一定になる。
+    """
+    parts = []
+    remaining = budget
+    if summary:
+        summary_text = compact_text(summary, budget=budget // 3)
+        parts.append(f"(これまでの要約) {summary_text}")
+        remaining -= estimate_tokens(parts[0])
+
+    lines = []
+    # 1件で予算を使い切らないよう、1メッセージあたりの上限も設ける
+    per_item_budget = max(50, remaining // 3)
+    for item in reversed(history_items):
+        text = compact_text(item.get("text") or "", budget=per_item_budget)
+        line = f"User {item.get('user_id', 'unknown')}: {text}"
+        cost = estimate_tokens(line)
+        if cost > remaining:
+            break
+        lines.append(line)
+        remaining -= cost
+
+    parts.extend(reversed(lines))
+    return "\n".join(parts)
+
+
+class ChannelSummarizer:
+    """
+    [F-04] チャンネルごとのローリング要約
+    メッセージ数を数えておき、every 件ごとに「前回の要約 + その後のメッセージ」から要約を作り直して
+    DB (ログと同じテーブル) に保存する。要約の生成は summarize (LLM 呼び出し) に任せる。
+    件数はプロセス内で数えるので、複数インスタンスでは更新間隔がおおよそになる。
+    """
+
+    def __init__(self, summarize: Callable[[str, str], Optional[str]], every: int = CONTEXT_SUMMARY_EVERY):
+        self.summarize = summarize
+        self.every = every
+        self._counts = {}
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._counters = {"refreshed": 0, "failed": 0}
+
+    def note_message(self, channel_id: str) -> bool:
+        """メッセージを1件数える。要約を更新すべきタイミングなら True"""
+        if self.every <= 0:
+            return False
+        with self._lock:
+            count = self._counts.get(channel_id, 0) + 1
+            self._counts[channel_id] = count
+            return count % self.every == 0 and channel_id not in self._refreshing
+
+    def refresh(self, db, channel_id: str) -> Optional[str]:
+        """前回の要約とその後のメッセージから要約を作り直して保存する"""
+        with self._lock:
+            if channel_id in self._refreshing:
+                return None
+            self._refreshing.add(channel_id)
+        try:
+            previous = db.get_channel_summary(channel_id) or {}
+            items = db.get_recent_items(channel_id, limit=self.every)
+            transcript = "\n".join(
+                f"User {item.get('user_id', 'unknown')}: {compact_text(item.get('text') or '', budget=200)}"
+                for item in items
+            )
+            summary = self.summarize(previous.get("summary", ""), transcript)
+            if not summary:
+                raise ValueError("empty summary")
+            db.save_channel_summary(channel_id, summary, int(previous.get("message_count", 0)) + len(items))
+            _summary_cache.set(channel_id, summary)
+            with self._lock:
+                self._counters["refreshed"] += 1
+            return summary
+        except Exception as e:
+            logger.error(f"❌ Channel summary refresh failed for {channel_id}: {e}")
+            with self._lock:
+                self._counters["failed"] += 1
+            return None
+        finally:
+            with self._lock:
+                self._refreshing.discard(channel_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"channels": len(self._counts), "every": self.every, **self._counters}
+
+
+def _related_items(db, channel_id: str, query_text: str, exclude_ts: Optional[str]) -> List[dict]:
+    """ベクトル検索で質問に近い過去メッセージを引く (RAG_MODE=recent なら空)"""
+    retriever = get_retriever()
+    if retriever is None or not query_text:
+        return []
+    try:
+        hits = retriever.related(channel_id, query_text, k=RETRIEVAL_TOP_K, exclude_ts=exclude_ts)
+        return db.get_items_by_ts([ts for ts, _ in hits])
+    except Exception as e:
+        logger.error(f"❌ Retrieval failed, using recent history only: {e}")
+        return []
+
+
+def load_context(db, channel_id: str, limit: int = CONTEXT_HISTORY_LIMIT, budget: int = CONTEXT_TOKEN_BUDGET,
+                 query_text: Optional[str] = None, exclude_ts: Optional[str] = None) -> str:
+    """
+    要約と過去のメッセージを DB (キャッシュ) から読み、予算内の文脈にする。
+    RAG_MODE=recent は直近の履歴、retrieval は query_text に近いメッセージ、hybrid はその両方を使う。
+    """
+    summary = None
+    if CONTEXT_SUMMARY_EVERY > 0:
+        summary = _summary_cache.get(channel_id)
+        if summary is None:
+            record = db.get_channel_summary(channel_id)
+            summary = record.get("summary", "") if record else ""
+            _summary_cache.set(channel_id, summary)
+
+    related = _related_items(db, channel_id, query_text, exclude_ts)
+    items = []
+    if RAG_MODE != "retrieval" or not related:
+        try:
+            items = db.get_recent_items(channel_id, limit)
+        except Exception as e:
+            logger.error(f"❌ Error fetching history: {e}")
+
+    # 検索結果と直近の履歴を合わせ、ts の順に並べる (重複は除く)
+    merged = {item["ts"]: item for item in items + related}
+    return build_context(sorted(merged.values(), key=lambda x: x["ts"]), summary, budget)
@@ -1,34 +1,76 @@
 # backend/f04_gen/generator.py
 import os
-from google import genai
-from dotenv import load_dotenv
+import time
+import threading
+from typing import Callable, Optional
+from backend.common.config import load_env
 from backend.common.models import SlackMessage, FeedbackResponse
+from backend.common.model_invoker import get_invoker, ModelInvoker
+from backend.f04_gen.context import compact_text, CONTEXT_MESSAGE_TOKEN_BUDGET
+from backend.f04_gen.similarity import (
+    SIMILARITY_MODE, SIMILARITY_REUSE_THRESHOLD, SIMILARITY_HINT_THRESHOLD, SimilarMatch, get_similarity_index,
+)
 
 # 1. 環境変数の読み込み
-load_dotenv()
+load_env()
 
 # 2. Gemini APIの設定 (新ライブラリ版)
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise ValueError("⚠️ GEMINI_API_KEY が設定されていません")
 
-# 新しいクライアントの初期化
-client = genai.Client(api_key=GEMINI_API_KEY)
+# クライアントは初回の生成時に作る (google.genai の import は重く、コールドスタートを遅くするため)
+client = None
+_client_lock = threading.Lock()
+
+
+def _get_client():
+    global client
+    if client is None:
+        with _client_lock:
+            if client is None:
+                if not GEMINI_API_KEY:
+                    raise ValueError("⚠️ GEMINI_API_KEY が設定されていません")
+                from google import genai
+                client = genai.Client(api_key=GEMINI_API_KEY)
+    return client
 
 # backend/f04_gen/generator.py
 
 # ... (既存のインポートやクライアント初期化はそのまま) ...
 
-def generate_feedback(message: SlackMessage, context: str = "") -> FeedbackResponse:
-    """
-    [F-04] AIフィードバック生成 (RAG対応版)
-    context 引数を通じて、DynamoDBから取得した過去ログをプロンプトに注入します。
-    """
-    print(f"--- [F-04] Gemini Thinking with Context... (Intent: {message.intent_tag}) ---")
+# 生成に使うモデル
+GENERATION_MODEL = os.getenv("GENERATION_MODEL", "gemini-1.5-flash")
+# 1回の生成の締め切り (秒)。asyncio パイプラインの STAGE_TIMEOUT_GENERATE より短くしておく
+GENERATION_DEADLINE_SECONDS = float(os.getenv("GENERATION_DEADLINE_SECONDS", "25"))
 
-    try:
-        # 1. プロンプト（命令文）の構築
-        system_instruction = """
+# 生成できなかったとき (締め切り超過・API障害でブレーカーが開いている等) の定型の返信
+DEFERRED_REPLY_TEXT = "現在AIの応答が遅れているため、詳しいフィードバックは後ほどお送りします。"
+
+
+def _invoker(name: str = "generate", hedge: Optional[bool] = None) -> ModelInvoker:
+    """生成用のモデル呼び出し層 (締め切り・ヘッジ・サーキットブレーカー)"""
+    kwargs = {} if hedge is None else {"hedge": hedge}
+    return get_invoker(name, GENERATION_DEADLINE_SECONDS, **kwargs)
+
+
+def deferred_feedback(message: SlackMessage) -> FeedbackResponse:
+    """生成に失敗したときの定型の返信 (generate_feedback は None を返さず、これを返す)"""
+    return FeedbackResponse(
+        event_id=message.event_id,
+        target_user_id=message.user_id,
+        ts=message.ts,
+        feedback_summary=DEFERRED_REPLY_TEXT,
+        status="deferred"
+    )
+
+
+# 過去回答を再利用したときの前置き
+REUSED_PREFIX = "（過去の類似した質問への回答を再利用しています）\n"
+
+
+def build_contents(message: SlackMessage, context: str = "", similar: Optional[SimilarMatch] = None) -> str:
+    """プロンプト（命令文 + 過去の文脈 + 今回のメッセージ）を組み立てる"""
+    # 1. プロンプト（命令文）の構築
+    system_instruction = """
 あなたは高度なエンジニアリング・コミュニケーションの専門家「E3-Assist」です。
 Slack上の質問者と回答者のやり取りを解析し、両者の技術的成長を最大化するためのフィードバックを提供してください。
 
@@ -47,39 +89,215 @@ Slack上の質問者と回答者のやり取りを解析し、両者の技術的
 - (過去ログとの関連性や、会話の進捗に対する評価)
 【今回のメッセージへの改善点】
 - (具体的な改善アクション)
-        """
-        
-        # 2. 過去の文脈（RAG）と現在のメッセージを結合
-        user_query = f"""
-        【これまでの会話の流れ】
-        {context if context else "（過去のやり取りはありません）"}
-        
-        【今回のユーザーの状況】
-        ユーザーID: {message.user_id}
-        意図タグ: {message.intent_tag}
-        
-        【今回のメッセージ内容】
-        {message.text_content}
-        """
-        
-        # 3. 生成実行
-        response = client.models.generate_content(
-            model="gemini-1.5-flash",
-            contents=f"{system_instruction}\n\n{user_query}"
+    """
+    
+    # 2. 過去の文脈（RAG）と現在のメッセージを結合
+    user_query = f"""
+    【これまでの会話の流れ】
+    {context if context else "（過去のやり取りはありません）"}
+    
+    【今回のユーザーの状況】
+    ユーザーID: {message.user_id}
+    意図タグ: {message.intent_tag}
+    
+    【今回のメッセージ内容】
+    {compact_text(message.text_content, budget=CONTEXT_MESSAGE_TOKEN_BUDGET)}
+    """
+
+    # 3. 似た質問への過去の回答があればヒントとして添える
+    if similar is not None:
+        user_query += f"""
+    【過去の類似した質問と、そのときの回答 (類似度 {similar.similarity:.2f})】
+    質問: {similar.question}
+    回答: {similar.feedback}
+    """
+
+    return f"{system_instruction}\n\n{user_query}"
+
+
+def summarize_channel(previous_summary: str, transcript: str) -> Optional[str]:
+    """
+    [F-04] チャンネルのローリング要約を作る (ChannelSummarizer から呼ばれる)
+    前回の要約に、その後のやり取りを反映した新しい要約を返す。
+    """
+    contents = f"""
+以下は Slack のあるチャンネルでの技術的なやり取りです。
+「これまでの要約」に「新しいやり取り」の内容を反映し、400文字以内の箇条書きで要約し直してください。
+誰がどんな問題に取り組み、何が解決済みで何が未解決かを残し、雑談やログの細部は省いてください。
+
+【これまでの要約】
+{previous_summary or "（まだありません）"}
+
+【新しいやり取り】
+{transcript}
+    """
+    # 要約は返信を待たせないので、ヘッジはせず締め切りとブレーカーだけ使う
+    response = _invoker("summary", hedge=False).call(
+        lambda: _get_client().models.generate_content(model=GENERATION_MODEL, contents=contents)
+    )
+    return response.text.strip() if response.text else None
+
+
+def find_similar(message: SlackMessage) -> Optional[SimilarMatch]:
+    """回答済みの似た質問を探す (ヒントの閾値に届かなければ None)"""
+    index = get_similarity_index()
+    if index is None:
+        return None
+    try:
+        match = index.find(message.text_content)
+    except Exception as e:
+        print(f"Similarity Index Error: {e}")
+        return None
+    if match is None or match.similarity < SIMILARITY_HINT_THRESHOLD:
+        return None
+    return match
+
+
+def reuse_feedback(message: SlackMessage, similar: Optional[SimilarMatch]) -> Optional[FeedbackResponse]:
+    """十分に似た質問があれば、その回答を使い回した FeedbackResponse を返す"""
+    index = get_similarity_index()
+    if similar is None or index is None:
+        return None
+    if SIMILARITY_MODE != "reuse" or similar.similarity < SIMILARITY_REUSE_THRESHOLD:
+        index.record("hinted")
+        return None
+    index.record("reused")
+    print(f"♻️ Reusing feedback of {similar.event_id} (similarity {similar.similarity:.2f})")
+    return FeedbackResponse(
+        event_id=message.event_id,
+        target_user_id=message.user_id,
+        ts=message.ts,
+        feedback_summary=REUSED_PREFIX + similar.feedback,
+        status="reused"
+    )
+
+
+def remember_feedback(message: SlackMessage, feedback: str):
+    """生成した回答を類似検索用に登録する"""
+    index = get_similarity_index()
+    if index is None or not feedback:
+        return
+    try:
+        index.add(message.event_id, message.text_content, feedback)
+    except Exception as e:
+        print(f"Similarity Index Error: {e}")
+
+
+def generate_feedback(message: SlackMessage, context: str = "") -> FeedbackResponse:
+    """
+    [F-04] AIフィードバック生成 (RAG対応版)
+    context 引数を通じて、DynamoDBから取得した過去ログをプロンプトに注入します。
+    締め切り超過・API エラー・ブレーカー作動時は、定型の返信 (status="deferred") を返す。
+    """
+    print(f"--- [F-04] Gemini Thinking with Context... (Intent: {message.intent_tag}) ---")
+
+    similar = find_similar(message)
+    reused = reuse_feedback(message, similar)
+    if reused is not None:
+        return reused
+
+    contents = build_contents(message, context, similar)
+    try:
+        # 生成実行 (締め切り・ヘッジ・サーキットブレーカーつき)
+        response = _invoker().call(
+            lambda: _get_client().models.generate_content(model=GENERATION_MODEL, contents=contents)
         )
         
         ai_text = response.text.strip()
+        remember_feedback(message, ai_text)
 
         return FeedbackResponse(
             event_id=message.event_id,
             target_user_id=message.user_id,
+            ts=message.ts,
             feedback_summary=ai_text,
             status="complete"
         )
 
     except Exception as e:
         print(f"Gemini API Error: {e}")
-        # ... (エラー処理はそのまま) ...
+        return deferred_feedback(message)
+
+
+async def generate_feedback_async(message: SlackMessage, context: str = "") -> FeedbackResponse:
+    """
+    [F-04] generate_feedback の非同期版 (asyncio パイプライン用)
+    google.genai の非同期クライアント (client.aio) を使うので、生成待ちの間スレッドを占有しない。
+    """
+    print(f"--- [F-04] Gemini Thinking with Context (async)... (Intent: {message.intent_tag}) ---")
+
+    similar = find_similar(message)
+    reused = reuse_feedback(message, similar)
+    if reused is not None:
+        return reused
+
+    contents = build_contents(message, context, similar)
+    try:
+        response = await _invoker().call_async(
+            lambda: _get_client().aio.models.generate_content(model=GENERATION_MODEL, contents=contents)
+        )
+        ai_text = response.text.strip()
+        remember_feedback(message, ai_text)
+
+        return FeedbackResponse(
+            event_id=message.event_id,
+            target_user_id=message.user_id,
+            ts=message.ts,
+            feedback_summary=ai_text,
+            status="complete"
+        )
+
+    except Exception as e:
+        print(f"Gemini API Error (async): {e}")
+        return deferred_feedback(message)
+
+
+def generate_feedback_stream(message: SlackMessage, context: str = "",
+                             on_text: Optional[Callable[[str], None]] = None) -> FeedbackResponse:
+    """
+    [F-04] ストリーミング版のフィードバック生成
+    generate_content_stream で受け取った断片を溜めながら、ここまでの全文を on_text に渡す
+    (Slack のプレースホルダーを少しずつ更新するため)。
+    途中で失敗した・締め切りを過ぎた場合は、そこまでの文章を status="partial" で返す
+    (1文字も受け取れなかった場合は定型の返信)。
+    """
+    print(f"--- [F-04] Gemini Streaming with Context... (Intent: {message.intent_tag}) ---")
+
+    similar = find_similar(message)
+    reused = reuse_feedback(message, similar)
+    if reused is not None:
+        return reused
+
+    parts = []
+    contents = build_contents(message, context, similar)
+    invoker = _invoker("generate_stream", hedge=False)
+    deadline_at = time.monotonic() + GENERATION_DEADLINE_SECONDS
+    try:
+        stream = iter(_get_client().models.generate_content_stream(model=GENERATION_MODEL, contents=contents))
+        # 最初の断片はブレーカーつきで待つ (同じストリームを2本読めないのでヘッジはしない)
+        # 以降の断片も専用スレッドで読み、締め切りまでの残り時間だけ待つ (途中で止まったストリームで詰まらない)
+        chunk = invoker.call(lambda: next(stream, None))
+        while chunk is not None:
+            if chunk.text:
+                parts.append(chunk.text)
+                if on_text is not None:
+                    on_text("".join(parts))
+            chunk = invoker.call_until(lambda: next(stream, None), deadline_at)
+        status = "complete"
+        remember_feedback(message, "".join(parts).strip())
+    except Exception as e:
+        print(f"Gemini API Error (stream): {e}")
+        if not parts:
+            return deferred_feedback(message)
+        status = "partial"
+
+    return FeedbackResponse(
+        event_id=message.event_id,
+        target_user_id=message.user_id,
+        ts=message.ts,
+        feedback_summary="".join(parts).strip(),
+        status=status
+    )
 
 # 🧪 単体テスト用
 if __name__ == "__main__":
@@ -0,0 +1,325 @@
+import os
+import zlib
+import threading
+import logging
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+from backend.common.config import data_path
+from backend.f02_filter.local_model import extract_ngrams
+
+# ベクトル演算は numpy 任意 (無ければ RAG_MODE=recent のまま動く)
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# プロセス間の書き込みロック (POSIX のみ。無ければプロセス内のロックだけになる)
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------
+# 設定値 (環境変数で上書き可能)
+# ---------------------------------------------------------
+# "recent" (直近の履歴のみ) | "retrieval" (質問に近い過去メッセージのみ) | "hybrid" (両方)
+RAG_MODE = os.getenv("RAG_MODE", "recent")
+# "hashing" (ローカル・決定的) | "gemini" (Gemini の埋め込みAPI)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "hashing")
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "256"))
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-004")
+VECTOR_INDEX_PATH = os.getenv("VECTOR_INDEX_PATH", data_path("vector_index"))
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "5"))
+# これより似ていないものは文脈に入れない
+RETRIEVAL_MIN_SCORE = float(os.getenv("RETRIEVAL_MIN_SCORE", "0.2"))
+
+# 1行ぶんのメタデータ (固定長): Slack の ts (数値)、チャンネルID、ts (文字列)
+META_DTYPE = [("ts", "<f8"), ("channel_id", "S16"), ("msg_ts", "S24")] if np is not None else None
+# 行列積の一時メモリを抑えるため、この行数ずつ計算する
+_BLOCK_ROWS = 131072
+
+
+# ---------------------------------------------------------
+# 埋め込み
+# ---------------------------------------------------------
+class HashingEmbedder:
+    """
+    文字 n-gram を符号付きでハッシュして数える埋め込み (学習不要・オフラインで決定的)。
+    意味までは捉えないが、同じ単語・エラーメッセージを含むメッセージは近くなる。
+    """
+    name = "hashing"
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+
+    def embed(self, texts: List[str]) -> "np.ndarray":
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for gram in extract_ngrams(text, (2, 3)):
+                h = zlib.crc32(gram.encode("utf-8"))
+                out[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        return _normalize(out)
+
+
+class GeminiEmbedder:
+    """Gemini の埋め込みAPI (google.genai) を使う埋め込み"""
+    name = "gemini"
+
+    def __init__(self, model: str = EMBEDDING_MODEL, dim: int = EMBEDDING_DIM):
+        from google import genai
+        from google.genai import types
+        self.model = model
+        self.dim = dim
+        self._config = types.EmbedContentConfig(output_dimensionality=dim)
+        self._client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+
+    def embed(self, texts: List[str]) -> "np.ndarray":
+        response = self._client.models.embed_content(model=self.model, contents=texts, config=self._config)
+        return _normalize(np.asarray([e.values for e in response.embeddings], dtype=np.float32))
+
+
+def _normalize(vectors: "np.ndarray") -> "np.ndarray":
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def create_embedder(backend: str = EMBEDDING_BACKEND, dim: int = EMBEDDING_DIM):
+    if backend == "gemini":
+        return GeminiEmbedder(dim=dim)
+    return HashingEmbedder(dim=dim)
+
+
+# ---------------------------------------------------------
+# ベクトルインデックス
+# ---------------------------------------------------------
+class VectorIndex:
+    """
+    [F-04] メモリマップの追記専用ベクトルインデックス
+    <path>.f32 に正規化済みの float32 ベクトルを行ごとに、<path>.meta に固定長のメタデータを追記する。
+    起動時はファイルを読み込まずに np.memmap で写像するだけなので、件数が増えても起動は速い。
+    チャンネルごとの行番号はメタデータから作っておき、チャンネル内の検索は該当行だけを計算する。
+    複数プロセス (queue モードのワーカー) から追記できるよう、2つのファイルへの書き込みは
+    <path>.lock の flock で1件ずつにする。途中で落ちて行数がずれた場合は、次に書く前に揃え直す。
+    他のプロセスが追記した行は、検索時にファイルの大きさを見て写像し直す。
+    """
+
+    def __init__(self, path: str = VECTOR_INDEX_PATH, dim: int = EMBEDDING_DIM):
+        if np is None:
+            raise RuntimeError("numpy is required for VectorIndex")
+        self.dim = dim
+        self.vectors_path = f"{path}.f32"
+        self.meta_path = f"{path}.meta"
+        self._row_bytes = dim * 4
+        self._meta_dtype = np.dtype(META_DTYPE)
+        self._lock = threading.Lock()
+        self._lock_path = f"{path}.lock"
+
+        self._vectors = None
+        self._meta = None
+        self._rows = 0
+        self._channel_rows = {}  # channel_id (bytes) -> 行番号の配列
+        self._dirty = False      # 写像した後に追記があったか
+        self._counters = {"queries": 0, "added": 0}
+
+        directory = os.path.dirname(os.path.abspath(self.vectors_path))
+        os.makedirs(directory, exist_ok=True)
+        for p in (self.vectors_path, self.meta_path):
+            if not os.path.exists(p):
+                open(p, "wb").close()
+        with self._write_lock():
+            self._repair()
+        self._remap()
+
+    def __len__(self) -> int:
+        return self._rows
+
+    @contextmanager
+    def _write_lock(self):
+        """スレッド間は threading.Lock、プロセス間は flock で書き込みを1つずつにする"""
+        with self._lock, open(self._lock_path, "ab") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _disk_rows(self) -> int:
+        """両方のファイルに揃って書かれている行数"""
+        return min(os.path.getsize(self.vectors_path) // self._row_bytes,
+                   os.path.getsize(self.meta_path) // self._meta_dtype.itemsize)
+
+    def _repair(self):
+        """書き込み途中で落ちたときの半端な行を切り詰め、2つのファイルの行数を揃える (ロック中に呼ぶ)"""
+        rows = self._disk_rows()
+        for p, size in ((self.vectors_path, rows * self._row_bytes), (self.meta_path, rows * self._meta_dtype.itemsize)):
+            if os.path.getsize(p) != size:
+                logger.warning(f"⚠️ Vector index {p} has a partial write. Truncating to {rows} rows")
+                os.truncate(p, size)
+
+    def _remap(self):
+        """ファイルの現在の大きさで写像し直す (追記のたびではなく、検索時に必要なときだけ)"""
+        rows = self._disk_rows()
+        if rows == 0:
+            self._vectors, self._meta, self._rows = None, None, 0
+            return
+        self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+        self._meta = np.memmap(self.meta_path, dtype=self._meta_dtype, mode="r", shape=(rows,))
+
+        # 既に分かっている行より後ろだけを、チャンネルごとの行番号に加える
+        start = sum(len(v) for v in self._channel_rows.values())
+        if start < rows:
+            channels = self._meta["channel_id"][start:]
+            order = np.argsort(channels, kind="stable")
+            keys, first = np.unique(channels[order], return_index=True)
+            bounds = list(first) + [len(order)]
+            for i, key in enumerate(keys):
+                new_rows = order[bounds[i]:bounds[i + 1]] + start
+                existing = self._channel_rows.get(bytes(key))
+                self._channel_rows[bytes(key)] = new_rows if existing is None else np.concatenate([existing, new_rows])
+        self._rows = rows
+        self._dirty = False
+
+    def add(self, vectors: "np.ndarray", metas: List[Tuple[float, str, str]]):
+        """正規化済みベクトルと (ts, channel_id, msg_ts) を追記する"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        meta = np.array([(ts, channel.encode(), msg_ts.encode()) for ts, channel, msg_ts in metas], dtype=self._meta_dtype)
+        with self._write_lock():
+            self._repair()
+            with open(self.vectors_path, "ab") as f:
+                f.write(vectors.tobytes())
+            with open(self.meta_path, "ab") as f:
+                f.write(meta.tobytes())
+            self._dirty = True
+            self._counters["added"] += len(meta)
+
+    def search(self, query: "np.ndarray", k: int = RETRIEVAL_TOP_K, channel_id: Optional[str] = None,
+               since: Optional[float] = None, until: Optional[float] = None,
+               exclude_ts: Optional[str] = None) -> List[Tuple[str, str, float]]:
+        """コサイン類似度の上位 k 件 [(channel_id, msg_ts, score)] (新しい順ではなく類似度順)"""
+        with self._lock:
+            if self._dirty or self._disk_rows() > self._rows:
+                self._remap()
+            self._counters["queries"] += 1
+            vectors, meta = self._vectors, self._meta
+            rows = self._channel_rows.get(channel_id.encode()) if channel_id is not None else None
+        if vectors is None or (channel_id is not None and rows is None):
+            return []
+
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        if rows is not None:
+            candidates = rows
+            if since is not None or until is not None or exclude_ts is not None:
+                keep = np.ones(len(rows), dtype=bool)
+                ts = meta["ts"][rows]
+                if since is not None:
+                    keep &= ts >= since
+                if until is not None:
+                    keep &= ts < until
+                if exclude_ts is not None:
+                    keep &= meta["msg_ts"][rows] != exclude_ts.encode()
+                candidates = rows[keep]
+            scores = vectors[candidates] @ query
+            top = _top_k(scores, k)
+            picked = candidates[top]
+            picked_scores = scores[top]
+        else:
+            # チャンネル指定なし: ブロックごとに計算して上位だけを残す
+            picked_list, score_list = [], []
+            for start in range(0, len(vectors), _BLOCK_ROWS):
+                block = np.asarray(vectors[start:start + _BLOCK_ROWS]) @ query
+                block_meta = meta[start:start + _BLOCK_ROWS]
+                if since is not None:
+                    block[block_meta["ts"] < since] = -np.inf
+                if until is not None:
+                    block[block_meta["ts"] >= until] = -np.inf
+                if exclude_ts is not None:
+                    block[block_meta["msg_ts"] == exclude_ts.encode()] = -np.inf
+                top = _top_k(block, k)
+                picked_list.append(top + start)
+                score_list.append(block[top])
+            picked, picked_scores = np.concatenate(picked_list), np.concatenate(score_list)
+            top = _top_k(picked_scores, k)
+            picked, picked_scores = picked[top], picked_scores[top]
+
+        return [
+            (meta["channel_id"][i].decode(), meta["msg_ts"][i].decode(), float(s))
+            for i, s in zip(picked, picked_scores) if np.isfinite(s)
+        ]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"rows": self._rows, "dim": self.dim, "channels": len(self._channel_rows), **self._counters}
+
+
+def _top_k(scores: "np.ndarray", k: int) -> "np.ndarray":
+    """スコアの高い順に k 個の添字"""
+    if len(scores) <= k:
+        return np.argsort(-scores, kind="stable")
+    top = np.argpartition(-scores, k)[:k]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+# ---------------------------------------------------------
+# パイプラインから使う窓口
+# ---------------------------------------------------------
+class MessageRetriever:
+    """保存したメッセージを埋め込んでインデックスに追加し、質問に近い過去メッセージを引く"""
+
+    def __init__(self, embedder=None, index: Optional[VectorIndex] = None):
+        self.embedder = embedder or create_embedder()
+        self.index = index or VectorIndex(dim=self.embedder.dim)
+
+    def add_message(self, channel_id: str, ts: str, text: str):
+        if not text:
+            return
+        self.index.add(self.embedder.embed([text]), [(float(ts), channel_id, ts)])
+
+    def related(self, channel_id: str, text: str, k: int = RETRIEVAL_TOP_K, exclude_ts: Optional[str] = None,
+                since: Optional[float] = None) -> List[Tuple[str, float]]:
+        """同じチャンネルで text に近いメッセージの [(ts, score)]"""
+        query = self.embedder.embed([text])[0]
+        hits = self.index.search(query, k=k, channel_id=channel_id, since=since, exclude_ts=exclude_ts)
+        return [(msg_ts, score) for _, msg_ts, score in hits if score >= RETRIEVAL_MIN_SCORE]
+
+    def stats(self) -> dict:
+        return {"mode": RAG_MODE, "embedder": self.embedder.name, **self.index.stats()}
+
+
+def index_message(channel_id: str, ts: str, text: str):
+    """保存したメッセージをインデックスに加える (RAG_MODE=recent なら何もしない)"""
+    retriever = get_retriever()
+    if retriever is None:
+        return
+    try:
+        retriever.add_message(channel_id, ts, text)
+    except Exception as e:
+        # 検索用の索引が作れなくても本処理は続ける
+        logger.error(f"❌ Failed to index message {ts}: {e}")
+
+
+_retriever: Optional[MessageRetriever] = None
+_retriever_lock = threading.Lock()
+
+
+def get_retriever() -> Optional[MessageRetriever]:
+    """環境変数 RAG_MODE が retrieval / hybrid のときだけ作る (プロセスで1つ)"""
+    global _retriever
+    if RAG_MODE == "recent" or np is None:
+        return None
+    if _retriever is None:
+        with _retriever_lock:
+            if _retriever is None:
+                _retriever = MessageRetriever()
+                logger.info(f"Vector index mapped: {len(_retriever.index)} rows")
+    return _retriever
+
+
+def get_retrieval_stats() -> Optional[dict]:
+    """/stats 用 (使っていなければ None)"""
+    return _retriever.stats() if _retriever is not None else None
@@ -0,0 +1,309 @@
+import os
+import json
+import time
+import zlib
+import random
+import tempfile
+import atexit
+import threading
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+from backend.common.config import data_path
+from backend.f02_filter.intent_cache import normalize_text
+
+# プロセス間の保存ロック (POSIX のみ。無ければプロセス内の順番だけ守る)
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------
+# 設定値 (環境変数で上書き可能)
+# ---------------------------------------------------------
+# "off" | "hint" (似た過去回答をプロンプトに添える) | "reuse" (十分に似ていれば過去回答をそのまま使う)
+SIMILARITY_MODE = os.getenv("SIMILARITY_MODE", "hint")
+SIMILARITY_REUSE_THRESHOLD = float(os.getenv("SIMILARITY_REUSE_THRESHOLD", "0.85"))
+SIMILARITY_HINT_THRESHOLD = float(os.getenv("SIMILARITY_HINT_THRESHOLD", "0.5"))
+SIMILARITY_TTL_SECONDS = int(os.getenv("SIMILARITY_TTL_SECONDS", str(7 * 86400)))
+SIMILARITY_MAX_ENTRIES = int(os.getenv("SIMILARITY_MAX_ENTRIES", "20000"))
+# 空文字ならディスクに保存しない
+SIMILARITY_INDEX_PATH = os.getenv("SIMILARITY_INDEX_PATH", data_path("similarity_index.json"))
+# この件数を追加するごとにバックグラウンドで保存する
+SIMILARITY_SAVE_EVERY = int(os.getenv("SIMILARITY_SAVE_EVERY", "20"))
+
+# 日本語は単語に区切れないので、文字単位の shingle を使う
+SHINGLE_SIZE = 3
+NUM_PERM = 64
+# 16 バンド x 4 行: 類似度 0.5 前後から候補に上がり始める
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERM // LSH_BANDS
+
+_PRIME = (1 << 61) - 1
+_MASK = (1 << 32) - 1
+_rng = random.Random(1)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set:
+    normalized = normalize_text(text).replace(" ", "")
+    if len(normalized) <= size:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + size] for i in range(len(normalized) - size + 1)}
+
+
+def minhash(text: str) -> Tuple[int, ...]:
+    """文字 shingle の MinHash シグネチャ (NUM_PERM 個の最小ハッシュ値)"""
+    hashes = [zlib.crc32(s.encode("utf-8")) for s in shingles(text)]
+    if not hashes:
+        return tuple([_MASK] * NUM_PERM)
+    return tuple(min(((a * h + b) % _PRIME) & _MASK for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def estimate_similarity(sig_a, sig_b) -> float:
+    """一致するスロットの割合 ≒ shingle 集合の Jaccard 係数"""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERM
+
+
+def _bands(signature) -> List[tuple]:
+    return [(i, tuple(signature[i * LSH_ROWS:(i + 1) * LSH_ROWS])) for i in range(LSH_BANDS)]
+
+
+class SimilarMatch:
+    __slots__ = ("similarity", "question", "feedback", "event_id")
+
+    def __init__(self, similarity: float, question: str, feedback: str, event_id: str):
+        self.similarity = similarity
+        self.question = question
+        self.feedback = feedback
+        self.event_id = event_id
+
+
+class SimilarityIndex:
+    """
+    [F-04] 回答済みの質問の近似重複インデックス
+    質問文の MinHash を LSH のバケットに登録しておき、新しい質問と似たものを探す。
+    古いエントリは ttl_seconds で消え、SIMILARITY_INDEX_PATH があればディスクに保存・復元する。
+    保存は save_every 件ごとにバックグラウンドのスレッドが行い、add() を呼んだリクエストは待たない。
+    保存時はディスクの内容と突き合わせるので、複数プロセスが同じパスに保存しても互いのエントリは消えない。
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = SIMILARITY_INDEX_PATH,
+        ttl_seconds: int = SIMILARITY_TTL_SECONDS,
+        max_entries: int = SIMILARITY_MAX_ENTRIES,
+        save_every: int = SIMILARITY_SAVE_EVERY,
+    ):
+        self.path = path or None
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, max_entries)
+        self.save_every = max(1, save_every)
+
+        # event_id -> {"signature", "question", "feedback", "created_at"} (古い順)
+        self._entries = OrderedDict()
+        self._buckets = {}  # (band, band_hash) -> set(event_id)
+        self._lock = threading.Lock()
+        self._unsaved = 0
+        self._save_lock = threading.Lock()
+        self._save_requested = threading.Event()
+        self._saver = None
+        self._counters = {"lookups": 0, "reused": 0, "hinted": 0, "added": 0, "evicted": 0}
+
+        if self.path and os.path.exists(self.path):
+            self._load()
+        if self.path:
+            atexit.register(self.save)
+
+    # ---------------------------------------------------------
+    # 登録・検索
+    # ---------------------------------------------------------
+    def add(self, event_id: str, question: str, feedback: str, created_at: Optional[float] = None):
+        entry = {
+            "signature": minhash(question),
+            "question": question,
+            "feedback": feedback,
+            "created_at": created_at or time.time(),
+        }
+        with self._lock:
+            self._remove(event_id)
+            self._insert(event_id, entry)
+            self._evict()
+            self._counters["added"] += 1
+            self._unsaved += 1
+            should_save = self._unsaved >= self.save_every
+        if should_save:
+            self._request_save()
+
+    def find(self, question: str) -> Optional[SimilarMatch]:
+        """最も似ている回答済みの質問 (候補が無ければ None)"""
+        signature = minhash(question)
+        with self._lock:
+            self._evict()
+            self._counters["lookups"] += 1
+            candidates = set()
+            for band in _bands(signature):
+                candidates.update(self._buckets.get(band, ()))
+            best = None
+            for event_id in candidates:
+                entry = self._entries[event_id]
+                similarity = estimate_similarity(signature, entry["signature"])
+                if best is None or similarity > best.similarity:
+                    best = SimilarMatch(similarity, entry["question"], entry["feedback"], event_id)
+        return best
+
+    def record(self, outcome: str):
+        """find の結果をどう使ったか ("reused" / "hinted") を数える"""
+        with self._lock:
+            self._counters[outcome] += 1
+
+    def _insert(self, event_id: str, entry: dict):
+        self._entries[event_id] = entry
+        for band in _bands(entry["signature"]):
+            self._buckets.setdefault(band, set()).add(event_id)
+
+    def _remove(self, event_id: str):
+        entry = self._entries.pop(event_id, None)
+        if entry is None:
+            return
+        for band in _bands(entry["signature"]):
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(event_id)
+                if not bucket:
+                    del self._buckets[band]
+
+    def _evict(self):
+        """古い順に並んでいるので、先頭から期限切れ・上限超過の分を消す"""
+        deadline = time.time() - self.ttl_seconds
+        while self._entries:
+            event_id, entry = next(iter(self._entries.items()))
+            if entry["created_at"] >= deadline and len(self._entries) <= self.max_entries:
+                break
+            self._remove(event_id)
+            self._counters["evicted"] += 1
+
+    # ---------------------------------------------------------
+    # 永続化
+    # ---------------------------------------------------------
+    def _request_save(self):
+        """保存用のスレッドを起こす (初回に起動する)"""
+        if self._saver is None:
+            with self._lock:
+                if self._saver is None:
+                    self._saver = threading.Thread(target=self._save_loop, name="similarity-saver", daemon=True)
+                    self._saver.start()
+        self._save_requested.set()
+
+    def _save_loop(self):
+        while True:
+            self._save_requested.wait()
+            self._save_requested.clear()
+            self.save()
+
+    def save(self):
+        """
+        ディスクのファイルと自分のエントリを event_id で突き合わせて (created_at の新しい方を残して) 保存する。
+        queue モードのワーカーは各プロセスが別々にエントリを持つので、上書きすると他のプロセスの分が消えてしまう。
+        """
+        if not self.path:
+            return
+        # 保存どうしは順番に (古いスナップショットで新しいものを上書きしないよう、取るのもこの中で)
+        with self._save_lock, self._file_lock():
+            # 検索を止めるのはエントリの参照をコピーする間だけ (エントリの dict は登録後に書き換えない)
+            with self._lock:
+                items = list(self._entries.items())
+                self._unsaved = 0
+            merged = {item["event_id"]: item for item in self._read_entries(log_errors=False)}
+            for event_id, entry in items:
+                on_disk = merged.get(event_id)
+                if on_disk is None or entry["created_at"] >= on_disk["created_at"]:
+                    merged[event_id] = {"event_id": event_id, **{**entry, "signature": list(entry["signature"])}}
+            # 期限切れ・上限超過の分はディスクからも消す
+            deadline = time.time() - self.ttl_seconds
+            data = sorted((item for item in merged.values() if item["created_at"] >= deadline), key=lambda x: x["created_at"])
+            data = data[-self.max_entries:]
+            try:
+                directory = os.path.dirname(os.path.abspath(self.path))
+                # fcntl が無くロックできない環境でも、他のプロセスと一時ファイルがぶつからないように
+                fd, tmp = tempfile.mkstemp(dir=directory, prefix=os.path.basename(self.path), suffix=".tmp")
+                with open(fd, "w", encoding="utf-8") as f:
+                    json.dump({"num_perm": NUM_PERM, "shingle_size": SHINGLE_SIZE, "entries": data}, f, ensure_ascii=False)
+                os.replace(tmp, self.path)
+            except OSError as e:
+                logger.error(f"❌ Similarity index save failed: {e}")
+
+    @contextmanager
+    def _file_lock(self):
+        """同じファイルに保存する他のプロセスと、読み込み → 突き合わせ → 置き換えを1つずつにする"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(f"{self.path}.lock", "ab") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _read_entries(self, log_errors: bool = True) -> list:
+        """ディスクに保存されているエントリ (無い・壊れている・ハッシュの設定が違うなら空)"""
+        if not os.path.exists(self.path):
+            return []
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            if log_errors:
+                logger.error(f"❌ Similarity index load failed, starting empty: {e}")
+            return []
+        # ハッシュの設定が変わっていたらシグネチャは使えない
+        if data.get("num_perm") != NUM_PERM or data.get("shingle_size") != SHINGLE_SIZE:
+            return []
+        return data.get("entries", [])
+
+    def _load(self):
+        for item in sorted(self._read_entries(), key=lambda x: x["created_at"]):
+            event_id = item.pop("event_id")
+            item["signature"] = tuple(item["signature"])
+            self._insert(event_id, item)
+        self._evict()
+        logger.info(f"Similarity index loaded: {len(self._entries)} entries")
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            entries = len(self._entries)
+        lookups = counters["lookups"]
+        return {
+            "entries": entries,
+            "hit_rate": (counters["reused"] + counters["hinted"]) / lookups if lookups else 0.0,
+            # reuse した分だけ Gemini の生成を省けた
+            "saved_generation_calls": counters["reused"],
+            **counters,
+        }
+
+
+_index: Optional[SimilarityIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_similarity_index() -> Optional[SimilarityIndex]:
+    """環境変数 SIMILARITY_MODE に応じたインデックス (プロセスで1つ)。off なら None"""
+    global _index
+    if SIMILARITY_MODE == "off":
+        return None
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = SimilarityIndex()
+    return _index
+
+
+def get_similarity_stats() -> Optional[dict]:
+    """/stats 用 (まだ使われていなければ None)"""
+    return _index.stats() if _index is not None else None
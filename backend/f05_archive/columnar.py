@@ -0,0 +1,328 @@
+import os
+import glob
+import json
+import logging
+from datetime import datetime, date, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from backend.common.config import data_path
+from backend.f05_archive.writer import ARCHIVE_PATH, list_segments, open_segment
+
+# 列指向フォーマットは任意 (pyarrow があれば Parquet、無ければ NumPy の npz)
+try:
+    import pyarrow
+    import pyarrow.parquet as pq
+except ImportError:
+    pyarrow = None
+    pq = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------
+# 設定値 (環境変数で上書き可能)
+# ---------------------------------------------------------
+ARCHIVE_EXPORT_DIR = os.getenv("ARCHIVE_EXPORT_DIR", data_path("archive_columnar"))
+STATE_FILE = "_export_state.json"
+
+# 文字列の列 (辞書エンコードして保存する)
+STRING_COLUMNS = ["event_id", "user_id", "channel_id", "intent_tag", "status"]
+# 数値の列 (archived_at はエポックミリ秒、長さは文字数。無い場合は -1)
+INT_COLUMNS = ["archived_at", "answer_length", "text_length"]
+COLUMNS = INT_COLUMNS + STRING_COLUMNS
+
+
+def default_format() -> str:
+    if pq is not None:
+        return "parquet"
+    if np is not None:
+        return "npz"
+    raise RuntimeError("pyarrow or numpy is required for the columnar export")
+
+
+def _to_row(record: dict) -> Optional[dict]:
+    """アーカイブの1レコードを列の値に変換する (archived_at が読めないものは捨てる)"""
+    try:
+        archived_at = datetime.fromisoformat(record["archived_at"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    summary = record.get("feedback_summary")
+    text = record.get("text_content") or record.get("text")
+    return {
+        "archived_at": int(archived_at.timestamp() * 1000),
+        "answer_length": len(summary) if summary else -1,
+        "text_length": len(text) if text else -1,
+        "event_id": record.get("event_id") or "",
+        "user_id": record.get("user_id") or record.get("target_user_id") or "",
+        "channel_id": record.get("channel_id") or "",
+        "intent_tag": record.get("intent_tag") or "",
+        "status": record.get("status") or "",
+        "_day": archived_at.date().isoformat(),
+    }
+
+
+# ---------------------------------------------------------
+# パーティションの読み書き
+# ---------------------------------------------------------
+def _write_part(path: str, rows: List[dict], fmt: str):
+    if fmt == "parquet":
+        arrays = [pyarrow.array([r[c] for r in rows], type=pyarrow.int64()) for c in INT_COLUMNS]
+        arrays += [pyarrow.array([r[c] for r in rows]).dictionary_encode() for c in STRING_COLUMNS]
+        pq.write_table(pyarrow.Table.from_arrays(arrays, names=COLUMNS), path, compression="zstd")
+        return
+
+    # npz: 文字列は「コード (int32) + 辞書」に分けて持つ
+    columns = {c: np.array([r[c] for r in rows], dtype=np.int64) for c in INT_COLUMNS}
+    for c in STRING_COLUMNS:
+        values, codes = np.unique(np.array([r[c] for r in rows], dtype=object).astype(str), return_inverse=True)
+        columns[c] = codes.astype(np.int32)
+        columns[f"{c}__dict"] = values
+    np.savez_compressed(path, **columns)
+
+
+def _read_part(path: str, columns: Sequence[str]) -> Dict[str, "np.ndarray"]:
+    if path.endswith(".parquet"):
+        table = pq.read_table(path, columns=list(columns))
+        return {c: np.asarray(table.column(c).to_pylist(), dtype=object if c in STRING_COLUMNS else np.int64)
+                for c in columns}
+
+    out = {}
+    with np.load(path, allow_pickle=False) as data:
+        for c in columns:
+            if c in STRING_COLUMNS:
+                out[c] = data[f"{c}__dict"][data[c]]
+            else:
+                out[c] = data[c]
+    return out
+
+
+def _partition_dir(root: str, day: str) -> str:
+    return os.path.join(root, f"date={day}")
+
+
+def _part_files(directory: str) -> List[str]:
+    return sorted(glob.glob(os.path.join(directory, "part-*.parquet")) + glob.glob(os.path.join(directory, "part-*.npz")))
+
+
+# ---------------------------------------------------------
+# 差分エクスポート
+# ---------------------------------------------------------
+def _segment_key(path: str) -> str:
+    """圧縮前後で同じキーになるよう拡張子 (.gz / .zst) を外す"""
+    for suffix in (".gz", ".zst"):
+        if path.endswith(suffix):
+            return os.path.basename(path[:-len(suffix)])
+    return os.path.basename(path)
+
+
+def _read_head(path: str) -> Optional[str]:
+    with open_segment(path) as f:
+        line = f.readline()
+    return line.rstrip("\n") if line.endswith("\n") else None
+
+
+def _complete_lines(path: str, offset: int) -> Iterable[bytes]:
+    """
+    offset (非圧縮でのバイト位置) 以降の完結した行。書き込み途中の行は次回に回す。
+    非圧縮のセグメント (書き込み中のファイル) は offset へ seek し、圧縮済みは先頭から展開して読み飛ばす。
+    """
+    if path.endswith((".gz", ".zst")):
+        position = 0
+        with open_segment(path) as f:
+            for text in f:
+                line = text.encode("utf-8")
+                if not line.endswith(b"\n"):
+                    return
+                if position >= offset:
+                    yield line
+                position += len(line)
+        return
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                return
+            yield line
+
+
+def _read_lines(path: str, offset: int):
+    """offset (非圧縮でのバイト位置) 以降の完結した行を読む。戻り値: (レコードのリスト, 読み終えた位置)"""
+    records, position = [], offset
+    for line in _complete_lines(path, offset):
+        if line.strip():
+            try:
+                records.append(json.loads(line))
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                logger.warning(f"⚠️ Skipping broken archive line in {path} at {position}")
+        position += len(line)
+    return records, position
+
+
+def _load_state(root: str) -> dict:
+    path = os.path.join(root, STATE_FILE)
+    if not os.path.exists(path):
+        return {"segments_done": [], "active_head": None, "active_offset": 0}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_state(root: str, state: dict):
+    path = os.path.join(root, STATE_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def export_archive(archive_path: str = ARCHIVE_PATH, root: str = ARCHIVE_EXPORT_DIR, fmt: Optional[str] = None) -> dict:
+    """
+    [F-05] アーカイブ (JSONL) を日付パーティションの列指向ファイルへ差分エクスポートする。
+    ローテート済みのセグメントは名前で、書き込み中のファイルは (先頭行, バイト位置) で
+    どこまで書き出したかを _export_state.json に記録し、次回はその続きから読む。
+    """
+    fmt = fmt or default_format()
+    os.makedirs(root, exist_ok=True)
+    state = _load_state(root)
+    done = set(state["segments_done"])
+
+    active = os.path.abspath(archive_path)
+    rows_by_day: Dict[str, List[dict]] = {}
+    records_read = 0
+
+    for segment in list_segments(archive_path):
+        key = _segment_key(segment)
+        is_active = segment == active
+        if not is_active and key in done:
+            continue
+
+        # 前回「書き込み中」だったファイル (ローテート済みでも先頭行で分かる) は、その続きから読む
+        head = _read_head(segment)
+        resume = head is not None and head == state["active_head"]
+        records, position = _read_lines(segment, state["active_offset"] if resume else 0)
+
+        for record in records:
+            row = _to_row(record)
+            if row is not None:
+                rows_by_day.setdefault(row["_day"], []).append(row)
+        records_read += len(records)
+
+        if is_active:
+            state["active_head"], state["active_offset"] = head, position
+        else:
+            done.add(key)
+            if resume:
+                state["active_head"], state["active_offset"] = None, 0
+
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    ext = "parquet" if fmt == "parquet" else "npz"
+    for day, rows in rows_by_day.items():
+        directory = _partition_dir(root, day)
+        os.makedirs(directory, exist_ok=True)
+        _write_part(os.path.join(directory, f"part-{stamp}.{ext}"), rows, fmt)
+
+    state["segments_done"] = sorted(done)
+    _save_state(root, state)
+    return {"records": records_read, "partitions": sorted(rows_by_day), "format": fmt}
+
+
+def compact(root: str = ARCHIVE_EXPORT_DIR, fmt: Optional[str] = None) -> int:
+    """日付ごとに複数ある part ファイルを1つにまとめる。まとめたパーティション数を返す"""
+    fmt = fmt or default_format()
+    ext = "parquet" if fmt == "parquet" else "npz"
+    compacted = 0
+    for directory in sorted(glob.glob(os.path.join(root, "date=*"))):
+        parts = _part_files(directory)
+        if len(parts) < 2:
+            continue
+        merged = [_read_part(p, COLUMNS) for p in parts]
+        rows = [
+            {c: (part[c][i].item() if hasattr(part[c][i], "item") else part[c][i]) for c in COLUMNS}
+            for part in merged for i in range(len(part["archived_at"]))
+        ]
+        target = os.path.join(directory, f"part-compacted-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.{ext}")
+        _write_part(target, rows, fmt)
+        for p in parts:
+            os.remove(p)
+        compacted += 1
+    return compacted
+
+
+# ---------------------------------------------------------
+# 集計ヘルパー
+# ---------------------------------------------------------
+def _as_datetime(value) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, datetime.min.time())
+    return datetime.fromisoformat(value)
+
+
+def load_columns(columns: Iterable[str], start=None, end=None, root: str = ARCHIVE_EXPORT_DIR) -> Dict[str, "np.ndarray"]:
+    """
+    [start, end) の範囲の指定列だけを読む。
+    日付パーティションで読むファイルを絞ってから、archived_at で行を絞り込む。
+    """
+    if np is None:
+        raise RuntimeError("numpy is required to query the columnar export")
+    start, end = _as_datetime(start), _as_datetime(end)
+    wanted = list(dict.fromkeys(["archived_at", *columns]))
+
+    chunks = {c: [] for c in wanted}
+    for directory in sorted(glob.glob(os.path.join(root, "date=*"))):
+        day = date.fromisoformat(os.path.basename(directory)[len("date="):])
+        if start and day < start.date():
+            continue
+        if end and day > end.date():
+            continue
+        for part in _part_files(directory):
+            data = _read_part(part, wanted)
+            for c in wanted:
+                chunks[c].append(data[c])
+
+    result = {c: np.concatenate(chunks[c]) if chunks[c] else np.array([]) for c in wanted}
+    mask = np.ones(len(result["archived_at"]), dtype=bool)
+    if start:
+        mask &= result["archived_at"] >= int(start.timestamp() * 1000)
+    if end:
+        mask &= result["archived_at"] < int(end.timestamp() * 1000)
+    return {c: result[c][mask] for c in wanted}
+
+
+def _value_counts(values) -> Dict[str, int]:
+    if len(values) == 0:
+        return {}
+    keys, counts = np.unique(values.astype(str), return_counts=True)
+    order = np.argsort(-counts, kind="stable")
+    return {str(keys[i]): int(counts[i]) for i in order}
+
+
+def user_counts(start=None, end=None, root: str = ARCHIVE_EXPORT_DIR) -> Dict[str, int]:
+    """ユーザーごとの件数 (多い順)"""
+    return _value_counts(load_columns(["user_id"], start, end, root)["user_id"])
+
+
+def intent_distribution(start=None, end=None, root: str = ARCHIVE_EXPORT_DIR) -> Dict[str, int]:
+    """意図タグごとの件数 (返信しなかった雑談なども含む)"""
+    return _value_counts(load_columns(["intent_tag"], start, end, root)["intent_tag"])
+
+
+def answer_length_percentiles(start=None, end=None, percentiles: Sequence[float] = (50, 90, 99),
+                              root: str = ARCHIVE_EXPORT_DIR) -> Dict[str, float]:
+    """回答 (feedback_summary) の文字数のパーセンタイル"""
+    lengths = load_columns(["answer_length"], start, end, root)["answer_length"]
+    lengths = lengths[lengths >= 0]
+    if len(lengths) == 0:
+        return {}
+    values = np.percentile(lengths, percentiles)
+    return {f"p{p:g}": float(v) for p, v in zip(percentiles, values)}
+
+
+def day_range(days: int) -> tuple:
+    """直近 days 日分の (start, end)"""
+    end = datetime.now()
+    return end - timedelta(days=days), end
@@ -1,32 +1,61 @@
 # backend/f05_archive/main.py
-from backend.common.models import FeedbackResponse
-from backend.f03_db.database import save_to_db
+from datetime import datetime
+from typing import Optional
+from backend.common.models import FeedbackResponse, SlackMessage
+from backend.f05_archive.writer import ARCHIVE_PATH, get_archive_writer
 
-def archive_process(response: FeedbackResponse) -> bool:
+# アーカイブ先 (JSONL)。DB にはパイプライン内で save_feedback 済みなので、ここでは書かない
+# 書き込み・ローテート・圧縮は writer.ArchiveWriter がバックグラウンドで行う
+
+
+def archive_process(response: FeedbackResponse, message: Optional[SlackMessage] = None) -> bool:
     """
-    [F-05] アーカイブ処理 (DynamoDBへの最終ステータス記録)
+    [F-05] アーカイブ処理 (ローカル JSONL への全ログ蓄積)
     
     F-04(Generator)から受け取った回答データ(FeedbackResponse)を、
-    F-03(Database)の機能を使って永続化する。
+    将来の学習用に local_history.jsonl へ追記保存する。
+    (DB レコードは F-03 の save_feedback で更新済みなので、ここで3回目の DB 書き込みはしない)
+    実際の書き込みは ArchiveWriter のスレッドが行うため、ここではキューに積むだけ。
     
     Args:
         response (FeedbackResponse): AI生成結果を含んだ完了データ
+        message (SlackMessage, optional): 元メッセージ (チャンネル・意図・本文も残す)
         
     Returns:
-        bool: アーカイブ(DB更新)が成功すればTrue
+        bool: アーカイブキューに積めればTrue
     """
-    print(f"--- 💾 [F-05] Archiving Process Start: {response.event_id} ---")
-    
-    # 1. DB更新処理を呼び出す (F-03へ委譲)
-    # 自分で保存処理を書くのではなく、database.py の update_feedback を使う
-    success = save_to_db(response)
-    
-    if success:
-        print(f"✅ Archive Complete: Event {response.event_id} is now closed.")
+    record = response.to_dict()
+    if message is not None:
+        record["channel_id"] = message.channel_id
+        record["user_id"] = message.user_id
+        record["intent_tag"] = message.intent_tag
+        record["intent_source"] = message.intent_source
+        record["text_content"] = message.text_content
+    record["archived_at"] = datetime.now().isoformat()
+
+    if get_archive_writer().write(record):
         return True
-    else:
-        print(f"❌ Archive Failed: Could not update DB for {response.event_id}")
-        return False
+    print(f"❌ Archive Failed: Queue is full or closed, dropped {response.event_id}")
+    return False
+
+
+def archive_message(message: SlackMessage) -> bool:
+    """
+    返信しなかったメッセージ (雑談など) も判定結果付きで残す。
+    意図の分布や学習データ (tools/train_intent_model.py) に使う。
+    """
+    record = {
+        "event_id": message.event_id,
+        "channel_id": message.channel_id,
+        "user_id": message.user_id,
+        "ts": message.ts,
+        "intent_tag": message.intent_tag,
+        "intent_source": message.intent_source,
+        "text_content": message.text_content,
+        "status": "skipped",
+        "archived_at": datetime.now().isoformat(),
+    }
+    return get_archive_writer().write(record)
 
 # 🧪 単体テスト用ブロック
 if __name__ == "__main__":
@@ -34,13 +63,12 @@ if __name__ == "__main__":
     test_response = FeedbackResponse(
         event_id="TEST_ARCHIVE_001",
         target_user_id="U_TEST_ARCHIVER",
+        ts="0000000000.000000",
         feedback_summary="【F-05テスト】アーカイブ機能の正常性を確認しました。",
         status="complete"
     )
     
-    # ※注意: 単体テストでこれを成功させるには、
-    # 先にDynamoDB上に "TEST_ARCHIVE_001" というIDを持つデータが存在している必要があります。
-    # (update_itemは既存データがないと更新できない場合があるため)
-    
-    # 実行
-    archive_process(test_response)
\ No newline at end of file
+    # 実行 (キューに積んだあと、close で書き出しを待つ)
+    archive_process(test_response)
+    get_archive_writer().close()
+    print(f"✅ Archived to {ARCHIVE_PATH}")
\ No newline at end of file
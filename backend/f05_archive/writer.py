@@ -0,0 +1,309 @@
+import os
+import io
+import glob
+import gzip
+import json
+import queue
+import atexit
+import shutil
+import threading
+import logging
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterator, Optional
+
+from backend.common.config import data_path
+
+# zstd は任意 (入っていなければ gzip を使う)
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# プロセス間の書き込みロック (POSIX のみ。無ければプロセス間の調整はしない)
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------
+# 設定値 (環境変数で上書き可能)
+# ---------------------------------------------------------
+# 既定はリポジトリ管理外の DATA_DIR の下 (リポジトリの local_history.jsonl はサンプル)
+ARCHIVE_PATH = os.getenv("ARCHIVE_PATH", data_path("local_history.jsonl"))
+# "always" (書くたびに fsync) | "interval" (ARCHIVE_FSYNC_INTERVAL 秒ごと) | "never" (OS任せ)
+ARCHIVE_FSYNC = os.getenv("ARCHIVE_FSYNC", "interval")
+ARCHIVE_FSYNC_INTERVAL = float(os.getenv("ARCHIVE_FSYNC_INTERVAL", "1.0"))
+# 0 ならサイズでは切り替えない
+ARCHIVE_ROTATE_BYTES = int(os.getenv("ARCHIVE_ROTATE_BYTES", str(64 * 1024 * 1024)))
+ARCHIVE_ROTATE_DAILY = os.getenv("ARCHIVE_ROTATE_DAILY", "true").lower() == "true"
+# "gzip" | "zstd" | "none"
+ARCHIVE_COMPRESSION = os.getenv("ARCHIVE_COMPRESSION", "gzip")
+ARCHIVE_QUEUE_SIZE = int(os.getenv("ARCHIVE_QUEUE_SIZE", "100000"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+
+_STOP = object()
+
+
+def _compress_file(path: str, compression: str):
+    """ローテート済みのセグメントを圧縮し、元ファイルを消す"""
+    if compression == "zstd" and zstandard is not None:
+        with open(path, "rb") as src, open(path + ".zst", "wb") as dst:
+            zstandard.ZstdCompressor(level=3).copy_stream(src, dst)
+    elif compression in ("gzip", "zstd"):
+        with open(path, "rb") as src, gzip.open(path + ".gz", "wb", compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst)
+    else:
+        return
+    os.remove(path)
+
+
+class ArchiveWriter:
+    """
+    [F-05] 非同期バッファ付き JSONL アーカイブ
+    パイプラインは write() でキューに積むだけ。バックグラウンドのスレッドがまとめて追記し、
+    サイズ・日付でファイルをローテートして、ローテート済みのセグメントは圧縮する。
+    queue モードではワーカーの各プロセスが同じファイルに書くので、追記とローテートは <path>.lock の
+    flock の中で行い、他のプロセスがローテートしていた (開いているファイルと path の inode が違う) ら開き直す。
+    """
+
+    def __init__(
+        self,
+        path: str = ARCHIVE_PATH,
+        fsync: str = ARCHIVE_FSYNC,
+        fsync_interval: float = ARCHIVE_FSYNC_INTERVAL,
+        rotate_bytes: int = ARCHIVE_ROTATE_BYTES,
+        rotate_daily: bool = ARCHIVE_ROTATE_DAILY,
+        compression: str = ARCHIVE_COMPRESSION,
+        queue_size: int = ARCHIVE_QUEUE_SIZE,
+        batch_size: int = ARCHIVE_BATCH_SIZE,
+    ):
+        if compression == "zstd" and zstandard is None:
+            logger.warning("⚠️ zstandard is not installed. Falling back to gzip for archive segments.")
+            compression = "gzip"
+
+        self.path = os.path.abspath(path)
+        self._lock_path = f"{self.path}.lock"
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.rotate_bytes = rotate_bytes
+        self.rotate_daily = rotate_daily
+        self.compression = compression
+        self.batch_size = max(1, batch_size)
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._file = None
+        self._file_day = None
+        self._compressors = []
+        self._last_fsync = 0.0
+        self._closed = False
+        self._counters = {"enqueued": 0, "written": 0, "dropped": 0, "batches": 0, "rotations": 0, "errors": 0}
+
+        self._thread = threading.Thread(target=self._loop, name="archive-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ---------------------------------------------------------
+    # 公開API
+    # ---------------------------------------------------------
+    def write(self, record: dict) -> bool:
+        """キューに積むだけ (ブロックしない)。キューが満杯なら捨てて False"""
+        if self._closed:
+            return False
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self._counters["dropped"] += 1
+            return False
+        with self._lock:
+            self._counters["enqueued"] += 1
+        return True
+
+    def close(self, timeout: float = 10):
+        """残りを書き出してからファイルを閉じる"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout=timeout)
+        for t in self._compressors:
+            t.join(timeout=timeout)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+        return {"queue_depth": self._queue.qsize(), "path": self.path, "compression": self.compression, **counters}
+
+    # ---------------------------------------------------------
+    # 書き込みスレッド
+    # ---------------------------------------------------------
+    def _loop(self):
+        stop = False
+        while not stop:
+            # 最初の1件は待ち、あとはキューに溜まっている分をまとめて取る
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if any(item is _STOP for item in batch):
+                stop = True
+                batch = [item for item in batch if item is not _STOP]
+
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    with self._lock:
+                        self._counters["errors"] += 1
+                    logger.error(f"❌ Archive write failed ({len(batch)} records): {e}")
+
+        if self._file is not None:
+            self._sync(force=True)
+            self._file.close()
+            self._file = None
+
+    def _write_batch(self, batch: list):
+        data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in batch)
+        with self._file_lock():
+            self._reopen_if_rotated()
+            self._maybe_rotate()
+            self._open().write(data.encode("utf-8"))
+            self._sync()
+        with self._lock:
+            self._counters["written"] += len(batch)
+            self._counters["batches"] += 1
+
+    @contextmanager
+    def _file_lock(self):
+        """同じアーカイブに書く他のプロセスと、追記・ローテートを1つずつにする"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self._lock_path, "ab") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _reopen_if_rotated(self):
+        """他のプロセスがローテートして path が別のファイルになっていたら、古い方を閉じる (次の _open で開き直す)"""
+        if self._file is None:
+            return
+        try:
+            rotated = os.stat(self.path).st_ino != os.fstat(self._file.fileno()).st_ino
+        except FileNotFoundError:
+            rotated = True
+        if rotated:
+            self._sync(force=True)
+            self._file.close()
+            self._file = None
+
+    def _open(self) -> io.BufferedWriter:
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._file = open(self.path, "ab")
+            # 既存ファイルに追記する場合は、その最終更新日を「ファイルの日付」とする
+            mtime = os.path.getmtime(self.path) if self._file.tell() else time.time()
+            self._file_day = datetime.fromtimestamp(mtime).date()
+        return self._file
+
+    def _sync(self, force: bool = False):
+        self._file.flush()
+        if self.fsync == "always" or force:
+            os.fsync(self._file.fileno())
+        elif self.fsync == "interval":
+            now = time.monotonic()
+            if now - self._last_fsync >= self.fsync_interval:
+                os.fsync(self._file.fileno())
+                self._last_fsync = now
+
+    def _maybe_rotate(self):
+        if self._file is None and not os.path.exists(self.path):
+            return
+        f = self._open()
+        # 他のプロセスの追記も含めた大きさで判断する
+        size = os.fstat(f.fileno()).st_size
+        too_big = self.rotate_bytes and size >= self.rotate_bytes
+        new_day = self.rotate_daily and self._file_day != datetime.now().date()
+        if not (too_big or new_day) or size == 0:
+            return
+
+        self._sync(force=True)
+        f.close()
+        self._file = None
+
+        stem, ext = os.path.splitext(self.path)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        segment = f"{stem}.{stamp}{ext}"
+        os.rename(self.path, segment)
+        with self._lock:
+            self._counters["rotations"] += 1
+        logger.info(f"Archive rotated: {segment}")
+
+        # 圧縮は書き込みを止めないよう別スレッドで
+        if self.compression in ("gzip", "zstd"):
+            t = threading.Thread(target=_compress_file, args=(segment, self.compression), daemon=True)
+            t.start()
+            self._compressors = [c for c in self._compressors if c.is_alive()] + [t]
+
+
+def list_segments(path: str = ARCHIVE_PATH) -> list:
+    """ローテート済みセグメント (古い順) + 現在のファイル"""
+    stem, ext = os.path.splitext(os.path.abspath(path))
+    segments = set()
+    for pattern in (f"{stem}.*{ext}", f"{stem}.*{ext}.gz", f"{stem}.*{ext}.zst"):
+        segments.update(glob.glob(pattern))
+    # 圧縮中で両方ある場合は、圧縮前のファイルを優先する
+    plain = {s for s in segments if s.endswith(ext)}
+    segments = {s for s in segments if s.endswith(ext) or s.rsplit(".", 1)[0] not in plain}
+    ordered = sorted(segments)
+    if os.path.exists(path):
+        ordered.append(os.path.abspath(path))
+    return ordered
+
+
+def open_segment(path: str):
+    """圧縮形式に合わせてセグメントをテキストとして開く"""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(f"zstandard is required to read {path}")
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, "rb")), encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def iter_archive(path: str = ARCHIVE_PATH) -> Iterator[dict]:
+    """全セグメントのレコードを古い順に読む"""
+    for segment in list_segments(path):
+        with open_segment(segment) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+
+_writer: Optional[ArchiveWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_archive_writer() -> ArchiveWriter:
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = ArchiveWriter()
+    return _writer
+
+
+def get_archive_stats() -> Optional[dict]:
+    """/stats 用 (まだ1件もアーカイブしていなければ None)"""
+    return _writer.stats() if _writer is not None else None
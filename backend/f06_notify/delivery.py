@@ -0,0 +1,328 @@
+import os
+import heapq
+import random
+import atexit
+import threading
+import itertools
+import logging
+import time
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from slack_sdk.errors import SlackApiError
+
+from backend.common.models import FeedbackResponse
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------
+# 設定値 (環境変数で上書き可能)
+# ---------------------------------------------------------
+# "queue" (送信キュー経由) | "direct" (パイプラインのスレッドから直接 chat_postMessage)
+SLACK_DELIVERY_MODE = os.getenv("SLACK_DELIVERY_MODE", "queue")
+SLACK_DELIVERY_WORKERS = int(os.getenv("SLACK_DELIVERY_WORKERS", "2"))
+# chat.postMessage はチャンネルごとに概ね1秒1件まで (短いバーストは許容される)
+SLACK_CHANNEL_RATE = float(os.getenv("SLACK_CHANNEL_RATE", "1.0"))
+SLACK_CHANNEL_BURST = float(os.getenv("SLACK_CHANNEL_BURST", "3"))
+SLACK_DELIVERY_MAX_ATTEMPTS = int(os.getenv("SLACK_DELIVERY_MAX_ATTEMPTS", "5"))
+# 長いフィードバックはこの文字数ごとに分けてスレッドに投稿する (0 なら分けない)
+SLACK_REPLY_CHUNK_CHARS = int(os.getenv("SLACK_REPLY_CHUNK_CHARS", "3500"))
+SLACK_DELIVERY_DRAIN_TIMEOUT = float(os.getenv("SLACK_DELIVERY_DRAIN_TIMEOUT", "15"))
+
+# 再送しても結果が変わらないエラー
+PERMANENT_ERRORS = {
+    "channel_not_found", "not_in_channel", "is_archived", "invalid_auth", "account_inactive",
+    "token_revoked", "no_permission", "missing_scope", "msg_too_long", "thread_not_found",
+}
+
+
+class TokenBucket:
+    """チャンネルごとのトークンバケット (rate 件/秒、最大 burst 件まで貯まる)"""
+
+    def __init__(self, rate: float = SLACK_CHANNEL_RATE, burst: float = SLACK_CHANNEL_BURST):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self._state = {}  # channel_id -> [tokens, last_refill, paused_until]
+        self._lock = threading.Lock()
+
+    def try_acquire(self, channel_id: str) -> float:
+        """トークンを1つ取る。取れたら 0、取れなければ次に取れるまでの秒数を返す"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last, paused_until = self._state.get(channel_id, (self.burst, now, 0.0))
+            if paused_until > now:
+                return paused_until - now
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens >= 1.0:
+                self._state[channel_id] = [tokens - 1.0, now, 0.0]
+                return 0.0
+            self._state[channel_id] = [tokens, now, 0.0]
+            return (1.0 - tokens) / self.rate
+
+    def acquire(self, channel_id: str, timeout: float) -> bool:
+        """トークンが取れるまで待つ (timeout 秒以内に取れなければ False)"""
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(channel_id)
+            if wait == 0:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def pause(self, channel_id: str, seconds: float):
+        """429 (Retry-After) を受けたチャンネルは、その間トークンを出さない"""
+        now = time.monotonic()
+        with self._lock:
+            _, _, paused_until = self._state.get(channel_id, (0.0, now, 0.0))
+            self._state[channel_id] = [0.0, now + seconds, max(paused_until, now + seconds)]
+
+
+def split_message(text: str, limit: int = SLACK_REPLY_CHUNK_CHARS) -> List[str]:
+    """段落 → 行 → 文字数の順で区切りを探し、limit 文字以下に分ける"""
+    if not limit or len(text) <= limit:
+        return [text]
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind("\n\n", 0, limit)
+        if cut < limit // 2:
+            cut = text.rfind("\n", 0, limit)
+        if cut < limit // 2:
+            cut = limit
+        chunks.append(text[:cut].rstrip())
+        text = text[cut:].lstrip("\n")
+    if text:
+        chunks.append(text)
+    return chunks
+
+
+class _Job:
+    __slots__ = ("response", "channel_id", "chunks", "posted", "attempts", "chunk_attempts", "on_receipt", "error")
+
+    def __init__(self, response: FeedbackResponse, channel_id: str, chunks: List[str], on_receipt):
+        self.response = response
+        self.channel_id = channel_id
+        self.chunks = chunks
+        self.posted = []    # 投稿できたメッセージの ts
+        self.attempts = 0        # 全体の試行回数 (レシート用)
+        self.chunk_attempts = 0  # 今送ろうとしている1通の試行回数 (再送の上限はこちらで数える)
+        self.on_receipt = on_receipt
+        self.error = None
+
+
+class DeliveryQueue:
+    """
+    [F-06] Slack への送信キュー
+    パイプラインは enqueue() で積むだけ。送信ワーカーがチャンネルごとのトークンバケットに従って
+    chat_postMessage を呼び、429 は Retry-After (+ジッター) だけ待って再送する。
+    送れないチャンネルのジョブは後ろに回すので、他のチャンネルの送信は止まらない。
+    長いフィードバックは分割し、同じスレッドに順番に投稿する。
+    結果 (配信レシート) は on_receipt に渡す。
+    """
+
+    def __init__(
+        self,
+        client,
+        workers: int = SLACK_DELIVERY_WORKERS,
+        bucket: Optional[TokenBucket] = None,
+        max_attempts: int = SLACK_DELIVERY_MAX_ATTEMPTS,
+        chunk_chars: int = SLACK_REPLY_CHUNK_CHARS,
+        on_receipt: Optional[Callable[[FeedbackResponse, dict], None]] = None,
+    ):
+        self.client = client
+        self.workers = max(1, workers)
+        self.bucket = bucket or TokenBucket()
+        self.max_attempts = max(1, max_attempts)
+        self.chunk_chars = chunk_chars
+        self.on_receipt = on_receipt
+
+        self._heap = []  # (実行可能時刻, 連番, job)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._closed = False
+        self._in_progress = 0
+        self._counters = {"enqueued": 0, "delivered": 0, "failed": 0, "posts": 0, "retries": 0, "rate_limited": 0}
+
+    # ---------------------------------------------------------
+    # 公開API
+    # ---------------------------------------------------------
+    def enqueue(self, response: FeedbackResponse, channel_id: str,
+                on_receipt: Optional[Callable[[FeedbackResponse, dict], None]] = None) -> bool:
+        if self._closed:
+            return False
+        self._ensure_started()
+        job = _Job(response, channel_id, split_message(response.feedback_summary, self.chunk_chars),
+                   on_receipt or self.on_receipt)
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic(), next(self._seq), job))
+            self._counters["enqueued"] += 1
+            self._cond.notify()
+        return True
+
+    def deliver(self, response: FeedbackResponse, channel_id: str, timeout: float) -> Optional[dict]:
+        """
+        enqueue して、送り終わる (配信レシートが出る) まで待つ。timeout までに終わらなければ None
+        レシートはいつもどおり on_receipt にも渡す
+        """
+        done = threading.Event()
+        result = {}
+
+        def on_receipt(delivered: FeedbackResponse, receipt: dict):
+            try:
+                if self.on_receipt is not None:
+                    self.on_receipt(delivered, receipt)
+            finally:
+                result.update(receipt)
+                done.set()
+
+        if not self.enqueue(response, channel_id, on_receipt=on_receipt):
+            return None
+        return result if done.wait(timeout) else None
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"pending": len(self._heap), "in_progress": self._in_progress, "workers": self.workers,
+                    **self._counters}
+
+    def close(self, timeout: float = SLACK_DELIVERY_DRAIN_TIMEOUT):
+        """残っている送信を (timeout まで) 終わらせてから止める"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            if self._closed:
+                return
+            while (self._heap or self._in_progress) and time.monotonic() < deadline:
+                self._cond.wait(timeout=max(0.0, min(0.5, deadline - time.monotonic())))
+            self._closed = True
+            if self._heap:
+                logger.warning(f"⚠️ {len(self._heap)} Slack replies not delivered before shutdown.")
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join(timeout=1)
+
+    # ---------------------------------------------------------
+    # 送信ワーカー
+    # ---------------------------------------------------------
+    def _ensure_started(self):
+        if self._threads:
+            return
+        with self._cond:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._loop, name=f"slack-delivery-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+        atexit.register(self.close)
+
+    def _next_job(self) -> Optional[_Job]:
+        with self._cond:
+            while not self._closed:
+                if self._heap:
+                    wait = self._heap[0][0] - time.monotonic()
+                    if wait <= 0:
+                        self._in_progress += 1
+                        return heapq.heappop(self._heap)[2]
+                    self._cond.wait(timeout=wait)
+                else:
+                    self._cond.wait()
+            return None
+
+    def _schedule(self, job: _Job, delay: float):
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), job))
+            self._cond.notify()
+
+    def _loop(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            try:
+                self._step(job)
+            finally:
+                with self._cond:
+                    self._in_progress -= 1
+                    self._cond.notify_all()
+
+    def _step(self, job: _Job):
+        """ジョブの次の1通を送る (送れなければ待ち時間を付けて積み直す)"""
+        wait = self.bucket.try_acquire(job.channel_id)
+        if wait > 0:
+            self._schedule(job, wait)
+            return
+
+        job.attempts += 1
+        job.chunk_attempts += 1
+        try:
+            # 2通目以降も元のメッセージのスレッドにぶら下げる
+            result = self.client.chat_postMessage(
+                channel=job.channel_id,
+                text=job.chunks[len(job.posted)],
+                thread_ts=job.response.ts,
+            )
+            with self._cond:
+                self._counters["posts"] += 1
+            job.posted.append(result.get("ts"))
+            job.chunk_attempts = 0
+            if len(job.posted) == len(job.chunks):
+                self._finish(job, "delivered")
+            else:
+                self._schedule(job, 0)
+            return
+        except SlackApiError as e:
+            error = e.response.get("error") if e.response is not None else str(e)
+            status = getattr(e.response, "status_code", None)
+            if status == 429 or error == "ratelimited":
+                retry_after = float(e.response.headers.get("Retry-After", 1)) if e.response is not None else 1.0
+                # 同じチャンネルへの他のジョブも止め、ワーカーが揃って再送しないよう少しずらす
+                delay = retry_after + random.uniform(0, min(1.0, retry_after))
+                self.bucket.pause(job.channel_id, retry_after)
+                with self._cond:
+                    self._counters["rate_limited"] += 1
+                job.error = "ratelimited"
+                if job.chunk_attempts < self.max_attempts:
+                    self._retry(job, delay)
+                    return
+            elif error in PERMANENT_ERRORS:
+                job.error = error
+                self._finish(job, "failed")
+                return
+            else:
+                job.error = error
+        except Exception as e:
+            job.error = str(e)
+
+        if job.chunk_attempts < self.max_attempts:
+            # 一時的な失敗は指数バックオフ + ジッター
+            self._retry(job, random.uniform(0, min(30.0, 0.5 * 2 ** job.chunk_attempts)))
+        else:
+            self._finish(job, "failed")
+
+    def _retry(self, job: _Job, delay: float):
+        with self._cond:
+            self._counters["retries"] += 1
+        logger.warning(f"⚠️ Slack delivery retry for {job.response.event_id} in {delay:.1f}s ({job.error})")
+        self._schedule(job, delay)
+
+    def _finish(self, job: _Job, status: str):
+        with self._cond:
+            self._counters[status] += 1
+        receipt = {
+            "status": status,
+            "channel_id": job.channel_id,
+            "message_ts": job.posted,
+            "chunks": len(job.chunks),
+            "attempts": job.attempts,
+            "delivered_at": datetime.now().isoformat(),
+            "error": job.error if status == "failed" else None,
+        }
+        if status == "delivered":
+            print(f"✅ Message sent successfully to {job.channel_id} ({len(job.chunks)} chunks, {job.attempts} attempts)")
+        else:
+            print(f"❌ Slack delivery failed for {job.response.event_id}: {job.error}")
+        if job.on_receipt is not None:
+            try:
+                job.on_receipt(job.response, receipt)
+            except Exception as e:
+                logger.error(f"❌ Failed to record delivery receipt: {e}")
@@ -1,20 +1,38 @@
 import os
 import sys
+import time
+import asyncio
+import threading
+from datetime import datetime
+from typing import Optional
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
-from dotenv import load_dotenv
 
 # プロジェクトのルートディレクトリをパスに追加
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../../")
 
+from backend.common.config import load_env
 from backend.common.models import FeedbackResponse
+from backend.f06_notify.delivery import DeliveryQueue, SLACK_DELIVERY_MODE
 
 # 環境変数の読み込み
-load_dotenv()
+load_env()
 
-# Slackクライアントの初期化
+# Slackクライアントは最初の送信時に作る
 slack_token = os.getenv("SLACK_BOT_TOKEN")
-client = WebClient(token=slack_token)
+client: Optional[WebClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> WebClient:
+    """プロセスで共有する WebClient"""
+    global client
+    if client is None:
+        with _client_lock:
+            if client is None:
+                client = WebClient(token=slack_token)
+    return client
+
 
 def send_reply(response: FeedbackResponse, channel_id: str) -> bool:
 
@@ -22,7 +40,7 @@ def send_reply(response: FeedbackResponse, channel_id: str) -> bool:
 
     try:
         # メッセージ送信の実行
-        result = client.chat_postMessage(
+        result = get_client().chat_postMessage(
             channel=channel_id,
             text=response.feedback_summary,
             thread_ts=response.ts # スレッド返信
@@ -43,6 +61,226 @@ def send_reply(response: FeedbackResponse, channel_id: str) -> bool:
         print(f"❌ Unexpected Error in F-06: {e}")
         return False
 
+# ---------------------------------------------------------
+# 送信キュー経由の返信 (SLACK_DELIVERY_MODE=queue)
+# ---------------------------------------------------------
+_delivery_queue: Optional[DeliveryQueue] = None
+_delivery_lock = threading.Lock()
+
+
+def _record_receipt(response: FeedbackResponse, receipt: dict):
+    """配信レシートを DB のレコードに書き戻す"""
+    from backend.f03_db.database import get_db_handler
+    get_db_handler().save_delivery_receipt(response.ts, receipt)
+
+
+def get_delivery_queue() -> DeliveryQueue:
+    """プロセスで共有する送信キュー (共有の WebClient を使う)"""
+    global _delivery_queue
+    if _delivery_queue is None:
+        with _delivery_lock:
+            if _delivery_queue is None:
+                _delivery_queue = DeliveryQueue(get_client(), on_receipt=_record_receipt)
+    return _delivery_queue
+
+
+def get_delivery_stats() -> Optional[dict]:
+    """/stats 用 (まだ使われていなければ None)"""
+    return _delivery_queue.stats() if _delivery_queue is not None else None
+
+
+def deliver_reply(response: FeedbackResponse, channel_id: str) -> bool:
+    """
+    [F-06] 返信の窓口
+    queue モードでは送信キューに積んで即座に戻る (レート制限・再送・分割はキューが面倒を見る)。
+    direct モードでは従来どおり send_reply で直接送る。
+    """
+    if SLACK_DELIVERY_MODE == "direct":
+        return send_reply(response, channel_id)
+    print(f"--- 📤 [F-06] Queueing Reply to Channel: {channel_id} ---")
+    return get_delivery_queue().enqueue(response, channel_id)
+
+
+# キューモードのワーカーが返信を送り終わるまで待つ上限 (秒)。キューの visibility timeout より短くする
+SLACK_DELIVERY_WAIT_SECONDS = float(os.getenv("SLACK_DELIVERY_WAIT_SECONDS", "60"))
+
+
+def deliver_reply_and_wait(response: FeedbackResponse, channel_id: str) -> bool:
+    """
+    [F-06] 返信を送り終わるまで待つ (キューモードのワーカー用)
+    送れたら True。配信レシートは DB に書き戻すので、再配信されたメッセージは送り直さずに済む。
+    """
+    if SLACK_DELIVERY_MODE == "direct":
+        ok = send_reply(response, channel_id)
+        try:
+            _record_receipt(response, {
+                "status": "delivered" if ok else "failed", "channel_id": channel_id, "message_ts": [],
+                "chunks": 1, "attempts": 1, "delivered_at": datetime.now().isoformat(), "error": None,
+            })
+        except Exception as e:
+            print(f"❌ Failed to record delivery receipt: {e}")
+        return ok
+    print(f"--- 📤 [F-06] Delivering Reply to Channel: {channel_id} ---")
+    receipt = get_delivery_queue().deliver(response, channel_id, timeout=SLACK_DELIVERY_WAIT_SECONDS)
+    return receipt is not None and receipt["status"] == "delivered"
+
+
+# asyncio パイプライン用のクライアント (aiohttp が必要なので、使うときに作る)
+# aiohttp が入っていなければ False にして、以降は同期の send_reply をスレッドで使う
+_async_client = None
+
+
+def _get_async_client():
+    global _async_client
+    if _async_client is None:
+        with _client_lock:
+            if _async_client is None:
+                try:
+                    import aiohttp  # noqa: F401 (AsyncWebClient が使う)
+                except ImportError:
+                    print("⚠️ aiohttp が無いため、非同期の返信は同期クライアントをスレッドで使います (pip install aiohttp)")
+                    _async_client = False
+                else:
+                    from slack_sdk.web.async_client import AsyncWebClient
+                    _async_client = AsyncWebClient(token=slack_token)
+    return _async_client
+
+
+async def send_reply_async(response: FeedbackResponse, channel_id: str) -> bool:
+    """send_reply の非同期版 (AsyncWebClient。aiohttp が無ければ send_reply をスレッドで実行する)"""
+    async_client = _get_async_client()
+    if async_client is False:
+        return await asyncio.to_thread(send_reply, response, channel_id)
+
+    print(f"--- 📤 [F-06] Sending Reply to Channel (async): {channel_id} ---")
+
+    try:
+        result = await async_client.chat_postMessage(
+            channel=channel_id,
+            text=response.feedback_summary,
+            thread_ts=response.ts
+        )
+        if result["ok"]:
+            print(f"✅ Message sent successfully to {channel_id}")
+            return True
+        print(f"❌ Message sent but marked as failed: {result}")
+        return False
+
+    except SlackApiError as e:
+        print(f"❌ Slack API Error: {e.response['error']}")
+        return False
+
+    except Exception as e:
+        print(f"❌ Unexpected Error in F-06: {e}")
+        return False
+
+
+# ストリーミング返信のプレースホルダーと、chat_update の最小間隔 (秒)
+PLACEHOLDER_TEXT = os.getenv("STREAMING_PLACEHOLDER_TEXT", "_フィードバックを作成中です..._")
+STREAMING_UPDATE_INTERVAL = float(os.getenv("STREAMING_UPDATE_INTERVAL", "1.0"))
+# プレースホルダーの投稿・最終本文への書き換えで、チャンネルのトークンを待つ上限 (秒)
+STREAMING_TOKEN_WAIT_SECONDS = float(os.getenv("STREAMING_TOKEN_WAIT_SECONDS", "10"))
+
+
+def _acquire_token(channel_id: str, wait: bool) -> bool:
+    """
+    送信キューと同じチャンネルごとのトークンバケットを使って、ストリーミング返信の投稿・書き換えもレート制限に従わせる
+    wait=False なら待たない (取れなければ False。途中経過の書き換えは飛ばしてよい)
+    direct モードではキューを使わないので、従来どおり制限しない
+    """
+    if SLACK_DELIVERY_MODE == "direct":
+        return True
+    bucket = get_delivery_queue().bucket
+    if not wait:
+        return bucket.try_acquire(channel_id) == 0
+    return bucket.acquire(channel_id, timeout=STREAMING_TOKEN_WAIT_SECONDS)
+
+
+def _note_rate_limit(channel_id: str, e: SlackApiError):
+    """429 を受けたら、送信キュー側の同じチャンネルへの送信も Retry-After の間止める"""
+    if SLACK_DELIVERY_MODE == "direct" or e.response is None:
+        return
+    if getattr(e.response, "status_code", None) == 429 or e.response.get("error") == "ratelimited":
+        get_delivery_queue().bucket.pause(channel_id, float(e.response.headers.get("Retry-After", 1)))
+
+
+def post_placeholder(channel_id: str, thread_ts: str) -> Optional[str]:
+    """スレッドにプレースホルダーを投稿し、そのメッセージの ts を返す (失敗したら None)"""
+    if not _acquire_token(channel_id, wait=True):
+        # 混み合っているチャンネルではプレースホルダーを出さず、finish() で通常どおり送信キューから送る
+        print(f"⏳ Placeholder skipped for {channel_id} (rate limited)")
+        return None
+    try:
+        result = get_client().chat_postMessage(channel=channel_id, text=PLACEHOLDER_TEXT, thread_ts=thread_ts)
+        return result["ts"] if result["ok"] else None
+    except SlackApiError as e:
+        print(f"❌ Slack API Error (placeholder): {e.response['error']}")
+        _note_rate_limit(channel_id, e)
+        return None
+    except Exception as e:
+        print(f"❌ Unexpected Error in F-06 (placeholder): {e}")
+        return None
+
+
+def update_reply(channel_id: str, message_ts: str, text: str, wait: bool = True) -> bool:
+    """
+    投稿済みのメッセージを書き換える
+    wait=False ならトークンが無いときは書き換えずに False。wait=True は待ち切れなくても書き換える
+    """
+    if not _acquire_token(channel_id, wait=wait) and not wait:
+        return False
+    try:
+        return bool(get_client().chat_update(channel=channel_id, ts=message_ts, text=text)["ok"])
+    except SlackApiError as e:
+        print(f"❌ Slack API Error (update): {e.response['error']}")
+        _note_rate_limit(channel_id, e)
+        return False
+    except Exception as e:
+        print(f"❌ Unexpected Error in F-06 (update): {e}")
+        return False
+
+
+class StreamingReply:
+    """
+    [F-06] ストリーミング返信
+    生成途中の全文を push() で受け取り、chat_update は interval 秒に1回までに間引く。
+    投稿・書き換えは送信キューと同じチャンネルごとのトークンバケットに従う (途中経過はトークンが無ければ飛ばす)。
+    finish() で最終的な本文に必ず書き換える。
+    プレースホルダーの投稿に失敗した場合は、finish() で通常の deliver_reply に切り替える。
+    """
+
+    def __init__(self, channel_id: str, thread_ts: str, interval: float = STREAMING_UPDATE_INTERVAL):
+        self.channel_id = channel_id
+        self.thread_ts = thread_ts
+        self.interval = interval
+        self.message_ts = post_placeholder(channel_id, thread_ts)
+        self._sent_text = PLACEHOLDER_TEXT
+        self._last_update = time.monotonic()
+        self.updates = 0
+
+    def push(self, text: str):
+        if self.message_ts is None or text == self._sent_text:
+            return
+        now = time.monotonic()
+        if now - self._last_update < self.interval:
+            return
+        if update_reply(self.channel_id, self.message_ts, text, wait=False):
+            self._sent_text = text
+            self.updates += 1
+        self._last_update = now
+
+    def finish(self, response: FeedbackResponse) -> bool:
+        if self.message_ts is None:
+            return deliver_reply(response, self.channel_id)
+        if response.feedback_summary == self._sent_text:
+            return True
+        # 最終本文はプレースホルダーを残さないよう、必ず書き換える
+        ok = update_reply(self.channel_id, self.message_ts, response.feedback_summary)
+        if ok:
+            print(f"✅ Streaming reply finalized in {self.channel_id} ({self.updates + 1} updates)")
+        return ok
+
+
 # 単体テスト用ブロック
 if __name__ == "__main__":
     print("🚀 F-06 Standalone Test")
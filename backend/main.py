@@ -1,66 +1,317 @@
 import sys
 import os
-from dotenv import load_dotenv
+import asyncio
 
 # パス設定
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../")
 
 # 環境変数読み込み
-load_dotenv()
+from backend.common.config import load_env
+load_env()
 
 from backend.common.models import SlackMessage, FeedbackResponse
-from backend.f02_filter.filter import analyze_intent
+from backend.common.metrics import span, set_outcome, traced
+from backend.f02_filter.filter import analyze_intent, classify_by_keywords
 # F-03: クラスベースのインポートに変更
-from backend.f03_db.database import DynamoDBHandler 
+from backend.f03_db.database import get_db_handler
 
 try:
-    from backend.f04_gen.generator import generate_feedback
+    from backend.f04_gen.generator import (
+        generate_feedback, generate_feedback_async, generate_feedback_stream, summarize_channel,
+    )
 except ImportError:
-    from backend.f04_gen.generator import generate_feedback
+    from backend.f04_gen.generator import (
+        generate_feedback, generate_feedback_async, generate_feedback_stream, summarize_channel,
+    )
 
-from backend.f05_archive.logger import archive_process
-from backend.f06_notify.notifier import send_reply
+from backend.f04_gen.context import ChannelSummarizer, load_context
+from backend.f04_gen.retrieval import index_message
 
+from backend.f05_archive.logger import archive_process, archive_message
+from backend.f06_notify.notifier import deliver_reply, deliver_reply_and_wait, send_reply_async, StreamingReply
+from backend.f06_notify.delivery import SLACK_DELIVERY_MODE
 
+# true なら生成途中の文章でスレッドのプレースホルダーを少しずつ更新する
+STREAMING_REPLY_ENABLED = os.getenv("STREAMING_REPLY_ENABLED", "false").lower() == "true"
+
+# チャンネルごとのローリング要約 (CONTEXT_SUMMARY_EVERY 件ごとに更新)
+channel_summarizer = ChannelSummarizer(summarize_channel)
+
+
+def _note_deferred(feedback_response: FeedbackResponse):
+    """生成できず定型の返信になったイベントは、結果を deferred として数える"""
+    if feedback_response.status == "deferred":
+        print(f"⏳ Generation deferred for Event: {feedback_response.event_id}")
+        set_outcome("deferred")
+
+
+class DeliveryFailedError(RuntimeError):
+    """返信を送り終えられなかった (キューモードではメッセージを再配信させる)"""
+
+
+def _deliver_or_raise(feedback_response: FeedbackResponse, channel_id: str):
+    if not deliver_reply_and_wait(feedback_response, channel_id):
+        raise DeliveryFailedError(f"reply for {feedback_response.event_id} was not delivered")
+
+
+@traced
 def run_pipeline(input_message: SlackMessage):
     """
     Slackerのメイン処理パイプライン（Phase 2: RAG統合版）
+    各段は span で計測する (/metrics・遅いイベントのトレース)
     """
-    print(f"🟦 Pipeline Started for Event: {input_message.event_id}")
+    _run_pipeline(input_message, streaming=STREAMING_REPLY_ENABLED)
+
+
+@traced
+def run_queued_pipeline(input_message: SlackMessage):
+    """
+    キューモード (worker.py) 用のパイプライン。同じメッセージが再配信されても返信を二度送らないよう、
+    DB のレコードを見て終わっている段を飛ばす:
+      - 配信済み (delivery_status=delivered) → 何もしない
+      - 回答が保存済み → 生成し直さず、保存済みの回答を送る
+      - それ以外 → 最初から
+    返信は送り終わるまで待ち、送れなければ DeliveryFailedError を投げて再配信させる
+    (送信キューに積んだだけでメッセージを消すと、送る前にプロセスが落ちたとき返信が失われる)。
+    ストリーミング返信は投稿してから回答を保存する順になり再実行で二重に投稿しうるので、ここでは使わない。
+    """
+    event_id = input_message.event_id
+    db = get_db_handler()
+    with span("db.progress", event_id):
+        progress = db.get_progress(input_message.ts)
+
+    if progress is not None and progress.get("delivery_status") == "delivered":
+        print(f"♻️ Already delivered. Skipping redelivered Event: {event_id}")
+        set_outcome("redelivered")
+        return
+
+    if progress is not None and progress.get("feedback_summary"):
+        # 前回は回答の保存までは終わっている → 送るところからやり直す
+        print(f"♻️ Resuming redelivered Event at notification: {event_id}")
+        feedback_response = FeedbackResponse.from_item({
+            **progress, "event_id": event_id, "target_user_id": input_message.user_id, "ts": input_message.ts,
+        })
+        set_outcome("redelivered")
+        with span("notify", event_id):
+            _deliver_or_raise(feedback_response, input_message.channel_id)
+        print(f"🏁 Pipeline Finished for Event: {event_id}")
+        return
+
+    _run_pipeline(input_message, streaming=False, wait_for_delivery=True)
+
+
+def _run_pipeline(input_message: SlackMessage, streaming: bool, wait_for_delivery: bool = False):
+    event_id = input_message.event_id
+    print(f"🟦 Pipeline Started for Event: {event_id}")
     
-    # DBハンドラの初期化
-    db = DynamoDBHandler()
+    # DBハンドラ (プロセスで共有。接続プールを使い回す)
+    db = get_db_handler()
 
     # --- Phase 1: Intent Analysis (F-02) ---
-    analyzed_message = analyze_intent(input_message)
+    with span("intent", event_id):
+        analyzed_message = analyze_intent(input_message)
     print(f"🟨 判定結果: {analyzed_message.intent_tag}")
     
     # --- Phase 2: Save Initial Status (F-03) ---
     # analyzed_message に基づいてDBにログを保存
-    db.save_log(analyzed_message)
+    with span("db.save_log", event_id):
+        db.save_log(analyzed_message)
+    index_message(input_message.channel_id, input_message.ts, input_message.text_content)
+    summary_due = channel_summarizer.note_message(input_message.channel_id)
 
     # フィルタリング（質問以外は無視）
     allow_list = ["question", "consultation"]
     if analyzed_message.intent_tag not in allow_list:
         print(f"☕ '{analyzed_message.intent_tag}' なので返信せずに終了します。")
+        set_outcome("skipped")
+        with span("archive", event_id):
+            archive_message(analyzed_message)
+        if summary_due:
+            channel_summarizer.refresh(db, input_message.channel_id)
         print(f"🟩 Pipeline Finished (Skipped Reply)\n")
         return
 
     # --- Phase 2.5: Context Retrieval (F-03拡張: RAG) ---
-    # 【追加】生成の前に最新10件の履歴を取得する
+    # 生成の前にチャンネルの要約と最新の履歴を取得し、トークン予算内に収める
     print(f"🔍 過去の文脈を取得中...")
-    history_context = db.get_recent_history(input_message.channel_id, limit=10)
+    with span("db.history", event_id):
+        history_context = load_context(
+            db, input_message.channel_id,
+            query_text=input_message.text_content, exclude_ts=input_message.ts,
+        )
 
-    feedback_response = generate_feedback(analyzed_message, context=history_context)
+    if streaming:
+        # --- Phase 3 + 5: Streaming Generation & Notification (F-04 / F-06) ---
+        # 先にプレースホルダーを投稿し、生成途中の文章で書き換えていく
+        reply = StreamingReply(input_message.channel_id, input_message.ts)
+        with span("generate", event_id):
+            feedback_response = generate_feedback_stream(analyzed_message, context=history_context, on_text=reply.push)
+        _note_deferred(feedback_response)
+        feedback_response.ts = input_message.ts
+        with span("notify", event_id):
+            reply.finish(feedback_response)
 
-    feedback_response.ts = input_message.ts  # スレッド返信のためにtsをセット
-    
-    # --- Phase 4: Archive Result (F-05) ---
-    # 生成された回答をDBに追記（save_logのfeedback引数を使用）
-    db.save_log(analyzed_message, feedback=feedback_response)
-    archive_process(feedback_response)
+        # --- Phase 4: Archive Result (F-05) ---
+        # ストリームが終わってから、確定した本文で DB / アーカイブを更新する
+        with span("db.save_feedback", event_id):
+            db.save_feedback(analyzed_message, feedback_response)
+        with span("archive", event_id):
+            archive_process(feedback_response, analyzed_message)
+    else:
+        with span("generate", event_id):
+            feedback_response = generate_feedback(analyzed_message, context=history_context)
+        _note_deferred(feedback_response)
+
+        feedback_response.ts = input_message.ts  # スレッド返信のためにtsをセット
+
+        # --- Phase 4: Archive Result (F-05) ---
+        # 生成された回答をDBに追記（フィードバック部分だけを部分更新）
+        with span("db.save_feedback", event_id):
+            db.save_feedback(analyzed_message, feedback_response)
+        with span("archive", event_id):
+            archive_process(feedback_response, analyzed_message)
+
+        # --- Phase 5: Notification (F-06) ---
+        # 送信キュー経由 (レート制限に合わせて送る・失敗時は再送)
+        # wait_for_delivery なら送り終わるまで待つ (送れなければ DeliveryFailedError)
+        with span("notify", event_id):
+            if wait_for_delivery:
+                _deliver_or_raise(feedback_response, input_message.channel_id)
+            else:
+                deliver_reply(feedback_response, input_message.channel_id)
+
+    # 返信を送ってから、必要ならチャンネルの要約を更新する (返信の遅延にしない)
+    if summary_due:
+        channel_summarizer.refresh(db, input_message.channel_id)
+
+    print(f"🏁 Pipeline Finished for Event: {event_id}")
+
+# asyncio パイプラインの段ごとのタイムアウト (秒)
+STAGE_TIMEOUTS = {
+    "intent": float(os.getenv("STAGE_TIMEOUT_INTENT", "10")),
+    "db": float(os.getenv("STAGE_TIMEOUT_DB", "5")),
+    "generate": float(os.getenv("STAGE_TIMEOUT_GENERATE", "30")),
+    "notify": float(os.getenv("STAGE_TIMEOUT_NOTIFY", "10")),
+}
 
-    # --- Phase 5: Notification (F-06) ---
-    send_reply(feedback_response, input_message.channel_id)
 
-    print(f"🏁 Pipeline Finished for Event: {input_message.event_id}")
\ No newline at end of file
+async def _stage(name: str, awaitable, event_id: str, default=None, span_name: str = None):
+    """
+    1段を STAGE_TIMEOUTS[name] 秒で打ち切る。時間切れ・失敗時は default を返す
+    所要時間は span_name (省略時は name) の span として記録する。
+    """
+    try:
+        with span(span_name or name, event_id):
+            return await asyncio.wait_for(awaitable, timeout=STAGE_TIMEOUTS[name])
+    except asyncio.TimeoutError:
+        print(f"⏱️ Stage '{name}' timed out for Event: {event_id}")
+    except Exception as e:
+        print(f"❌ Stage '{name}' failed for Event: {event_id}: {e}")
+    return default
+
+
+async def _notify_async(response: FeedbackResponse, channel_id: str) -> bool:
+    # queue モードでは送信キューに積むだけ (積むのはブロックしない)
+    if SLACK_DELIVERY_MODE == "queue":
+        return deliver_reply(response, channel_id)
+    return await send_reply_async(response, channel_id)
+
+
+@traced
+async def run_pipeline_async(input_message: SlackMessage):
+    """
+    Slackerのメイン処理パイプライン（asyncio 版, PIPELINE_MODE=async）
+    互いに依存しない段は asyncio.gather で同時に実行する。
+      - 初回保存 (F-03) と 過去の文脈の取得
+      - フィードバックの保存 (F-03) / アーカイブ (F-05) / Slack への返信 (F-06)
+    Gemini と Slack は非同期クライアントを使い、同期API (DB・意図判定) は to_thread で呼ぶ。
+    ストリーミング返信 (STREAMING_REPLY_ENABLED) には対応していない。
+    """
+    event_id = input_message.event_id
+    print(f"🟦 Async Pipeline Started for Event: {event_id}")
+    db = get_db_handler()
+
+    # --- Phase 1: Intent Analysis (F-02) ---
+    analyzed_message = await _stage("intent", asyncio.to_thread(analyze_intent, input_message), event_id)
+    if analyzed_message is None:
+        # 判定できなければキーワード判定で続ける
+        input_message.intent_tag = classify_by_keywords(input_message.text_content)
+        input_message.intent_source = "keyword"
+        analyzed_message = input_message
+    print(f"🟨 判定結果: {analyzed_message.intent_tag}")
+
+    allow_list = ["question", "consultation"]
+    is_question = analyzed_message.intent_tag in allow_list
+
+    # --- Phase 2 + 2.5: Save Initial Status (F-03) / Context Retrieval ---
+    save_task = _stage("db", asyncio.to_thread(db.save_log, analyzed_message), event_id, span_name="db.save_log")
+    if is_question:
+        _, history_context = await asyncio.gather(
+            save_task,
+            _stage("db", asyncio.to_thread(
+                load_context, db, input_message.channel_id,
+                query_text=input_message.text_content, exclude_ts=input_message.ts,
+            ), event_id, default="", span_name="db.history"),
+        )
+    else:
+        await save_task
+    await asyncio.to_thread(index_message, input_message.channel_id, input_message.ts, input_message.text_content)
+    summary_due = channel_summarizer.note_message(input_message.channel_id)
+
+    if not is_question:
+        print(f"☕ '{analyzed_message.intent_tag}' なので返信せずに終了します。")
+        set_outcome("skipped")
+        with span("archive", event_id):
+            archive_message(analyzed_message)
+    else:
+        # --- Phase 3: Generation (F-04) ---
+        feedback_response = await _stage("generate", generate_feedback_async(analyzed_message, history_context), event_id)
+        if feedback_response is None:
+            print(f"❌ Generation failed for Event: {event_id}")
+            set_outcome("failed")
+            return
+        _note_deferred(feedback_response)
+        feedback_response.ts = input_message.ts
+
+        # --- Phase 4 + 5: Archive Result (F-03/F-05) & Notification (F-06) ---
+        with span("archive", event_id):
+            archive_process(feedback_response, analyzed_message)
+        await asyncio.gather(
+            _stage("db", asyncio.to_thread(db.save_feedback, analyzed_message, feedback_response), event_id,
+                   span_name="db.save_feedback"),
+            _stage("notify", _notify_async(feedback_response, input_message.channel_id), event_id, default=False),
+        )
+
+    if summary_due:
+        await asyncio.to_thread(channel_summarizer.refresh, db, input_message.channel_id)
+
+    print(f"🏁 Async Pipeline Finished for Event: {event_id}")
+
+# 混雑時の簡易返信メッセージ
+DEGRADED_REPLY_TEXT = "現在リクエストが混み合っているため、詳しいフィードバックは後ほどお送りします。"
+
+
+@traced
+def run_degraded_pipeline(input_message: SlackMessage):
+    """
+    キューが溢れたときの縮退パイプライン。
+    Gemini / DynamoDB は呼ばず、キーワード判定で質問と判断したものにだけ簡易返信する。
+    """
+    input_message.intent_tag = classify_by_keywords(input_message.text_content)
+    input_message.intent_source = "keyword"
+    print(f"🟧 Degraded Pipeline: {input_message.event_id} => {input_message.intent_tag}")
+
+    if input_message.intent_tag not in ["question", "consultation"]:
+        set_outcome("skipped")
+        return
+    set_outcome("degraded")
+
+    feedback_response = FeedbackResponse(
+        event_id=input_message.event_id,
+        target_user_id=input_message.user_id,
+        ts=input_message.ts,
+        feedback_summary=DEGRADED_REPLY_TEXT,
+        status="degraded"
+    )
+    with span("notify", input_message.event_id):
+        deliver_reply(feedback_response, input_message.channel_id)
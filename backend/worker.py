@@ -0,0 +1,175 @@
+import os
+import sys
+import time
+import signal
+import logging
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# パス設定
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../")
+
+# 環境変数読み込み
+from backend.common.config import load_env
+load_env()
+
+from backend.common.models import SlackMessage
+from backend.f01_listener.work_queue import create_work_queue, WORK_QUEUE_URL, WORK_QUEUE_VISIBILITY_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------
+# 設定値 (環境変数で上書き可能)
+# ---------------------------------------------------------
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "2"))
+# 1プロセスで同時に処理するメッセージ数 (生成待ちの間も他のメッセージを進める)
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", os.getenv("PIPELINE_WORKERS", "4")))
+# 1回の受信で取るメッセージ数 (SQS の上限は 10)
+WORK_QUEUE_BATCH_SIZE = int(os.getenv("WORK_QUEUE_BATCH_SIZE", "10"))
+# キューが空のときに待つ秒数 (ロングポーリング。SQS の上限は 20)
+WORK_QUEUE_WAIT_SECONDS = int(os.getenv("WORK_QUEUE_WAIT_SECONDS", "10"))
+# 失敗したメッセージを再配信するまでの秒数 (受信回数ごとに倍にし、visibility timeout で頭打ち)
+WORK_QUEUE_RETRY_BASE_SECONDS = int(os.getenv("WORK_QUEUE_RETRY_BASE_SECONDS", "5"))
+
+
+def process_message(work_queue, message: dict, handler) -> bool:
+    """
+    1件処理する。成功 (返信を送り終えた) したらキューから消し、失敗したら少し後に再配信されるようにする
+    (max receive count を超えるとデッドレターに移る)。再配信されたメッセージは終わった段を飛ばして続きから処理する。
+    """
+    try:
+        handler(SlackMessage.from_json(message["Body"]))
+    except Exception as e:
+        receive_count = int(message.get("Attributes", {}).get("ApproximateReceiveCount", "1"))
+        delay = min(WORK_QUEUE_VISIBILITY_TIMEOUT, WORK_QUEUE_RETRY_BASE_SECONDS * 2 ** (receive_count - 1))
+        logger.error(f"❌ Pipeline failed for queued message {message['MessageId']} "
+                     f"(receive #{receive_count}, retry in {delay}s): {e}", exc_info=True)
+        try:
+            work_queue.change_message_visibility(
+                QueueUrl=WORK_QUEUE_URL, ReceiptHandle=message["ReceiptHandle"], VisibilityTimeout=delay,
+            )
+        except Exception as e:
+            logger.error(f"❌ Failed to reschedule message {message['MessageId']}: {e}")
+        return False
+
+    work_queue.delete_message(QueueUrl=WORK_QUEUE_URL, ReceiptHandle=message["ReceiptHandle"])
+    return True
+
+
+def run_worker(stop: threading.Event, threads: int = WORKER_THREADS, work_queue=None, handler=None):
+    """
+    [F-01] キューからメッセージを取り出して run_queued_pipeline を実行するループ (1プロセス分)
+    空いているスレッドの数だけまとめて受信するので、遅い生成が1件あっても他は止まらない。
+    stop がセットされたら受信をやめ、処理中の分を終えてから戻る。
+    """
+    if handler is None:
+        from backend.main import run_queued_pipeline
+        handler = run_queued_pipeline
+    work_queue = work_queue or create_work_queue()
+    threads = max(1, threads)
+    pending = set()
+
+    with ThreadPoolExecutor(threads, thread_name_prefix="queue-worker") as pool:
+        while not stop.is_set():
+            free = threads - len(pending)
+            if free <= 0:
+                _, pending = wait(pending, timeout=1, return_when=FIRST_COMPLETED)
+                continue
+            try:
+                response = work_queue.receive_message(
+                    QueueUrl=WORK_QUEUE_URL,
+                    MaxNumberOfMessages=max(1, min(10, WORK_QUEUE_BATCH_SIZE, free)),
+                    WaitTimeSeconds=WORK_QUEUE_WAIT_SECONDS,
+                    AttributeNames=["ApproximateReceiveCount"],
+                )
+            except Exception as e:
+                logger.error(f"❌ Failed to receive from work queue: {e}")
+                stop.wait(1)
+                continue
+            for message in response.get("Messages", []):
+                pending.add(pool.submit(process_message, work_queue, message, handler))
+            pending = {f for f in pending if not f.done()}
+        wait(pending)
+
+
+def _worker_process(index: int, stop):
+    # 停止 (Ctrl+C / SIGTERM) は親プロセスが受けて stop で知らせるので、子は無視する
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    logging.basicConfig(level=logging.INFO, format=f"%(asctime)s [worker-{index}] %(levelname)s %(message)s")
+    run_worker(stop)
+
+
+def _wait_for(stopping: list, stop: threading.Event):
+    while not stopping:
+        time.sleep(0.5)
+    stop.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="[F-01] キューモードのパイプラインワーカー")
+    parser.add_argument("--processes", type=int, default=WORKER_PROCESSES)
+    parser.add_argument("--threads", type=int, default=WORKER_THREADS)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [worker] %(levelname)s %(message)s")
+
+    # シグナルハンドラーではフラグを立てるだけにする (ハンドラー内で Event のロックを取らない)
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+    signal.signal(signal.SIGINT, lambda *_: stopping.append(True))
+
+    if args.processes <= 1:
+        stop = threading.Event()
+        threading.Thread(target=_wait_for, args=(stopping, stop), daemon=True).start()
+        print(f"🚀 Queue worker running ({args.threads} threads)")
+        run_worker(stop, args.threads)
+        return
+
+    # fork するとロック・スレッドの状態を引き継いでしまうので spawn で起動する
+    context = multiprocessing.get_context("spawn")
+    stop = context.Event()
+
+    def start(index: int):
+        process = context.Process(target=_worker_process, args=(index, stop), name=f"queue-worker-{index}")
+        process.start()
+        return process
+
+    processes = [start(i) for i in range(args.processes)]
+    print(f"🚀 Queue workers running ({args.processes} processes x {args.threads} threads)")
+    while not stopping:
+        time.sleep(1)
+        for i, process in enumerate(processes):
+            # 落ちたワーカーは起動し直す (処理中だったメッセージは visibility timeout 後に再配信される)
+            if not process.is_alive() and not stopping:
+                logger.warning(f"⚠️ Worker {i} exited with code {process.exitcode}. Restarting.")
+                processes[i] = start(i)
+
+    print("🛑 Stopping queue workers (finishing in-flight messages)...")
+    stop.set()
+    for process in processes:
+        # 処理中のメッセージは visibility timeout を過ぎれば他に回るので、それ以上は待たない
+        process.join(timeout=WORK_QUEUE_VISIBILITY_TIMEOUT)
+        if process.is_alive():
+            process.terminate()
+
+
+def sqs_handler(event, context):
+    """
+    Lambda の SQS イベントソース用ハンドラー (WORK_QUEUE_BACKEND=sqs のとき)
+    失敗したメッセージだけを batchItemFailures で返し、SQS に再配信させる。
+    """
+    from backend.main import run_queued_pipeline
+    failures = []
+    for record in event.get("Records", []):
+        try:
+            run_queued_pipeline(SlackMessage.from_json(record["body"]))
+        except Exception as e:
+            logger.error(f"❌ Pipeline failed for SQS message {record.get('messageId')}: {e}", exc_info=True)
+            failures.append({"itemIdentifier": record["messageId"]})
+    return {"batchItemFailures": failures}
+
+
+if __name__ == "__main__":
+    main()
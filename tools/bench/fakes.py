@@ -0,0 +1,224 @@
+"""
+ベンチマーク用の外部サービスの代替 (Gemini / Slack)
+
+どちらも本物のクライアントと同じメソッド・戻り値の形を持ち、
+tools/local_dynamodb.py の LocalTable と同じ書式で遅延とエラー率を指定できる。
+  latency: 1回の呼び出しにかける遅延 (秒)。(平均, ばらつき) なら正規分布から引く
+  error_rate: 指定した確率で呼び出しを失敗させる
+呼び出しごとの所要時間は calls に記録する (ベンチマークのレポートで使う)。
+"""
+import re
+import json
+import time
+import random
+import asyncio
+import threading
+
+from slack_sdk.errors import SlackApiError
+
+from backend.f02_filter.filter import classify_by_keywords
+
+_NUMBERED = re.compile(r"^\s*\d+\. (\".*\")$", re.MULTILINE)
+_SINGLE = re.compile(r'メッセージ: "(.*)"', re.DOTALL)
+
+
+class _Latency:
+    """LocalTable と同じ書式の遅延・エラー注入 (呼び出し回数と所要時間も数える)"""
+
+    def __init__(self, latency=0.0, error_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = {}      # 操作名 -> 回数
+        self.errors = {}     # 操作名 -> 失敗回数
+        self.durations = []  # (操作名, 秒)
+
+    def delay(self) -> float:
+        with self._lock:
+            if isinstance(self.latency, tuple):
+                mean, jitter = self.latency
+                return max(0.0, self._random.gauss(mean, jitter))
+            return self.latency
+
+    def fails(self, operation: str) -> bool:
+        with self._lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+            failed = bool(self.error_rate) and self._random.random() < self.error_rate
+            if failed:
+                self.errors[operation] = self.errors.get(operation, 0) + 1
+            return failed
+
+    def record(self, operation: str, seconds: float):
+        with self._lock:
+            self.durations.append((operation, seconds))
+
+
+# ---------------------------------------------------------
+# Gemini
+# ---------------------------------------------------------
+class _Response:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeGeminiError(Exception):
+    pass
+
+
+def _fake_feedback(length: int) -> str:
+    return ("【スコア】質問: 7/10, 回答: 6/10\n【これまでの流れを踏まえた評価】\n- ベンチマーク用の応答です。\n"
+            "【今回のメッセージへの改善点】\n- " + "再現手順とエラーメッセージを添えてください。" * max(1, length // 24))
+
+
+class _FakeModels:
+    def __init__(self, owner: "FakeGeminiClient"):
+        self._owner = owner
+
+    def generate_content(self, model=None, contents="", **kwargs):
+        return self._owner._call("generate_content", lambda: _Response(_fake_feedback(self._owner.response_chars)))
+
+    def generate_content_stream(self, model=None, contents="", **kwargs):
+        owner = self._owner
+        text = _fake_feedback(owner.response_chars)
+        size = max(1, len(text) // owner.stream_chunks)
+        # 最初の断片までに全体の遅延の半分、残りを断片ごとに均等にかける
+        started = time.perf_counter()
+        total = owner._latency.delay()
+        if owner._latency.fails("generate_content_stream"):
+            time.sleep(total / 2)
+            raise FakeGeminiError("stream failed (fake)")
+        time.sleep(total / 2)
+        for i in range(0, len(text), size):
+            yield _Response(text[i:i + size])
+            time.sleep(total / 2 / owner.stream_chunks)
+        owner._latency.record("generate_content_stream", time.perf_counter() - started)
+
+
+class _FakeAsyncModels:
+    def __init__(self, owner: "FakeGeminiClient"):
+        self._owner = owner
+
+    async def generate_content(self, model=None, contents="", **kwargs):
+        owner = self._owner
+        started = time.perf_counter()
+        await asyncio.sleep(owner._latency.delay())
+        if owner._latency.fails("aio.generate_content"):
+            raise FakeGeminiError("generation failed (fake)")
+        owner._latency.record("aio.generate_content", time.perf_counter() - started)
+        return _Response(_fake_feedback(owner.response_chars))
+
+
+class FakeGeminiClient:
+    """google.genai.Client の代替 (models / aio.models の generate_content 系)"""
+
+    def __init__(self, latency=(0.8, 0.3), error_rate: float = 0.0, response_chars: int = 400,
+                 stream_chunks: int = 8, seed: int = 1):
+        self._latency = _Latency(latency, error_rate, seed)
+        self.response_chars = response_chars
+        self.stream_chunks = max(1, stream_chunks)
+        self.models = _FakeModels(self)
+        self.aio = type("Aio", (), {})()
+        self.aio.models = _FakeAsyncModels(self)
+
+    @property
+    def stats(self) -> _Latency:
+        return self._latency
+
+    def _call(self, operation: str, make_response):
+        started = time.perf_counter()
+        time.sleep(self._latency.delay())
+        if self._latency.fails(operation):
+            raise FakeGeminiError(f"{operation} failed (fake)")
+        self._latency.record(operation, time.perf_counter() - started)
+        return make_response()
+
+
+class FakeIntentModel:
+    """
+    google.generativeai.GenerativeModel の代替 (意図判定用)
+    1件のプロンプトにも、batcher のまとめ判定プロンプトにも、キーワード判定の結果で答える。
+    """
+
+    def __init__(self, latency=(0.4, 0.1), error_rate: float = 0.0, seed: int = 2):
+        self._latency = _Latency(latency, error_rate, seed)
+
+    @property
+    def stats(self) -> _Latency:
+        return self._latency
+
+    def generate_content(self, prompt: str):
+        started = time.perf_counter()
+        time.sleep(self._latency.delay())
+        if self._latency.fails("generate_content"):
+            raise FakeGeminiError("intent classification failed (fake)")
+        self._latency.record("generate_content", time.perf_counter() - started)
+        items = _NUMBERED.findall(prompt)
+        if items:
+            return _Response(json.dumps([classify_by_keywords(json.loads(item)) for item in items]))
+        match = _SINGLE.search(prompt)
+        return _Response(classify_by_keywords(match.group(1) if match else prompt))
+
+
+# ---------------------------------------------------------
+# Slack
+# ---------------------------------------------------------
+class _SlackResponse(dict):
+    """SlackApiError.response として使える最小限の応答 (status_code / headers を持つ dict)"""
+
+    def __init__(self, data: dict, status_code: int = 200, headers: dict = None):
+        super().__init__(data)
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeSlackClient:
+    """
+    slack_sdk.WebClient の代替 (chat_postMessage / chat_update)
+    error_rate の一部 (ratelimit_share) は 429 + Retry-After、残りは一時的なエラーとして返す。
+    """
+
+    def __init__(self, latency=(0.15, 0.05), error_rate: float = 0.0, ratelimit_share: float = 0.5,
+                 retry_after: int = 1, seed: int = 3):
+        self._latency = _Latency(latency, error_rate, seed)
+        self.ratelimit_share = ratelimit_share
+        self.retry_after = retry_after
+        self._seq = 0
+        self._lock = threading.Lock()
+        self.posted = []  # (channel, thread_ts, 文字数)
+
+    @property
+    def stats(self) -> _Latency:
+        return self._latency
+
+    def _call(self, operation: str, channel: str) -> str:
+        started = time.perf_counter()
+        time.sleep(self._latency.delay())
+        if self._latency.fails(operation):
+            if self._latency._random.random() < self.ratelimit_share:
+                response = _SlackResponse({"ok": False, "error": "ratelimited"}, 429,
+                                          {"Retry-After": str(self.retry_after)})
+            else:
+                response = _SlackResponse({"ok": False, "error": "internal_error"}, 500)
+            raise SlackApiError(f"{operation} failed (fake)", response)
+        self._latency.record(operation, time.perf_counter() - started)
+        with self._lock:
+            self._seq += 1
+            return f"{time.time():.0f}.{self._seq:06d}"
+
+    def chat_postMessage(self, channel: str, text: str = "", thread_ts: str = None, **kwargs):
+        ts = self._call("chat_postMessage", channel)
+        with self._lock:
+            self.posted.append((channel, thread_ts, len(text or "")))
+        return _SlackResponse({"ok": True, "channel": channel, "ts": ts})
+
+    def chat_update(self, channel: str, ts: str, text: str = "", **kwargs):
+        self._call("chat_update", channel)
+        return _SlackResponse({"ok": True, "channel": channel, "ts": ts})
+
+
+class FakeAsyncSlackClient(FakeSlackClient):
+    """slack_sdk.web.async_client.AsyncWebClient の代替 (asyncio パイプラインの direct 送信用)"""
+
+    async def chat_postMessage(self, channel: str, text: str = "", thread_ts: str = None, **kwargs):
+        return await asyncio.to_thread(FakeSlackClient.chat_postMessage, self, channel, text, thread_ts)
@@ -0,0 +1,242 @@
+"""
+Slack Events API の負荷生成 (署名つきペイロードの生成・リプレイ・送信)
+"""
+import io
+import sys
+import hmac
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+import urllib.request
+import urllib.error
+from typing import Callable, Iterator, List, Optional
+
+# 既定のメッセージ (質問・雑談・長いログを混ぜる)
+SAMPLE_TEXTS = [
+    "docker compose up でコンテナが起動しません。どう調べればいいですか？",
+    "おはようございます",
+    "PR のレビューをお願いできますか？ CI が落ちている理由が分かりません",
+    "了解です！",
+    "本番で 502 が出ています。nginx のログは以下です\n```\n"
+    + "\n".join(f"2025-01-01 10:00:{i:02d} [error] upstream timed out" for i in range(40)) + "\n```",
+    "ランチ行きましょう",
+    "Python の asyncio でタイムアウトを設定する方法を教えてください",
+    "テストが flaky なのですが、原因の切り分け方法はありますか？",
+    "ありがとうございました、解決しました",
+    "DynamoDB の GSI を追加したら書き込みが遅くなった気がします。なぜでしょう？",
+]
+
+
+def make_event(index: int, text: str, channel_id: str, user_id: Optional[str] = None,
+               base_ts: float = 1_700_000_000.0) -> dict:
+    """event_callback のペイロード (message イベント) を作る"""
+    ts = f"{base_ts + index:.6f}"
+    return {
+        "type": "event_callback",
+        "event_id": f"EvBench{index:08d}",
+        "event_time": int(base_ts + index),
+        "event": {
+            "type": "message",
+            "channel": channel_id,
+            "user": user_id or f"U{index % 17:08d}",
+            "text": text,
+            "ts": ts,
+        },
+    }
+
+
+def sign(signing_secret: str, body: bytes, timestamp: Optional[int] = None) -> dict:
+    """Slack と同じ方式で署名したリクエストヘッダー"""
+    timestamp = str(timestamp or int(time.time()))
+    base = b"v0:" + timestamp.encode() + b":" + body
+    signature = "v0=" + hmac.new(signing_secret.encode(), base, hashlib.sha256).hexdigest()
+    return {
+        "Content-Type": "application/json",
+        "X-Slack-Request-Timestamp": timestamp,
+        "X-Slack-Signature": signature,
+    }
+
+
+def load_replay(path: str, channel_id: str) -> List[dict]:
+    """
+    記録したペイロード (JSONL) を読み込む。1行ごとに次のどれかを受け付ける:
+      - Events API のペイロードそのもの ({"event": {...}, ...})
+      - message イベント ({"type": "message", "text": ...})
+      - テキストを持つレコード ("text" / "text_content" / "body" のどれか)
+    チャンネルは channel_id に揃える (ts・event_id は generate で重複しないように振り直す)。
+    """
+    payloads = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if isinstance(record.get("event"), dict):
+                # subtype・bot_id などはそのまま残す (無視される経路もリプレイする)
+                record["event"]["channel"] = channel_id
+                payloads.append(record)
+                continue
+            if record.get("type") == "message":
+                text = record.get("text", "")
+            else:
+                text = record.get("text") or record.get("text_content") or record.get("body") or ""
+            payloads.append(make_event(len(payloads), text, channel_id))
+    return payloads
+
+
+def generate(events: int, channel_id: str, texts: Optional[List[str]] = None, replay: Optional[List[dict]] = None,
+             other_channel_share: float = 0.0, bot_share: float = 0.0, seed: int = 0) -> Iterator[dict]:
+    """
+    events 件のペイロードを作る。replay があればそれを順に (足りなければ繰り返して) 使う。
+    other_channel_share / bot_share の割合で、無視されるべきイベントを混ぜる。
+    """
+    rng = random.Random(seed)
+    texts = texts or SAMPLE_TEXTS
+    for i in range(events):
+        if replay:
+            payload = json.loads(json.dumps(replay[i % len(replay)]))
+            payload["event_id"] = f"EvBench{i:08d}"
+            payload["event"]["ts"] = f"{1_700_000_000.0 + i:.6f}"
+        else:
+            payload = make_event(i, f"{rng.choice(texts)} (#{i})", channel_id)
+        roll = rng.random()
+        if roll < other_channel_share:
+            payload["event"]["channel"] = "C_OTHER"
+        elif roll < other_channel_share + bot_share:
+            payload["event"]["bot_id"] = "B_BENCH"
+        yield payload
+
+
+class LoadGenerator:
+    """
+    署名つきペイロードを送り、応答 (ack) までの時間を測る。
+    send は (body, headers) -> HTTP ステータスを返す関数 (プロセス内の Flask test client / HTTP)。
+    rate > 0 ならその件数/秒で送り (オープンループ)、0 なら concurrency 本で送れるだけ送る。
+    """
+
+    def __init__(self, send_factory: Callable[[], Callable[[bytes, dict], int]], signing_secret: str,
+                 concurrency: int = 8, rate: float = 0.0):
+        self.send_factory = send_factory
+        self.signing_secret = signing_secret
+        self.concurrency = max(1, concurrency)
+        self.rate = rate
+        self.acks = []  # (ack までの秒数, HTTP ステータス)
+        self._lock = threading.Lock()
+
+    def run(self, payloads: List[dict]) -> float:
+        """全件送り終えるまでの秒数を返す"""
+        bodies = [json.dumps(p, ensure_ascii=False).encode("utf-8") for p in payloads]
+        cursor = iter(range(len(bodies)))
+        cursor_lock = threading.Lock()
+        started = time.perf_counter()
+
+        def worker():
+            send = self.send_factory()
+            while True:
+                with cursor_lock:
+                    i = next(cursor, None)
+                if i is None:
+                    return
+                if self.rate > 0:
+                    wait = started + i / self.rate - time.perf_counter()
+                    if wait > 0:
+                        time.sleep(wait)
+                headers = sign(self.signing_secret, bodies[i])
+                t0 = time.perf_counter()
+                try:
+                    status = send(bodies[i], headers)
+                except Exception:
+                    status = 0
+                elapsed = time.perf_counter() - t0
+                with self._lock:
+                    self.acks.append((elapsed, status))
+
+        threads = [threading.Thread(target=worker, name=f"loadgen-{i}") for i in range(self.concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return time.perf_counter() - started
+
+
+def flask_sender(app) -> Callable[[], Callable[[bytes, dict], int]]:
+    """プロセス内の Flask アプリに送る (スレッドごとに test client を作る)"""
+    def factory():
+        client = app.test_client()
+        return lambda body, headers: client.post("/slack/events", data=body, headers=headers).status_code
+    return factory
+
+
+def wsgi_sender(app, path: str = "/slack/events") -> Callable[[], Callable[[bytes, dict], int]]:
+    """
+    WSGI アプリを直接呼ぶ (test client より送る側の処理が軽いので、asgi_sender と並べて比べられる)
+    """
+    def factory():
+        def send(body: bytes, headers: dict) -> int:
+            environ = {
+                "REQUEST_METHOD": "POST", "PATH_INFO": path, "SCRIPT_NAME": "", "QUERY_STRING": "",
+                "SERVER_NAME": "bench", "SERVER_PORT": "80", "SERVER_PROTOCOL": "HTTP/1.1",
+                "CONTENT_TYPE": headers.get("Content-Type", ""), "CONTENT_LENGTH": str(len(body)),
+                "wsgi.input": io.BytesIO(body), "wsgi.url_scheme": "http", "wsgi.errors": sys.stderr,
+                "wsgi.multithread": True, "wsgi.multiprocess": False, "wsgi.run_once": False,
+                "wsgi.version": (1, 0),
+            }
+            for name, value in headers.items():
+                environ["HTTP_" + name.upper().replace("-", "_")] = value
+            status = []
+            result = app(environ, lambda s, h, exc_info=None: status.append(s))
+            try:
+                for _ in result:
+                    pass
+            finally:
+                if hasattr(result, "close"):
+                    result.close()
+            return int(status[0].split(" ", 1)[0])
+        return send
+    return factory
+
+
+def asgi_sender(app, path: str = "/slack/events") -> Callable[[], Callable[[bytes, dict], int]]:
+    """ASGI アプリを直接呼ぶ (スレッドごとにイベントループを1つ持つ)"""
+    def factory():
+        loop = asyncio.new_event_loop()
+
+        async def call(body: bytes, headers: dict) -> int:
+            scope = {
+                "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+                "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+                "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers.items()]
+                + [(b"content-length", str(len(body)).encode())],
+            }
+            sent = []
+
+            async def receive():
+                return {"type": "http.request", "body": body, "more_body": False}
+
+            async def send(message):
+                sent.append(message)
+
+            await app(scope, receive, send)
+            return sent[0]["status"]
+
+        return lambda body, headers: loop.run_until_complete(call(body, headers))
+    return factory
+
+
+def http_sender(url: str, timeout: float = 10.0) -> Callable[[], Callable[[bytes, dict], int]]:
+    """起動済みのサーバー (URL) に HTTP で送る"""
+    def factory():
+        def send(body: bytes, headers: dict) -> int:
+            request = urllib.request.Request(url, data=body, headers=headers, method="POST")
+            try:
+                with urllib.request.urlopen(request, timeout=timeout) as response:
+                    response.read()
+                    return response.status
+            except urllib.error.HTTPError as e:
+                return e.code
+        return send
+    return factory
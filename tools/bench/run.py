@@ -0,0 +1,396 @@
+"""
+パイプラインの負荷ベンチマーク (Gemini / Slack / DynamoDB はプロセス内の代替を使う)
+
+  # run_pipeline を直接呼ぶ
+  python tools/bench/run.py --mode pipeline --events 300 --concurrency 8
+  # 署名つきペイロードを /slack/events に送る (受信 → 実行器 → パイプライン)
+  python tools/bench/run.py --mode endpoint --events 1000 --rate 50 --ignored-share 0.5
+  # ASGI 版の受信口と比べる (対象外のイベントが多いときの ack)
+  python tools/bench/run.py --mode endpoint --ingress flask --events 5000 --ignored-share 0.9 --out flask.json
+  python tools/bench/run.py --mode endpoint --ingress asgi --events 5000 --ignored-share 0.9 --out asgi.json
+  # 起動済みのサーバーに送る (ack の時間だけ測れる)
+  python tools/bench/run.py --mode endpoint --url http://localhost:3000/slack/events
+  # 記録したペイロード (JSONL) をリプレイする
+  python tools/bench/run.py --replay captured.jsonl
+  # 2つの結果を比べる
+  python tools/bench/run.py --compare bench_results/a.json bench_results/b.json
+
+遅延は "平均,ばらつき" (秒) で指定する (例: --gemini-latency 0.8,0.3)。
+結果は段ごとの p50/p95/p99 とスループットを JSON で bench_results/ に保存する。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import functools
+import contextlib
+import subprocess
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# プロジェクトルートへのパス設定
+ROOT = os.path.abspath(os.path.dirname(os.path.abspath(__file__)) + "/../../")
+sys.path.append(ROOT)
+
+RESULTS_DIR = os.path.join(ROOT, "bench_results")
+SIGNING_SECRET = "bench-signing-secret"
+CHANNEL_ID = "C_BENCH"
+
+
+# ---------------------------------------------------------
+# 計測
+# ---------------------------------------------------------
+def percentile(sorted_samples: list, q: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    return sorted_samples[min(len(sorted_samples) - 1, int(len(sorted_samples) * q))]
+
+
+def summarize(samples: list, errors: int = 0) -> dict:
+    samples = sorted(samples)
+    return {
+        "count": len(samples),
+        "errors": errors,
+        "mean_ms": sum(samples) / len(samples) * 1e3 if samples else 0.0,
+        "p50_ms": percentile(samples, 0.50) * 1e3,
+        "p95_ms": percentile(samples, 0.95) * 1e3,
+        "p99_ms": percentile(samples, 0.99) * 1e3,
+        "max_ms": samples[-1] * 1e3 if samples else 0.0,
+    }
+
+
+class StageRecorder:
+    """段ごとの所要時間と失敗を集める"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.errors = Counter()
+        self.messages = Counter()
+
+    def record(self, stage: str, seconds: float, error: Exception = None):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+            if error is not None:
+                self.errors[stage] += 1
+                self.messages[f"{stage}: {type(error).__name__}: {str(error)[:120]}"] += 1
+
+    def wrap(self, stage: str, fn):
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                self.record(stage, time.perf_counter() - started, e)
+                raise
+            self.record(stage, time.perf_counter() - started)
+            return result
+        return timed
+
+    def wrap_async(self, stage: str, fn):
+        @functools.wraps(fn)
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                self.record(stage, time.perf_counter() - started, e)
+                raise
+            self.record(stage, time.perf_counter() - started)
+            return result
+        return timed
+
+    def report(self) -> dict:
+        with self._lock:
+            return {stage: summarize(samples, self.errors[stage]) for stage, samples in self.samples.items()}
+
+
+# ---------------------------------------------------------
+# 環境の準備
+# ---------------------------------------------------------
+def parse_latency(value: str):
+    parts = [float(v) for v in value.split(",")]
+    return parts[0] if len(parts) == 1 else (parts[0], parts[1])
+
+
+def prepare_environment(workdir: str, args):
+    """backend を import する前に、外部に出ないための環境変数を入れる (既に設定されていればそちらを使う)"""
+    defaults = {
+        "GEMINI_API_KEY": "bench",
+        "SLACK_BOT_TOKEN": "xoxb-bench",
+        "SLACK_SIGNING_SECRET": SIGNING_SECRET,
+        "TARGET_CHANNEL_ID": CHANNEL_ID,
+        "AWS_DEFAULT_REGION": "ap-northeast-1",
+        "AWS_ACCESS_KEY_ID": "bench",
+        "AWS_SECRET_ACCESS_KEY": "bench",
+        "ARCHIVE_PATH": os.path.join(workdir, "archive.jsonl"),
+        "SIMILARITY_INDEX_PATH": os.path.join(workdir, "similarity_index.json"),
+        "VECTOR_INDEX_PATH": os.path.join(workdir, "vector_index"),
+        "WORK_QUEUE_PATH": os.path.join(workdir, "work_queue.sqlite3"),
+        # 同じ文面を何度も送るので、既定では過去回答の再利用を切る
+        "SIMILARITY_MODE": "off",
+    }
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+    if args.pipeline_mode:
+        os.environ["PIPELINE_MODE"] = args.pipeline_mode
+
+
+def install_fakes(args, recorder: StageRecorder) -> dict:
+    """外部サービスの代替を差し込み、パイプラインの各段を計測用に包む"""
+    sys.path.append(os.path.join(ROOT, "tools"))
+    from local_dynamodb import history_table
+    from bench.fakes import FakeGeminiClient, FakeIntentModel, FakeSlackClient, FakeAsyncSlackClient
+    import backend.main as main
+    import backend.f02_filter.filter as intent_filter
+    import backend.f03_db.database as database
+    import backend.f04_gen.generator as generator
+    import backend.f06_notify.notifier as notifier
+
+    fakes = {
+        "gemini": FakeGeminiClient(parse_latency(args.gemini_latency), args.gemini_error_rate),
+        "intent_model": FakeIntentModel(parse_latency(args.intent_latency), args.gemini_error_rate),
+        "slack": FakeSlackClient(parse_latency(args.slack_latency), args.slack_error_rate),
+    }
+    fakes["slack_async"] = FakeAsyncSlackClient(parse_latency(args.slack_latency), args.slack_error_rate)
+    table = history_table(latency=parse_latency(args.db_latency), error_rate=args.db_error_rate)
+    fakes["dynamodb"] = table
+
+    generator.client = fakes["gemini"]
+    intent_filter._model = fakes["intent_model"]
+    notifier.client = fakes["slack"]
+    notifier._async_client = fakes["slack_async"]
+    handler = database.DynamoDBHandler(table=table, dedup_table=table)
+    if database.DB_WRITE_BUFFER_ENABLED:
+        handler.write_buffer = database.BufferedLogWriter(table)
+    database._shared_handler = handler
+
+    # 段ごとの計測 (backend.main が参照している名前を差し替える)
+    handler.save_log = recorder.wrap("db.save_log", handler.save_log)
+    handler.save_feedback = recorder.wrap("db.save_feedback", handler.save_feedback)
+    for stage, name in [
+        ("intent", "analyze_intent"),
+        ("index", "index_message"),
+        ("context", "load_context"),
+        ("generate", "generate_feedback"),
+        ("generate", "generate_feedback_stream"),
+        ("archive", "archive_process"),
+        ("archive", "archive_message"),
+        ("notify", "deliver_reply"),
+        ("pipeline", "run_pipeline"),
+    ]:
+        setattr(main, name, recorder.wrap(stage, getattr(main, name)))
+    for stage, name in [("generate", "generate_feedback_async"), ("notify", "send_reply_async"),
+                        ("pipeline", "run_pipeline_async")]:
+        setattr(main, name, recorder.wrap_async(stage, getattr(main, name)))
+    return fakes
+
+
+# ---------------------------------------------------------
+# 実行
+# ---------------------------------------------------------
+def run_pipeline_mode(args, payloads: list) -> dict:
+    """run_pipeline をスレッドプールから直接呼ぶ"""
+    import backend.main as main
+    from backend.common.models import SlackMessage
+
+    messages = [
+        SlackMessage(
+            event_id=p.get("event_id", f"evt_{p['event']['ts']}"), user_id=p["event"].get("user", "U"),
+            channel_id=p["event"]["channel"], text_content=p["event"].get("text", ""), ts=p["event"]["ts"],
+            intent_tag="pending", status="received",
+        )
+        for p in payloads if p["event"].get("text") and "bot_id" not in p["event"]
+    ]
+
+    def _run(message):
+        try:
+            main.run_pipeline(message)
+        except Exception:
+            pass  # 失敗は StageRecorder が数えている
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(_run, messages))
+    return {"submitted": len(messages), "load_seconds": time.perf_counter() - started}
+
+
+def run_endpoint_mode(args, payloads: list) -> dict:
+    """署名つきペイロードを /slack/events に送り、実行器が処理し終えるまで待つ"""
+    from bench.loadgen import LoadGenerator, wsgi_sender, asgi_sender, http_sender
+
+    executor = None
+    if args.url:
+        sender = http_sender(args.url)
+    elif args.ingress == "asgi":
+        from backend.f01_listener import asgi
+        sender, executor = asgi_sender(asgi.app), asgi.executor
+    else:
+        from backend.f01_listener import server
+        sender, executor = wsgi_sender(server.app), server.executor
+
+    generator = LoadGenerator(sender, os.environ["SLACK_SIGNING_SECRET"], args.concurrency, args.rate)
+    load_seconds = generator.run(payloads)
+    result = {
+        "sent": len(payloads),
+        "load_seconds": load_seconds,
+        "ack": summarize([a for a, _ in generator.acks]),
+        "ack_throughput_eps": len(payloads) / load_seconds if load_seconds else 0.0,
+        "status_codes": dict(Counter(str(s) for _, s in generator.acks)),
+    }
+    if executor is not None:
+        executor.shutdown(drain=True, timeout=args.drain_timeout)
+        result["executor"] = executor.stats()
+    return result
+
+
+def collect_external(fakes: dict) -> dict:
+    """代替クライアントが見た呼び出しの所要時間 (外部 API のレイテンシ)"""
+    external = {}
+    for name in ("gemini", "intent_model", "slack", "slack_async"):
+        stats = fakes[name].stats
+        by_operation = {}
+        for operation, seconds in stats.durations:
+            by_operation.setdefault(operation, []).append(seconds)
+        for operation, count in stats.calls.items():
+            external[f"{name}.{operation}"] = summarize(by_operation.get(operation, []), stats.errors.get(operation, 0))
+            external[f"{name}.{operation}"]["calls"] = count
+    table = fakes["dynamodb"]
+    external["dynamodb"] = {"calls": dict(table.calls), "read_units": table.consumed_read_units,
+                            "write_units": table.consumed_write_units}
+    return external
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True).stdout.strip()
+    except Exception:
+        return ""
+
+
+def print_report(report: dict):
+    print(f"\nmode={report['config']['mode']} events={report['config']['events']} "
+          f"wall={report['wall_seconds']:.2f}s throughput={report['throughput_eps']:.1f} events/s")
+    if "ack" in report["run"]:
+        ack = report["run"]["ack"]
+        print(f"ack: p50={ack['p50_ms']:.2f}ms p95={ack['p95_ms']:.2f}ms p99={ack['p99_ms']:.2f}ms "
+              f"({report['run']['ack_throughput_eps']:.0f} req/s) {report['run']['status_codes']}")
+    if "executor" in report["run"]:
+        executor = report["run"]["executor"]
+        print("executor: " + " ".join(f"{k}={executor.get(k, 0)}" for k in ("accepted", "shed", "degraded", "rejected")))
+    print(f"{'stage':<34}{'count':>7}{'errors':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)")
+    for section in ("stages", "external"):
+        for name, s in sorted(report[section].items()):
+            if "p50_ms" not in s:
+                continue
+            print(f"{name:<34}{s['count']:>7}{s['errors']:>8}{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}"
+                  f"{s['p99_ms']:>10.1f}{s['max_ms']:>10.1f}")
+    for message, count in report["errors"].items():
+        print(f"  ❌ {count}x {message}")
+
+
+def compare(path_a: str, path_b: str):
+    """2つの結果の段ごとの p50 / p95 / p99 を並べる"""
+    with open(path_a) as f:
+        a = json.load(f)
+    with open(path_b) as f:
+        b = json.load(f)
+    print(f"A: {path_a} ({a.get('git_commit')})  B: {path_b} ({b.get('git_commit')})")
+    print(f"throughput: {a['throughput_eps']:.1f} -> {b['throughput_eps']:.1f} events/s")
+    if "ack_throughput_eps" in a["run"] and "ack_throughput_eps" in b["run"]:
+        print(f"ack throughput: {a['run']['ack_throughput_eps']:.0f} -> {b['run']['ack_throughput_eps']:.0f} req/s")
+    rows, rows_b = dict(a["stages"]), dict(b["stages"])
+    if "ack" in a["run"]:
+        rows["ack"] = a["run"]["ack"]
+    if "ack" in b["run"]:
+        rows_b["ack"] = b["run"]["ack"]
+    print(f"{'stage':<20}" + "".join(f"{q:>22}" for q in ("p50 (ms)", "p95 (ms)", "p99 (ms)")))
+    for name in sorted(set(rows) | set(rows_b)):
+        x, y = rows.get(name, {}), rows_b.get(name, {})
+        cells = "".join(f"{x.get(q, 0):>10.1f} -> {y.get(q, 0):>8.1f}" for q in ("p50_ms", "p95_ms", "p99_ms"))
+        print(f"{name:<20}{cells}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="[F-01〜F-06] パイプラインの負荷ベンチマーク")
+    parser.add_argument("--mode", choices=("pipeline", "endpoint"), default="pipeline")
+    parser.add_argument("--events", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=0.0, help="endpoint モードの送信レート (件/秒, 0 なら上限なし)")
+    parser.add_argument("--replay", help="リプレイするペイロード (JSONL)")
+    parser.add_argument("--ignored-share", type=float, default=0.0, help="他チャンネル・Bot のイベントを混ぜる割合")
+    parser.add_argument("--url", help="起動済みのサーバーに送る (endpoint モード)")
+    parser.add_argument("--ingress", choices=("flask", "asgi"), default="flask",
+                        help="プロセス内で送る受信口 (server.py / asgi.py)")
+    parser.add_argument("--pipeline-mode", choices=("thread", "async", "queue"), help="PIPELINE_MODE を上書き")
+    parser.add_argument("--drain-timeout", type=float, default=120.0)
+    parser.add_argument("--gemini-latency", default="0.8,0.3")
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument("--intent-latency", default="0.4,0.1")
+    parser.add_argument("--slack-latency", default="0.15,0.05")
+    parser.add_argument("--slack-error-rate", type=float, default=0.0)
+    parser.add_argument("--db-latency", default="0.01,0.003")
+    parser.add_argument("--db-error-rate", type=float, default=0.0)
+    parser.add_argument("--out", help="結果の JSON (既定: bench_results/bench-<時刻>.json)")
+    parser.add_argument("--verbose", action="store_true", help="パイプラインの print を表示する")
+    parser.add_argument("--compare", nargs=2, metavar=("A", "B"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    prepare_environment(workdir, args)
+    sys.path.append(os.path.join(ROOT, "tools"))
+    from bench.loadgen import generate, load_replay
+
+    recorder = StageRecorder()
+    fakes = install_fakes(args, recorder) if not args.url else None
+    replay = load_replay(args.replay, os.environ["TARGET_CHANNEL_ID"]) if args.replay else None
+    payloads = list(generate(args.events, os.environ["TARGET_CHANNEL_ID"], replay=replay,
+                             other_channel_share=args.ignored_share / 2, bot_share=args.ignored_share / 2))
+
+    started = time.perf_counter()
+    output = sys.stdout if args.verbose else open(os.devnull, "w")
+    with contextlib.redirect_stdout(output):
+        run = run_pipeline_mode(args, payloads) if args.mode == "pipeline" else run_endpoint_mode(args, payloads)
+        if fakes is not None:
+            # 送信キューに残っている返信も届け終えてから締める
+            from backend.f06_notify.notifier import get_delivery_stats, get_delivery_queue
+            if get_delivery_stats() is not None:
+                get_delivery_queue().close()
+    wall = time.perf_counter() - started
+
+    stages = recorder.report()
+    processed = stages.get("pipeline", {}).get("count", 0)
+    report = {
+        "created_at": datetime.now().isoformat(),
+        "git_commit": git_commit(),
+        "config": {**vars(args), "env": {k: os.environ.get(k) for k in (
+            "PIPELINE_MODE", "PIPELINE_WORKERS", "SLACK_DELIVERY_MODE", "RAG_MODE", "SIMILARITY_MODE",
+            "INTENT_BATCH_WINDOW_MS", "STREAMING_REPLY_ENABLED", "DB_WRITE_BUFFER_ENABLED")}},
+        "wall_seconds": wall,
+        "throughput_eps": (processed or len(payloads)) / wall if wall else 0.0,
+        "run": run,
+        "stages": stages,
+        "external": collect_external(fakes) if fakes is not None else {},
+        "errors": dict(recorder.messages.most_common(10)),
+    }
+
+    out = args.out or os.path.join(RESULTS_DIR, f"bench-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print_report(report)
+    print(f"\n📄 saved: {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import os
+import sys
+import time
+import statistics
+
+# プロジェクトルートへのパス設定
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../")
+
+# ネットワークには出ないが、boto3 がリージョン・認証情報を解決できるようにしておく
+os.environ.setdefault("AWS_DEFAULT_REGION", "ap-northeast-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "bench")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "bench")
+
+from backend.f03_db.database import DynamoDBHandler, get_db_handler, get_db_pool_stats
+
+
+def per_event_cost(factory, events: int) -> list:
+    samples = []
+    for _ in range(events):
+        started = time.perf_counter()
+        factory()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def report(name: str, samples: list):
+    samples = sorted(samples)
+    print(f"{name:<34} mean={statistics.mean(samples) * 1e3:8.3f}ms "
+          f"p50={samples[len(samples) // 2] * 1e3:8.3f}ms max={samples[-1] * 1e3:8.3f}ms")
+
+
+def main(events: int = 200):
+    """
+    1イベントあたりのハンドラ準備コスト (DB へのリクエストは含まない)。
+    実際の AWS 環境では、これに加えて新しい resource ごとに TLS ハンドシェイク
+    (数十ms) が発生するが、共有ハンドラでは keep-alive 接続を使い回すので初回だけで済む。
+    """
+    print(f"events={events}")
+    report("before: DynamoDBHandler() per event", per_event_cost(DynamoDBHandler, events))
+    report("after:  get_db_handler()", per_event_cost(get_db_handler, events))
+    print(get_db_pool_stats())
+
+
+if __name__ == "__main__":
+    main()
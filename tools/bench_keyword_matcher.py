@@ -0,0 +1,57 @@
+import os
+import sys
+import timeit
+
+# プロジェクトルートへのパス設定
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../")
+
+from backend.f02_filter.keywords import KEYWORD_CATEGORIES, matcher
+
+# 旧実装と同じ「キーワードごとに部分文字列検索」のベースライン
+ALL_KEYWORDS = [k for words in KEYWORD_CATEGORIES.values() for k in words]
+
+
+def legacy_any(text: str) -> bool:
+    text_lower = text.lower()
+    return any(k in text_lower for k in ALL_KEYWORDS)
+
+
+def legacy_all(text: str) -> dict:
+    # 一致した全キーワードを集める場合 (新実装と同じ情報量)
+    text_lower = text.lower()
+    return {k: None for k in ALL_KEYWORDS if k in text_lower}
+
+
+def make_traceback(frames: int) -> str:
+    lines = ["Traceback (most recent call last):"]
+    for i in range(frames):
+        lines.append(f'  File "/srv/app/services/module_{i}.py", line {100 + i}, in handler_{i}')
+        lines.append(f"    result = self._dispatch(payload, retries={i % 3})")
+    lines.append("sqlalchemy.exc.OperationalError: (psycopg2.OperationalError) could not connect to server")
+    return "\n".join(lines)
+
+
+SAMPLES = {
+    "short_chat": "ありがとうございます、助かりました",
+    "short_question": "docker compose が起動しないのですが、どうすればいいですか？",
+    "traceback_20": make_traceback(20),
+    "traceback_200": make_traceback(200),
+}
+
+
+def bench(number: int = 200):
+    backend = "aho-corasick" if matcher._automaton is not None else "substring (pyahocorasick not installed)"
+    print(f"matcher backend: {backend}")
+    print(f"{'sample':<16}{'chars':>8}{'legacy any()':>16}{'legacy all':>16}{'matcher':>16}")
+    for name, text in SAMPLES.items():
+        t_any = timeit.timeit(lambda: legacy_any(text), number=number) / number
+        t_all = timeit.timeit(lambda: legacy_all(text), number=number) / number
+        t_new = timeit.timeit(lambda: matcher.match(text), number=number) / number
+        print(f"{name:<16}{len(text):>8}{t_any * 1e6:>14.1f}us{t_all * 1e6:>14.1f}us{t_new * 1e6:>14.1f}us")
+
+        # 新実装が旧実装の一致を全て拾えていること
+        assert set(legacy_all(text)) == set(matcher.match(text).keywords), name
+
+
+if __name__ == "__main__":
+    bench()
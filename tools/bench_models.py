@@ -0,0 +1,123 @@
+import os
+import sys
+import json
+import timeit
+import tracemalloc
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+# プロジェクトルートへのパス設定
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../")
+
+from backend.common.models import SlackMessage, FeedbackResponse, JSON_BACKEND
+
+
+# 旧実装 (slots なしの dataclass + asdict / cls(**data)) のベースライン
+@dataclass
+class LegacySlackMessage:
+    event_id: str
+    user_id: str
+    text_content: str
+    channel_id: str
+    ts: str
+    source: str = "slack"
+    intent_tag: Optional[str] = None
+    status: str = "pending"
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(**data)
+
+    def to_dict(self):
+        return asdict(self)
+
+
+@dataclass
+class LegacyFeedbackResponse:
+    event_id: str
+    target_user_id: str
+    ts: str
+    feedback_summary: str
+    status: str = "complete"
+
+    def to_dict(self):
+        return asdict(self)
+
+
+MESSAGE = dict(
+    event_id="evt_1700000000.000100", user_id="U01234567", channel_id="C01234567",
+    text_content="docker compose up でコンテナが起動しません。ログは以下です\n" + "error: port is already allocated\n" * 10,
+    ts="1700000000.000100", intent_tag="question", status="received",
+)
+FEEDBACK = dict(
+    event_id="evt_1700000000.000100", target_user_id="U01234567", ts="1700000000.000100",
+    feedback_summary="【スコア】質問: 7/10\n【今回のメッセージへの改善点】\n- " + "再現手順とエラーメッセージを添えてください。" * 20,
+)
+
+
+def per_event_legacy():
+    """旧実装で1イベントにかかる変換 (キュー投入・取り出し・DB 項目・アーカイブ)"""
+    message = LegacySlackMessage(**MESSAGE)
+    body = json.dumps(message.to_dict())
+    message = LegacySlackMessage.from_dict(json.loads(body))
+    item = {"ts": message.ts, "user_id": message.user_id, "channel_id": message.channel_id,
+            "text": message.text_content, "status": message.status, "intent_tag": message.intent_tag}
+    record = LegacyFeedbackResponse(**FEEDBACK).to_dict()
+    return item, json.dumps(record, ensure_ascii=False)
+
+
+def per_event_new():
+    message = SlackMessage(**MESSAGE)
+    body = message.to_json()
+    message = SlackMessage.from_json(body)
+    item = message.to_item()
+    return item, FeedbackResponse(**FEEDBACK).to_json()
+
+
+def memory_per_object(factory, count: int = 10000) -> float:
+    """1オブジェクトあたりの確保バイト数 (文字列は共有なので、オブジェクト本体の差が出る)"""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    objects = [factory() for _ in range(count)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del objects
+    return size / count
+
+
+def bench(number: int = 20000):
+    print(f"json backend: {JSON_BACKEND}")
+    legacy_body = json.dumps(LegacySlackMessage(**MESSAGE).to_dict())
+    body = SlackMessage(**MESSAGE).to_json()
+    print(f"{'operation':<28}{'legacy':>12}{'slots':>12}")
+    rows = [
+        ("SlackMessage.to_dict", lambda: LegacySlackMessage(**MESSAGE).to_dict(), lambda: SlackMessage(**MESSAGE).to_dict()),
+        ("SlackMessage -> JSON", lambda: json.dumps(LegacySlackMessage(**MESSAGE).to_dict()).encode(),
+         lambda: SlackMessage(**MESSAGE).to_json()),
+        ("JSON -> SlackMessage", lambda: LegacySlackMessage.from_dict(json.loads(legacy_body)),
+         lambda: SlackMessage.from_json(body)),
+        ("FeedbackResponse.to_dict", lambda: LegacyFeedbackResponse(**FEEDBACK).to_dict(),
+         lambda: FeedbackResponse(**FEEDBACK).to_dict()),
+        ("per event (total)", per_event_legacy, per_event_new),
+    ]
+    for name, legacy, new in rows:
+        t_legacy = timeit.timeit(legacy, number=number) / number
+        t_new = timeit.timeit(new, number=number) / number
+        print(f"{name:<28}{t_legacy * 1e6:>10.2f}us{t_new * 1e6:>10.2f}us")
+
+    print(f"{'bytes per SlackMessage':<28}{memory_per_object(lambda: LegacySlackMessage(**MESSAGE)):>12.0f}"
+          f"{memory_per_object(lambda: SlackMessage(**MESSAGE)):>12.0f}")
+    print(f"{'bytes per FeedbackResponse':<28}{memory_per_object(lambda: LegacyFeedbackResponse(**FEEDBACK)):>12.0f}"
+          f"{memory_per_object(lambda: FeedbackResponse(**FEEDBACK)):>12.0f}")
+
+    # 変換の往復で値が変わらないこと
+    message = SlackMessage(**MESSAGE)
+    assert SlackMessage.from_json(message.to_json()) == message
+    assert SlackMessage.from_item(message.to_item()) == message
+    feedback = FeedbackResponse(**FEEDBACK)
+    assert FeedbackResponse.from_json(feedback.to_json()) == feedback
+
+
+if __name__ == "__main__":
+    bench()
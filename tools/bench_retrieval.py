@@ -0,0 +1,77 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+
+import numpy as np
+
+# プロジェクトルートへのパス設定
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../")
+
+from backend.f04_gen.retrieval import VectorIndex, HashingEmbedder, EMBEDDING_DIM
+
+
+def build(path: str, rows: int, dim: int, channels: int, chunk: int = 100000):
+    """ランダムな正規化ベクトルで rows 件のインデックスを作る"""
+    rng = np.random.default_rng(0)
+    index = VectorIndex(path, dim)
+    base_ts = 1_700_000_000.0
+    for start in range(0, rows, chunk):
+        n = min(chunk, rows - start)
+        vectors = rng.standard_normal((n, dim), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        metas = [(base_ts + start + i, f"C{(start + i) % channels:08d}", f"{base_ts + start + i:.6f}") for i in range(n)]
+        index.add(vectors, metas)
+
+
+def report(name: str, samples: list):
+    samples = sorted(samples)
+    print(f"{name:<28} p50={samples[len(samples) // 2] * 1e3:8.3f}ms "
+          f"p95={samples[int(len(samples) * 0.95)] * 1e3:8.3f}ms mean={statistics.mean(samples) * 1e3:8.3f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="[F-04] ベクトルインデックスの検索レイテンシ")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--dim", type=int, default=EMBEDDING_DIM)
+    parser.add_argument("--channels", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "index")
+        started = time.perf_counter()
+        build(path, args.rows, args.dim, args.channels)
+        print(f"rows={args.rows} dim={args.dim} channels={args.channels} build={time.perf_counter() - started:.1f}s")
+
+        started = time.perf_counter()
+        index = VectorIndex(path, args.dim)
+        print(f"open (memmap + channel rows)  {(time.perf_counter() - started) * 1e3:8.3f}ms")
+
+        query = HashingEmbedder(args.dim).embed(["docker compose が起動しない"])[0]
+        rng = np.random.default_rng(1)
+        channel_samples, window_samples, all_samples = [], [], []
+        for _ in range(args.queries):
+            channel = f"C{rng.integers(args.channels):08d}"
+            started = time.perf_counter()
+            index.search(query, k=5, channel_id=channel)
+            channel_samples.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            index.search(query, k=5, channel_id=channel, since=1_700_000_000.0 + args.rows / 2)
+            window_samples.append(time.perf_counter() - started)
+
+        for _ in range(max(3, args.queries // 10)):
+            started = time.perf_counter()
+            index.search(query, k=5)
+            all_samples.append(time.perf_counter() - started)
+
+        report("channel top-5", channel_samples)
+        report("channel + time window", window_samples)
+        report("all channels top-5", all_samples)
+
+
+if __name__ == "__main__":
+    main()
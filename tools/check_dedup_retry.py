@@ -0,0 +1,80 @@
+import os
+import sys
+import json
+
+# プロジェクトルートへのパス設定
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../")
+
+# 受信口は import 時に設定を読むので、先に入れておく
+SIGNING_SECRET = "dedup-retry-check"
+CHANNEL_ID = "C_DEDUP_CHECK"
+os.environ["SLACK_SIGNING_SECRET"] = SIGNING_SECRET
+os.environ["TARGET_CHANNEL_ID"] = CHANNEL_ID
+os.environ["PIPELINE_OVERFLOW_POLICY"] = "reject"
+os.environ["PIPELINE_MODE"] = "thread"
+
+from tools.bench.loadgen import make_event, sign, flask_sender, asgi_sender
+from tools.local_dynamodb import LocalTable
+from backend.f01_listener import dispatch
+from backend.f01_listener.dedup import EventDeduplicator
+from backend.f01_listener.executor import ACCEPTED, REJECTED
+
+
+class ScriptedSubmit:
+    """executor.submit の結果を順に返す (キューが溢れた → 空いた、を再現する)"""
+
+    def __init__(self, results):
+        self.results = list(results)
+        self.messages = []
+
+    def __call__(self, message):
+        self.messages.append(message)
+        return self.results.pop(0)
+
+
+def check(name: str, send_factory, dedup_table=None):
+    """
+    1回目: 実行器が REJECTED → 503 (Slack は再送する)
+    2回目 (再送): ACCEPTED → 200 ok (重複として捨てられないこと)
+    3回目 (再送の再送): ignored_duplicate
+    """
+    db_handler = None
+    if dedup_table is not None:
+        from backend.f03_db.database import DynamoDBHandler
+        db_handler = DynamoDBHandler(table=LocalTable(), dedup_table=dedup_table)
+    dispatch._deduplicator = EventDeduplicator(db_handler=db_handler)
+    submit = ScriptedSubmit([REJECTED, ACCEPTED])
+    dispatch.executor.submit = submit
+
+    body = json.dumps(make_event(1, "docker が起動しません。どうすれば？", CHANNEL_ID)).encode("utf-8")
+    send = send_factory()
+    statuses = [send(body, sign(SIGNING_SECRET, body))]
+    for retry in (1, 2):
+        statuses.append(send(body, {**sign(SIGNING_SECRET, body), "X-Slack-Retry-Num": str(retry)}))
+
+    assert statuses == [503, 200, 200], f"{name}: unexpected statuses {statuses}"
+    assert len(submit.messages) == 2, f"{name}: retry was not submitted ({len(submit.messages)} submits)"
+    stats = dispatch.get_deduplicator().stats()
+    assert stats["released"] == 1 and stats["hits"] == 1, f"{name}: unexpected dedup stats {stats}"
+    if dedup_table is not None:
+        assert len(dedup_table) == 1, f"{name}: claim was not restored after the retry"
+    print(f"✅ {name}: 503 → retry accepted → duplicate ignored")
+
+
+def main():
+    from backend.f01_listener.server import app as flask_app
+    from backend.f01_listener.asgi import app as asgi_app
+
+    original_submit = dispatch.executor.submit
+    try:
+        check("flask / memory", flask_sender(flask_app))
+        check("asgi / memory", asgi_sender(asgi_app))
+        check("flask / dynamodb", flask_sender(flask_app), dedup_table=LocalTable(hash_key="dedup_key"))
+        check("asgi / dynamodb", asgi_sender(asgi_app), dedup_table=LocalTable(hash_key="dedup_key"))
+    finally:
+        dispatch.executor.submit = original_submit
+        dispatch._deduplicator = None
+
+
+if __name__ == "__main__":
+    main()
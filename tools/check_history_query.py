@@ -0,0 +1,68 @@
+import os
+import sys
+
+# プロジェクトルートへのパス設定
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../")
+
+from tools.local_dynamodb import LocalTable, history_table
+import backend.f03_db.database as database
+from backend.f03_db.history_cache import ChannelHistoryCache
+
+CHANNELS = [f"C{i:04d}" for i in range(50)]
+TARGET = CHANNELS[0]
+
+
+def fill(table: LocalTable, size: int):
+    for i in range(size):
+        table.put_item(Item={
+            "ts": f"{1700000000 + i}.{i:06d}",
+            "channel_id": CHANNELS[i % len(CHANNELS)],
+            "user_id": f"U{i % 7}",
+            "text": f"message {i} " + "x" * 200,
+            "status": "received",
+            "intent_tag": "chat",
+        })
+
+
+def expected_history(size: int, limit: int) -> list:
+    rows = [i for i in range(size) if CHANNELS[i % len(CHANNELS)] == TARGET][-limit:]
+    return [f"User U{i % 7}: message {i} " + "x" * 200 for i in rows]
+
+
+def measure(table: LocalTable, size: int, limit: int = 10):
+    # 冷えた状態 (DB から読む経路) を測るため、リングバッファは毎回作り直す
+    database.history_cache = ChannelHistoryCache()
+    handler = database.DynamoDBHandler(table=table)
+    before = table.consumed_read_units
+    history = handler.get_recent_history(TARGET, limit=limit)
+    units = table.consumed_read_units - before
+
+    assert history.split("\n") == expected_history(size, limit), "history mismatch"
+    return units
+
+
+def main():
+    print(f"{'items':>8}{'query RCU':>12}{'scan RCU':>12}")
+    query_units = set()
+    for size in (1_000, 10_000, 100_000):
+        # GSI あり: Query
+        database._history_index_available = True
+        table = history_table()
+        fill(table, size)
+        q = measure(table, size)
+        query_units.add(q)
+
+        # GSI なし: Scan フォールバック
+        bare = LocalTable(hash_key="ts")
+        fill(bare, size)
+        s = measure(bare, size)
+
+        print(f"{size:>8}{q:>12.1f}{s:>12.1f}")
+
+    # テーブルの大きさによらず Query の読み込み量は一定
+    assert len(query_units) == 1, query_units
+    print("✅ get_recent_history reads a constant number of units regardless of table size")
+
+
+if __name__ == "__main__":
+    main()
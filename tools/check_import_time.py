@@ -0,0 +1,93 @@
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+# プロジェクトルート
+ROOT = os.path.abspath(os.path.dirname(os.path.abspath(__file__)) + "/../")
+
+# Lambda のエントリーポイント (serverless.yml の custom.wsgi.app)
+ENTRY_MODULE = "backend.f01_listener.server"
+# 受信側 (URL検証・対象外イベントへの応答) で読み込まれてはいけない重いモジュール
+FORBIDDEN_MODULES = (
+    "google.genai", "google.generativeai", "boto3", "botocore", "slack_sdk", "numpy", "backend.main",
+)
+IMPORT_TIME_BUDGET_MS = float(os.getenv("IMPORT_TIME_BUDGET_MS", "500"))
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+def profile(module: str) -> list:
+    """
+    python -X importtime で module を import し、module が読み込んだものについて
+    (モジュール名, self µs, cumulative µs, 深さ) を返す (最後の行が module 自身)
+    """
+    env = dict(os.environ)
+    # server.py は署名シークレットがないと終了するので、ダミーを入れておく
+    env.setdefault("SLACK_SIGNING_SECRET", "import-time-check")
+    env.setdefault("TARGET_CHANNEL_ID", "C00000000")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    rows = []
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        depth = len(indent) // 2
+        if depth == 0 and name != module:
+            # site など、対象より前に読み込まれたものは数えない
+            rows = []
+            continue
+        rows.append((name, int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="[F-01] Lambda エントリーポイントの import 時間 (コールドスタート) チェック")
+    parser.add_argument("--module", default=ENTRY_MODULE)
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_TIME_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=3, help="ばらつきを抑えるため、最も速かった回で判定する")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    best = None
+    for _ in range(max(1, args.runs)):
+        rows = profile(args.module)
+        total = rows[-1][2]
+        if best is None or total < best[0]:
+            best = (total, rows)
+    total, rows = best
+
+    # 直下で読み込まれたパッケージごとの内訳 (深さ1) と、読み込まれた重いモジュール
+    print(f"import {args.module}: {total / 1000:.1f}ms (budget {args.budget_ms:.0f}ms, best of {args.runs})")
+    print(f"{'cumulative':>12}{'self':>10}  module")
+    direct = sorted((r for r in rows if r[3] == 1), key=lambda r: r[2], reverse=True)
+    for name, self_us, cumulative_us, _ in direct[:args.top]:
+        print(f"{cumulative_us / 1000:>10.1f}ms{self_us / 1000:>8.1f}ms  {name}")
+
+    loaded = {name for name, *_ in rows}
+    forbidden = sorted(name for name in loaded
+                       if any(name == m or name.startswith(m + ".") for m in FORBIDDEN_MODULES))
+
+    failures = []
+    if forbidden:
+        failures.append(f"heavy modules imported at startup: {', '.join(forbidden[:10])}"
+                        + (" ..." if len(forbidden) > 10 else ""))
+    if total / 1000 > args.budget_ms:
+        failures.append(f"import time {total / 1000:.1f}ms exceeds budget {args.budget_ms:.0f}ms")
+
+    if failures:
+        for failure in failures:
+            print(f"❌ {failure}")
+        sys.exit(1)
+    print("✅ cold-start import check passed")
+
+
+if __name__ == "__main__":
+    main()
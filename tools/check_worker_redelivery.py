@@ -0,0 +1,81 @@
+import os
+import sys
+import tempfile
+
+# プロジェクトルートへのパス設定
+ROOT = os.path.dirname(os.path.abspath(__file__)) + "/../"
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "tools"))
+
+# backend を import する前に、外部に出ないための設定を入れる
+WORKDIR = tempfile.mkdtemp(prefix="slacker-redelivery-")
+os.environ.update({
+    "GEMINI_API_KEY": "check",
+    "SLACK_BOT_TOKEN": "xoxb-check",
+    "SIMILARITY_MODE": "off",
+    "DB_WRITE_BUFFER_ENABLED": "false",
+    "SLACK_DELIVERY_MAX_ATTEMPTS": "1",
+    "WORK_QUEUE_RETRY_BASE_SECONDS": "0",
+    "DATA_DIR": WORKDIR,
+    "ARCHIVE_PATH": os.path.join(WORKDIR, "archive.jsonl"),
+})
+
+from local_dynamodb import history_table
+from bench.fakes import FakeGeminiClient, FakeIntentModel, FakeSlackClient
+import backend.f02_filter.filter as intent_filter
+import backend.f03_db.database as database
+import backend.f04_gen.generator as generator
+import backend.f06_notify.notifier as notifier
+from backend.common.models import SlackMessage
+from backend.f01_listener.work_queue import SQLiteWorkQueue
+from backend.worker import process_message
+from backend.main import run_queued_pipeline
+
+
+def receive(work_queue) -> dict:
+    messages = work_queue.receive_message(MaxNumberOfMessages=1, AttributeNames=["ApproximateReceiveCount"])
+    assert messages.get("Messages"), "no message to receive"
+    return messages["Messages"][0]
+
+
+def main():
+    """
+    1回目: Slack への送信が失敗 → メッセージは消えずに再配信される
+    2回目 (再配信): 保存済みの回答を送るだけ (Gemini は呼ばない)
+    3回目 (同じメッセージの重複配信): 配信済みなので何もしない
+    """
+    gemini = FakeGeminiClient(latency=0.0)
+    generator.client = gemini
+    intent_filter._model = FakeIntentModel(latency=0.0)
+    database._shared_handler = database.DynamoDBHandler(table=history_table(), dedup_table=history_table())
+    failing_slack = FakeSlackClient(latency=0.0, error_rate=1.0, ratelimit_share=0.0)
+    notifier.client = failing_slack
+    notifier.get_delivery_queue().client = failing_slack
+
+    work_queue = SQLiteWorkQueue(path=os.path.join(WORKDIR, "work_queue.sqlite3"))
+    body = SlackMessage(
+        event_id="evt_1700000000.000100", user_id="U01234567", channel_id="C01234567",
+        text_content="docker compose up でコンテナが起動しません。どうすれば直りますか？",
+        ts="1700000000.000100", intent_tag="pending", status="received",
+    ).to_json().decode("utf-8")
+    work_queue.send_message(MessageBody=body)
+
+    assert not process_message(work_queue, receive(work_queue), run_queued_pipeline), "delivery failure was not retried"
+    assert gemini.stats.calls.get("generate_content") == 1
+
+    healthy_slack = FakeSlackClient(latency=0.0)
+    notifier.client = healthy_slack
+    notifier.get_delivery_queue().client = healthy_slack
+    assert process_message(work_queue, receive(work_queue), run_queued_pipeline), "redelivered message failed"
+    assert gemini.stats.calls.get("generate_content") == 1, "redelivery called Gemini again"
+    assert len(healthy_slack.posted) == 1
+
+    work_queue.send_message(MessageBody=body)
+    assert process_message(work_queue, receive(work_queue), run_queued_pipeline)
+    assert len(healthy_slack.posted) == 1, "duplicate delivery posted the reply twice"
+    assert work_queue.get_queue_attributes()["Attributes"]["ApproximateNumberOfMessages"] == "0"
+    print("✅ worker redelivery: failed send retried → resumed without regenerating → duplicate skipped")
+
+
+if __name__ == "__main__":
+    main()
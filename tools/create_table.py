@@ -1,32 +1,63 @@
 import os
+import sys
 import boto3
 from dotenv import load_dotenv
 
 # 1. .envから環境変数を読み込む
 load_dotenv()
 
+# 過去ログ取得 (get_recent_history) 用の GSI 定義
+# channel_id ごとに ts の降順で Query できるようにし、プロンプトに使う user_id / text だけを射影する
+HISTORY_INDEX = {
+    'IndexName': os.getenv("DYNAMODB_HISTORY_INDEX", "channel_id-ts-index"),
+    'KeySchema': [
+        {
+            'AttributeName': 'channel_id',
+            'KeyType': 'HASH'
+        },
+        {
+            'AttributeName': 'ts',
+            'KeyType': 'RANGE'  # RANGE = ソートキー
+        }
+    ],
+    'Projection': {
+        'ProjectionType': 'INCLUDE',
+        'NonKeyAttributes': ['user_id', 'text']
+    },
+    'ProvisionedThroughput': {
+        'ReadCapacityUnits': 1,
+        'WriteCapacityUnits': 1
+    }
+}
+
 def create_slacker_table():
     # 2. DynamoDBのリソースオブジェクトを取得
     dynamodb = boto3.resource('dynamodb', region_name=os.getenv("AWS_DEFAULT_REGION"))
 
     try:
         # 3. テーブル作成の命令を出す
+        # (backend/f03_db/database.py の DynamoDBHandler と同じテーブル名・キー)
         table = dynamodb.create_table(
-            TableName='SlackerEvents',  # テーブル名
+            TableName=os.getenv("DYNAMODB_TABLE", "SlackerFeedback"),  # テーブル名
             # 4. キーの役割（スキーマ）を定義
             KeySchema=[
                 {
-                    'AttributeName': 'event_id',
+                    'AttributeName': 'ts',
                     'KeyType': 'HASH'  # HASH = パーティションキー
                 }
             ],
             # 5. キーとして使う属性の「型」を定義
             AttributeDefinitions=[
                 {
-                    'AttributeName': 'event_id',
+                    'AttributeName': 'ts',
                     'AttributeType': 'S'  # S = String（文字列）
+                },
+                {
+                    'AttributeName': 'channel_id',
+                    'AttributeType': 'S'
                 }
             ],
+            GlobalSecondaryIndexes=[HISTORY_INDEX],
             # 6. 課金モードと性能の設定
             ProvisionedThroughput={
                 'ReadCapacityUnits': 1,
@@ -42,6 +73,68 @@ def create_slacker_table():
     except Exception as e:
         print(f"❌ エラーが発生した: {e}")
 
+def add_history_index():
+    """既存テーブルに過去ログ取得用の GSI を追加する"""
+    client = boto3.client('dynamodb', region_name=os.getenv("AWS_DEFAULT_REGION"))
+    table_name = os.getenv("DYNAMODB_TABLE", "SlackerFeedback")
+
+    try:
+        client.update_table(
+            TableName=table_name,
+            AttributeDefinitions=[
+                {'AttributeName': 'ts', 'AttributeType': 'S'},
+                {'AttributeName': 'channel_id', 'AttributeType': 'S'}
+            ],
+            GlobalSecondaryIndexUpdates=[{'Create': HISTORY_INDEX}]
+        )
+        print(f"⌛ {table_name} に {HISTORY_INDEX['IndexName']} を作成中... (バックフィル完了までは Scan で代用されます)")
+    except Exception as e:
+        print(f"❌ エラーが発生した: {e}")
+
+def create_dedup_table():
+    """
+    重複イベント排除用テーブル (EVENT_DEDUP_BACKEND=dynamodb のときに使用)
+    expires_at を TTL 属性にして、古いキーは DynamoDB に自動削除させる。
+    """
+    dynamodb = boto3.resource('dynamodb', region_name=os.getenv("AWS_DEFAULT_REGION"))
+    table_name = os.getenv("DYNAMODB_DEDUP_TABLE", "SlackerEventDedup")
+
+    try:
+        table = dynamodb.create_table(
+            TableName=table_name,
+            KeySchema=[
+                {
+                    'AttributeName': 'dedup_key',
+                    'KeyType': 'HASH'
+                }
+            ],
+            AttributeDefinitions=[
+                {
+                    'AttributeName': 'dedup_key',
+                    'AttributeType': 'S'
+                }
+            ],
+            BillingMode='PAY_PER_REQUEST'
+        )
+
+        print("⌛ テーブル作成中...")
+        table.wait_until_exists()
+
+        # TTL の有効化
+        dynamodb.meta.client.update_time_to_live(
+            TableName=table_name,
+            TimeToLiveSpecification={'Enabled': True, 'AttributeName': 'expires_at'}
+        )
+        print(f"✅ テーブル {table.table_name} が正常に作成された。")
+
+    except Exception as e:
+        print(f"❌ エラーが発生した: {e}")
+
 if __name__ == "__main__":
-    create_slacker_table()
+    if "--add-history-index" in sys.argv:
+        add_history_index()
+    else:
+        create_slacker_table()
+    if os.getenv("EVENT_DEDUP_BACKEND") == "dynamodb":
+        create_dedup_table()
 
@@ -0,0 +1,49 @@
+import os
+import sys
+import json
+import argparse
+
+# プロジェクトルートへのパス設定
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../")
+
+from backend.f05_archive.writer import ARCHIVE_PATH
+from backend.f05_archive.columnar import (
+    ARCHIVE_EXPORT_DIR, export_archive, compact, day_range,
+    user_counts, intent_distribution, answer_length_percentiles,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="[F-05] アーカイブの列指向エクスポートと集計")
+    parser.add_argument("--archive", default=ARCHIVE_PATH, help="アーカイブ (JSONL) のパス")
+    parser.add_argument("--out", default=ARCHIVE_EXPORT_DIR, help="エクスポート先ディレクトリ")
+    parser.add_argument("--format", choices=["parquet", "npz"], help="省略時は pyarrow があれば parquet")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("export", help="前回の続きから差分エクスポートする")
+    sub.add_parser("compact", help="日付ごとの part ファイルを1つにまとめる")
+    query = sub.add_parser("query", help="よく使う集計を表示する")
+    query.add_argument("what", choices=["users", "intents", "answer-length"])
+    query.add_argument("--days", type=int, help="直近 N 日分")
+    query.add_argument("--start", help="開始日時 (ISO形式)")
+    query.add_argument("--end", help="終了日時 (ISO形式, この時刻は含まない)")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        result = export_archive(args.archive, args.out, args.format)
+        print(f"✅ {result['records']} 件をエクスポートしました ({result['format']}): {', '.join(result['partitions']) or '-'}")
+    elif args.command == "compact":
+        print(f"✅ {compact(args.out, args.format)} 個のパーティションをまとめました")
+    else:
+        start, end = day_range(args.days) if args.days else (args.start, args.end)
+        if args.what == "users":
+            result = user_counts(start, end, args.out)
+        elif args.what == "intents":
+            result = intent_distribution(start, end, args.out)
+        else:
+            result = answer_length_percentiles(start, end, root=args.out)
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,397 @@
+"""
+DynamoDB テーブルのローカル代替 (ベンチマーク・動作確認用)
+
+boto3 の Table リソースのうち、DynamoDBHandler が使う操作だけを
+メモリ上で再現する。AWS と同じ規則で消費キャパシティ (RCU / WCU) を数えるので、
+「テーブルが大きくなっても読み込み量が変わらないか」などを AWS なしで確かめられる。
+"""
+import re
+import math
+import time
+import bisect
+import random
+import threading
+
+from boto3.dynamodb.conditions import ConditionBase
+from botocore.exceptions import ClientError
+
+PAGE_BYTES = 1024 * 1024  # 1回の Query / Scan で読む上限 (1MB)
+
+
+def _item_size(item: dict) -> int:
+    """属性名 + 値のバイト数 (DynamoDB の項目サイズの近似)"""
+    return sum(len(k.encode()) + len(str(v).encode()) for k, v in item.items())
+
+
+def _read_units(size: int) -> float:
+    # 結果整合性読み込み: 4KB ごとに 0.5 RCU
+    return math.ceil(max(size, 1) / 4096) * 0.5
+
+
+def _write_units(size: int) -> float:
+    return float(math.ceil(max(size, 1) / 1024))
+
+
+def _client_error(code: str, message: str, operation: str) -> ClientError:
+    return ClientError({"Error": {"Code": code, "Message": message}}, operation)
+
+
+def _resolve(name: str, names: dict) -> str:
+    return names.get(name, name) if name.startswith("#") else name
+
+
+def _project(item: dict, projection: str, names: dict) -> dict:
+    if not projection:
+        return dict(item)
+    attrs = [_resolve(a.strip(), names) for a in projection.split(",")]
+    return {a: item[a] for a in attrs if a in item}
+
+
+def _eval_condition(cond, item: dict) -> bool:
+    """boto3.dynamodb.conditions の Equals / And / Or / BeginsWith / Between などを評価する"""
+    expr = cond.get_expression()
+    op = expr["operator"]
+    values = expr["values"]
+    if op in ("AND", "OR"):
+        results = [_eval_condition(v, item) for v in values]
+        return all(results) if op == "AND" else any(results)
+    if op == "NOT":
+        return not _eval_condition(values[0], item)
+
+    name = values[0].name
+    if op == "attribute_exists":
+        return name in item
+    if op == "attribute_not_exists":
+        return name not in item
+    if name not in item:
+        return False
+    actual = item[name]
+    if op == "=":
+        return actual == values[1]
+    if op == "<>":
+        return actual != values[1]
+    if op == "<":
+        return actual < values[1]
+    if op == "<=":
+        return actual <= values[1]
+    if op == ">":
+        return actual > values[1]
+    if op == ">=":
+        return actual >= values[1]
+    if op == "begins_with":
+        return str(actual).startswith(values[1])
+    if op == "BETWEEN":
+        return values[1] <= actual <= values[2]
+    raise NotImplementedError(f"Unsupported condition operator: {op}")
+
+
+_NOT_EXISTS = re.compile(r"^attribute_not_exists\((\S+)\)$")
+_EXISTS = re.compile(r"^attribute_exists\((\S+)\)$")
+_COMPARE = re.compile(r"^(\S+)\s*(=|<>|<=|>=|<|>)\s*(:\S+)$")
+
+
+def _eval_condition_string(expression: str, item: dict, names: dict, values: dict) -> bool:
+    """'attribute_not_exists(k) OR expires_at < :now' 程度の単純な文字列条件を評価する"""
+    for disjunct in re.split(r"\s+OR\s+", expression.strip()):
+        ok = True
+        for term in re.split(r"\s+AND\s+", disjunct.strip()):
+            term = term.strip()
+            if m := _NOT_EXISTS.match(term):
+                ok = _resolve(m.group(1), names) not in item
+            elif m := _EXISTS.match(term):
+                ok = _resolve(m.group(1), names) in item
+            elif m := _COMPARE.match(term):
+                name, op, placeholder = _resolve(m.group(1), names), m.group(2), m.group(3)
+                if name not in item:
+                    ok = False
+                else:
+                    a, b = item[name], values[placeholder]
+                    ok = {"=": a == b, "<>": a != b, "<": a < b, "<=": a <= b, ">": a > b, ">=": a >= b}[op]
+            else:
+                raise NotImplementedError(f"Unsupported condition: {term}")
+            if not ok:
+                break
+        if ok:
+            return True
+    return False
+
+
+class LocalTable:
+    """
+    DynamoDB テーブルのメモリ内代替。
+    indexes: {index_name: (hash_key, range_key, [射影する非キー属性])}
+    latency: 1回の API 呼び出しにかける擬似的な遅延 (秒)。(平均, ばらつき) も指定できる
+    error_rate: 指定した確率で ProvisionedThroughputExceededException を返す
+    """
+
+    def __init__(self, hash_key: str = "ts", indexes: dict = None, latency=0.0, error_rate: float = 0.0, name: str = "LocalTable"):
+        self.name = name
+        self.table_name = name
+        self.hash_key = hash_key
+        self.indexes = indexes or {}
+        self.latency = latency
+        self.error_rate = error_rate
+
+        self._items = {}       # hash -> item
+        self._order = []       # Scan の順序 (挿入順)
+        self._position = {}    # hash -> _order 上の位置
+        self._index_data = {name: {} for name in self.indexes}  # index -> hash値 -> [(range, table_key)]
+        self._lock = threading.RLock()
+        self._random = random.Random(0)
+
+        self.consumed_read_units = 0.0
+        self.consumed_write_units = 0.0
+        self.calls = {}
+
+    # ---------------------------------------------------------
+    # 共通処理
+    # ---------------------------------------------------------
+    def _enter(self, operation: str):
+        # 遅延はロックの外でかける (並列リクエストが直列化されないように)
+        with self._lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+        if isinstance(self.latency, tuple):
+            mean, jitter = self.latency
+            delay = max(0.0, self._random.gauss(mean, jitter))
+        else:
+            delay = self.latency
+        if delay:
+            time.sleep(delay)
+        if self.error_rate and self._random.random() < self.error_rate:
+            raise _client_error("ProvisionedThroughputExceededException", "Rate exceeded (local stand-in)", operation)
+
+    def _index_put(self, item: dict):
+        key = item[self.hash_key]
+        for name, (hash_attr, range_attr, _) in self.indexes.items():
+            if hash_attr in item and range_attr in item:
+                entries = self._index_data[name].setdefault(item[hash_attr], [])
+                bisect.insort(entries, (item[range_attr], key))
+
+    def _index_remove(self, item: dict):
+        key = item[self.hash_key]
+        for name, (hash_attr, range_attr, _) in self.indexes.items():
+            if hash_attr in item and range_attr in item:
+                entries = self._index_data[name].get(item[hash_attr], [])
+                i = bisect.bisect_left(entries, (item[range_attr], key))
+                if i < len(entries) and entries[i] == (item[range_attr], key):
+                    entries.pop(i)
+
+    def _store(self, item: dict):
+        key = item[self.hash_key]
+        old = self._items.get(key)
+        if old is not None:
+            self._index_remove(old)
+        else:
+            self._position[key] = len(self._order)
+            self._order.append(key)
+        self._items[key] = item
+        self._index_put(item)
+
+    def _capacity(self, units: float, kwargs: dict) -> dict:
+        if kwargs.get("ReturnConsumedCapacity") in ("TOTAL", "INDEXES"):
+            return {"ConsumedCapacity": {"TableName": self.name, "CapacityUnits": units}}
+        return {}
+
+    # ---------------------------------------------------------
+    # 書き込み
+    # ---------------------------------------------------------
+    def put_item(self, Item: dict, ConditionExpression=None, ExpressionAttributeNames=None,
+                 ExpressionAttributeValues=None, **kwargs):
+        self._enter("PutItem")
+        with self._lock:
+            current = self._items.get(Item[self.hash_key], {})
+            if ConditionExpression is not None:
+                if isinstance(ConditionExpression, ConditionBase):
+                    ok = _eval_condition(ConditionExpression, current)
+                else:
+                    ok = _eval_condition_string(ConditionExpression, current, ExpressionAttributeNames or {},
+                                                ExpressionAttributeValues or {})
+                if not ok:
+                    raise _client_error("ConditionalCheckFailedException", "The conditional request failed", "PutItem")
+            units = _write_units(_item_size(Item))
+            self.consumed_write_units += units
+            self._store(dict(Item))
+            return self._capacity(units, kwargs)
+
+    def update_item(self, Key: dict, UpdateExpression: str, ExpressionAttributeNames=None,
+                    ExpressionAttributeValues=None, ConditionExpression=None, **kwargs):
+        """SET a = :a, #b = :b 形式のみ対応 (存在しなければ作成 = DynamoDB と同じ upsert)"""
+        names = ExpressionAttributeNames or {}
+        values = ExpressionAttributeValues or {}
+        self._enter("UpdateItem")
+        with self._lock:
+            existing = self._items.get(Key[self.hash_key])
+            # 条件は既存の項目で評価する (無ければ空の項目。attribute_exists(ts) は False になる)
+            if ConditionExpression is not None and not _eval_condition_string(ConditionExpression, existing or {},
+                                                                              names, values):
+                raise _client_error("ConditionalCheckFailedException", "The conditional request failed", "UpdateItem")
+            current = dict(existing or Key)
+
+            expression = UpdateExpression.strip()
+            if not expression.upper().startswith("SET "):
+                raise NotImplementedError(f"Unsupported update expression: {UpdateExpression}")
+            updated = {}
+            for assignment in expression[4:].split(","):
+                name, placeholder = (part.strip() for part in assignment.split("="))
+                updated[_resolve(name, names)] = values[placeholder]
+            current.update(updated)
+
+            # 書き込み単位は更新後の項目サイズで数える
+            units = _write_units(_item_size(current))
+            self.consumed_write_units += units
+            self._store(current)
+            return self._capacity(units, kwargs)
+
+    def delete_item(self, Key: dict, **kwargs):
+        self._enter("DeleteItem")
+        with self._lock:
+            item = self._items.pop(Key[self.hash_key], None)
+            if item is None:
+                return self._capacity(1.0, kwargs)
+            self._index_remove(item)
+            self._order.remove(Key[self.hash_key])
+            self._position = {key: i for i, key in enumerate(self._order)}
+            units = _write_units(_item_size(item))
+            self.consumed_write_units += units
+            return self._capacity(units, kwargs)
+
+    def batch_write(self, items: list) -> float:
+        """BatchWriteItem 相当 (最大25件)。消費 WCU を返す"""
+        if len(items) > 25:
+            raise _client_error("ValidationException", "Too many items in BatchWriteItem", "BatchWriteItem")
+        self._enter("BatchWriteItem")
+        with self._lock:
+            units = 0.0
+            for item in items:
+                units += _write_units(_item_size(item))
+                self._store(dict(item))
+            self.consumed_write_units += units
+            return units
+
+    def batch_writer(self, overwrite_by_pkeys=None):
+        """boto3 の Table.batch_writer() 相当 (25件ごとに batch_write する)"""
+        return _LocalBatchWriter(self)
+
+    # ---------------------------------------------------------
+    # 読み込み
+    # ---------------------------------------------------------
+    def get_item(self, Key: dict, **kwargs):
+        self._enter("GetItem")
+        with self._lock:
+            item = self._items.get(Key[self.hash_key])
+            units = _read_units(_item_size(item) if item else 1)
+            self.consumed_read_units += units
+            response = self._capacity(units, kwargs)
+            if item is not None:
+                response["Item"] = dict(item)
+            return response
+
+    def query(self, KeyConditionExpression, IndexName=None, ScanIndexForward=True, Limit=None,
+              ExclusiveStartKey=None, ProjectionExpression=None, ExpressionAttributeNames=None, **kwargs):
+        names = ExpressionAttributeNames or {}
+        self._enter("Query")
+        with self._lock:
+            if IndexName is None:
+                raise NotImplementedError("LocalTable.query supports index queries only")
+            if IndexName not in self.indexes:
+                raise _client_error("ValidationException",
+                                    "The table does not have the specified index: " + IndexName, "Query")
+
+            hash_attr, range_attr, projected = self.indexes[IndexName]
+            expr = KeyConditionExpression.get_expression()
+            if expr["operator"] != "=" or expr["values"][0].name != hash_attr:
+                raise NotImplementedError("LocalTable.query supports 'hash_key = value' conditions only")
+
+            entries = self._index_data[IndexName].get(expr["values"][1], [])
+            if not ScanIndexForward:
+                entries = list(reversed(entries))
+
+            start = 0
+            if ExclusiveStartKey is not None:
+                marker = (ExclusiveStartKey[range_attr], ExclusiveStartKey[self.hash_key])
+                start = entries.index(marker) + 1
+
+            index_attrs = {hash_attr, range_attr, self.hash_key, *projected}
+            items, read_bytes, last = [], 0, None
+            for range_value, table_key in entries[start:]:
+                if Limit is not None and len(items) >= Limit:
+                    break
+                if read_bytes >= PAGE_BYTES:
+                    break
+                entry = {k: v for k, v in self._items[table_key].items() if k in index_attrs}
+                read_bytes += _item_size(entry)
+                items.append(_project(entry, ProjectionExpression, names))
+                last = {hash_attr: entry[hash_attr], range_attr: range_value, self.hash_key: table_key}
+
+            units = _read_units(read_bytes)
+            self.consumed_read_units += units
+            response = {"Items": items, "Count": len(items), "ScannedCount": len(items), **self._capacity(units, kwargs)}
+            if last is not None and start + len(items) < len(entries):
+                response["LastEvaluatedKey"] = last
+            return response
+
+    def scan(self, FilterExpression=None, Limit=None, ExclusiveStartKey=None, ProjectionExpression=None,
+             ExpressionAttributeNames=None, **kwargs):
+        names = ExpressionAttributeNames or {}
+        self._enter("Scan")
+        with self._lock:
+            start = 0
+            if ExclusiveStartKey is not None:
+                start = self._position[ExclusiveStartKey[self.hash_key]] + 1
+
+            # Limit は「評価した件数」に効く (フィルタ前)。本物の DynamoDB と同じ挙動
+            items, scanned, read_bytes, last = [], 0, 0, None
+            for key in self._order[start:]:
+                if Limit is not None and scanned >= Limit:
+                    break
+                if read_bytes >= PAGE_BYTES:
+                    break
+                item = self._items[key]
+                scanned += 1
+                read_bytes += _item_size(item)
+                last = {self.hash_key: key}
+                if FilterExpression is None or _eval_condition(FilterExpression, item):
+                    items.append(_project(item, ProjectionExpression, names))
+
+            units = _read_units(read_bytes)
+            self.consumed_read_units += units
+            response = {"Items": items, "Count": len(items), "ScannedCount": scanned, **self._capacity(units, kwargs)}
+            if last is not None and start + scanned < len(self._order):
+                response["LastEvaluatedKey"] = last
+            return response
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class _LocalBatchWriter:
+    def __init__(self, table: LocalTable):
+        self.table = table
+        self._items = {}
+
+    def put_item(self, Item: dict):
+        # overwrite_by_pkeys と同様、同じキーは後勝ち
+        self._items[Item[self.table.hash_key]] = Item
+        if len(self._items) >= 25:
+            self._flush()
+
+    def _flush(self):
+        if self._items:
+            self.table.batch_write(list(self._items.values()))
+            self._items = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._flush()
+        return False
+
+
+def history_table(**kwargs) -> LocalTable:
+    """tools/create_table.py と同じ形 (ts キー + channel_id-ts-index) のテーブル"""
+    return LocalTable(
+        hash_key="ts",
+        indexes={"channel_id-ts-index": ("channel_id", "ts", ["user_id", "text"])},
+        **kwargs,
+    )
@@ -0,0 +1,147 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+# プロジェクトルートへのパス設定
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../")
+
+from backend.f02_filter.local_model import (
+    LocalIntentModel, LABELS, LOCAL_INTENT_MODEL_PATH, LOCAL_INTENT_THRESHOLD,
+)
+from backend.f05_archive.writer import iter_archive
+
+# 学習に使う intent_tag の出どころ (SlackMessage.intent_source)。
+# ローカルモデル自身・キーワード判定のラベルで学習すると自分の誤りを強化してしまうので、既定は Gemini の判定だけ。
+# "legacy" は intent_source が記録される前のレコード (出どころが分からない)
+DEFAULT_LABEL_SOURCES = ("gemini",)
+
+
+def _source_of(record: dict) -> str:
+    return record.get("intent_source") or "legacy"
+
+
+def load_jsonl(path: str, sources=DEFAULT_LABEL_SOURCES):
+    """
+    {"text" or "text_content": ..., "intent_tag": ..., "intent_source": ...} の行を読み込む
+    (F-05 のアーカイブを指定した場合は、ローテート・圧縮済みのセグメントもまとめて読む)
+    """
+    samples = []
+    for record in iter_archive(path):
+        text = record.get("text") or record.get("text_content")
+        tag = record.get("intent_tag")
+        if text and tag in LABELS and _source_of(record) in sources:
+            samples.append((text, tag))
+    return samples
+
+
+def load_dynamodb(sources=DEFAULT_LABEL_SOURCES):
+    """DynamoDBHandler.save_log が保存した text / intent_tag のうち、出どころが sources のものを全件読む"""
+    import boto3
+
+    region = os.getenv("AWS_DEFAULT_REGION", "ap-northeast-1")
+    table = boto3.resource('dynamodb', region_name=region).Table(os.getenv("DYNAMODB_TABLE", "SlackerFeedback"))
+
+    samples = []
+    kwargs = {
+        "ProjectionExpression": "#t, intent_tag, intent_source",
+        "ExpressionAttributeNames": {"#t": "text"},
+    }
+    while True:
+        response = table.scan(**kwargs)
+        for item in response.get("Items", []):
+            if item.get("text") and item.get("intent_tag") in LABELS and _source_of(item) in sources:
+                samples.append((item["text"], item["intent_tag"]))
+        if "LastEvaluatedKey" not in response:
+            break
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    return samples
+
+
+def evaluate(model: LocalIntentModel, samples, threshold: float) -> dict:
+    latencies = []
+    correct = covered = covered_correct = 0
+    confusion = {gold: {pred: 0 for pred in LABELS} for gold in LABELS}
+
+    for text, gold in samples:
+        started = time.perf_counter()
+        pred, confidence = model.predict(text)
+        latencies.append(time.perf_counter() - started)
+
+        confusion[gold][pred] += 1
+        correct += pred == gold
+        if confidence >= threshold:
+            covered += 1
+            covered_correct += pred == gold
+
+    n = len(samples)
+    latencies.sort()
+    report = {
+        "test_samples": n,
+        "accuracy": correct / n if n else 0.0,
+        "threshold": threshold,
+        # 閾値以上で答えられた割合 (= Gemini を呼ばずに済む割合) と、その範囲での正解率
+        "coverage": covered / n if n else 0.0,
+        "covered_accuracy": covered_correct / covered if covered else 0.0,
+        "confusion": confusion,
+        "latency_us": {
+            "p50": latencies[n // 2] * 1e6 if n else 0.0,
+            "p95": latencies[int(n * 0.95)] * 1e6 if n else 0.0,
+            "max": latencies[-1] * 1e6 if n else 0.0,
+        },
+    }
+    for label in LABELS:
+        tp = confusion[label][label]
+        predicted = sum(confusion[g][label] for g in LABELS)
+        actual = sum(confusion[label].values())
+        report[f"{label}_precision"] = tp / predicted if predicted else 0.0
+        report[f"{label}_recall"] = tp / actual if actual else 0.0
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="[F-02] ローカル意図判定モデルの学習")
+    parser.add_argument("--jsonl", help="学習データ (JSONL)。省略時は DynamoDB から読む")
+    parser.add_argument("--out", default=LOCAL_INTENT_MODEL_PATH, help="モデルの保存先 (.npz)")
+    parser.add_argument("--test-ratio", type=float, default=0.2)
+    parser.add_argument("--threshold", type=float, default=LOCAL_INTENT_THRESHOLD)
+    parser.add_argument("--dim", type=int, default=2 ** 18)
+    parser.add_argument("--epochs", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--label-sources", default=",".join(DEFAULT_LABEL_SOURCES),
+                        help="学習に使うラベルの出どころ (カンマ区切り: gemini,cache,local,keyword,legacy)")
+    args = parser.parse_args()
+
+    sources = tuple(s.strip() for s in args.label_sources.split(",") if s.strip())
+    samples = load_jsonl(args.jsonl, sources) if args.jsonl else load_dynamodb(sources)
+    print(f"🏷️ ラベルの出どころ: {', '.join(sources)}")
+    if len(samples) < 10:
+        print(f"❌ 学習データが少なすぎます ({len(samples)} 件)")
+        sys.exit(1)
+
+    random.Random(args.seed).shuffle(samples)
+    n_test = max(1, int(len(samples) * args.test_ratio))
+    test, train = samples[:n_test], samples[n_test:]
+    print(f"📚 train={len(train)}, test={len(test)}")
+
+    started = time.perf_counter()
+    model = LocalIntentModel(dim=args.dim).fit([t for t, _ in train], [y for _, y in train], epochs=args.epochs)
+    train_seconds = time.perf_counter() - started
+
+    report = evaluate(model, test, args.threshold)
+    report["train_samples"] = len(train)
+    report["train_seconds"] = train_seconds
+
+    model.save(args.out, metadata=report)
+    report_path = os.path.splitext(args.out)[0] + ".report.json"
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    print(f"✅ モデルを保存しました: {args.out} (レポート: {report_path})")
+
+
+if __name__ == "__main__":
+    main()